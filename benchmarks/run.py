@@ -0,0 +1,259 @@
+"""
+Benchmarks AWSActions against a local stand-in for EC2, SSM and IAM, recording wall time,
+API call counts and peak memory for each scenario and comparing them with stored baselines.
+
+Usage:
+    python benchmarks/run.py                       # compare with baselines.json
+    python benchmarks/run.py --latency-ms 50       # inject 50ms latency into every API call
+    python benchmarks/run.py --update-baselines    # record the current results as the baselines
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+from typing import Callable, Dict, Iterator, List, Tuple
+from unittest import mock
+
+from tabulate import tabulate
+
+from holy_cli.cloud.aws.actions import AWSActions
+from holy_cli.cloud.options import CreateServerOptions, ServerDTO
+from holy_cli.config import Config, GlobalConfig
+
+# The fake cloud lives with the tests so that it is not installed with the package
+sys.path.insert(
+    0,
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests"),
+)
+
+from fake_cloud import REGION, FakeCloud, FakeProvider  # noqa: E402
+
+BASELINES_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baselines.json"
+)
+
+Scenario = Callable[[AWSActions, List[str]], None]
+
+
+def get_create_options(name: str) -> CreateServerOptions:
+    return CreateServerOptions.load_from_cli(
+        name=name,
+        os="amazon-linux",
+        architecture="x86_64",
+        type="t2.micro",
+        disk_size=10,
+        ports="22,80",
+        actions="s3:ListAllMyBuckets",
+    )
+
+
+def create_server(actions: AWSActions, names: List[str]) -> None:
+    actions.create_server(get_create_options("bench-new"))
+
+
+def list_servers(actions: AWSActions, names: List[str]) -> None:
+    actions.list_servers()
+
+
+def get_server_info(actions: AWSActions, names: List[str]) -> None:
+    actions.get_server_info(ServerDTO(names[0]))
+
+
+def delete_server(actions: AWSActions, names: List[str]) -> None:
+    actions.delete_server(ServerDTO(names[0]))
+
+
+def teardown(actions: AWSActions, names: List[str]) -> None:
+    actions.teardown()
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "create_server": create_server,
+    "list_servers": list_servers,
+    "get_server_info": get_server_info,
+    "delete_server": delete_server,
+    "teardown": teardown,
+}
+
+
+@contextlib.contextmanager
+def isolated_home() -> Iterator[None]:
+    """Point holy at a temporary home directory so keys and SSH config are thrown away"""
+    with tempfile.TemporaryDirectory() as home:
+        with mock.patch.dict(os.environ, {"HOME": home}):
+            # Spinner output is not part of what is being measured
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+
+
+def load_actions(cloud: FakeCloud) -> AWSActions:
+    config = Config(GlobalConfig(), REGION, None, FakeProvider(cloud))
+
+    return AWSActions(config)
+
+
+def run_scenario(
+    scenario: Scenario, servers: int, latency: float, trace_memory: bool
+) -> Tuple[float, int, int]:
+    cloud = FakeCloud()
+
+    with isolated_home():
+        actions = load_actions(cloud)
+        names = [f"bench-{i}" for i in range(servers)]
+
+        # Existing servers are set up without latency and are not counted
+        for name in names:
+            actions.create_server(get_create_options(name))
+
+        cloud.latency = latency
+        cloud.calls.clear()
+
+        if trace_memory:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        scenario(actions, names)
+        wall_time = time.perf_counter() - start
+        peak_memory = 0
+
+        if trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return wall_time, sum(cloud.calls.values()), peak_memory
+
+
+def run(servers: int, latency: float, repeat: int) -> Dict[str, dict]:
+    results = {}
+
+    for name, scenario in SCENARIOS.items():
+        wall_times = []
+
+        for _ in range(repeat):
+            wall_time, calls, _ = run_scenario(scenario, servers, latency, False)
+            wall_times.append(wall_time)
+
+        # Memory is measured in a separate run as tracemalloc slows everything down
+        _, _, peak_memory = run_scenario(scenario, servers, latency, True)
+
+        results[name] = {
+            "wall_ms": round(statistics.median(wall_times) * 1000, 1),
+            "api_calls": calls,
+            "peak_kb": round(peak_memory / 1024, 1),
+        }
+
+    return results
+
+
+def compare(
+    results: Dict[str, dict], baselines: Dict[str, dict], tolerance: float
+) -> Tuple[List[dict], bool]:
+    rows = []
+    regressed = False
+
+    for name, result in results.items():
+        baseline = baselines.get(name)
+        status = "new"
+
+        if baseline is not None:
+            failures = []
+
+            # Any extra API call is a regression, time and memory are allowed some noise
+            if result["api_calls"] > baseline["api_calls"]:
+                failures.append("calls")
+
+            for key, label in (("wall_ms", "time"), ("peak_kb", "memory")):
+                if result[key] > baseline[key] * (1 + tolerance):
+                    failures.append(label)
+
+            status = f"REGRESSED ({', '.join(failures)})" if failures else "ok"
+            regressed = regressed or len(failures) > 0
+
+        rows.append(
+            {
+                "Scenario": name,
+                "Wall (ms)": result["wall_ms"],
+                "Baseline (ms)": baseline["wall_ms"] if baseline else "-",
+                "API Calls": result["api_calls"],
+                "Baseline Calls": baseline["api_calls"] if baseline else "-",
+                "Peak (KB)": result["peak_kb"],
+                "Baseline (KB)": baseline["peak_kb"] if baseline else "-",
+                "Status": status,
+            }
+        )
+
+    return rows, regressed
+
+
+def main() -> int:
+    # yaspin warns that colours are not supported when stdout is redirected
+    warnings.simplefilter("ignore", UserWarning)
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=20,
+        help="Latency injected into every API call",
+    )
+    parser.add_argument(
+        "--servers",
+        type=int,
+        default=5,
+        help="Number of servers that exist before each scenario runs",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Number of timed runs per scenario"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed increase in wall time and memory over the baseline",
+    )
+    parser.add_argument(
+        "--update-baselines",
+        action="store_true",
+        help="Save the results as the new baselines",
+    )
+    args = parser.parse_args()
+
+    results = run(args.servers, args.latency_ms / 1000, args.repeat)
+    settings = {"latency_ms": args.latency_ms, "servers": args.servers}
+
+    if args.update_baselines:
+        with open(BASELINES_FILE, "w") as f:
+            json.dump({"settings": settings, "scenarios": results}, f, indent=2)
+            f.write("\n")
+
+        print(f"Baselines saved to {BASELINES_FILE}")
+
+    try:
+        with open(BASELINES_FILE, "r") as f:
+            baselines = json.load(f)
+    except OSError:
+        baselines = {"settings": settings, "scenarios": {}}
+
+    if baselines["settings"] != settings:
+        print(
+            f"Baselines were recorded with {baselines['settings']}, run with matching options to compare",
+            file=sys.stderr,
+        )
+        baselines["scenarios"] = {}
+
+    rows, regressed = compare(results, baselines["scenarios"], args.tolerance)
+    print(tabulate(rows, headers="keys"))
+
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Measures how AWSActions scales with the number of existing servers, using fixtures of up to
+10,000 servers (with their security groups and key pairs) generated directly in the fake cloud.
+
+Usage:
+    python benchmarks/scale.py                        # 100, 1,000 and 10,000 servers
+    python benchmarks/scale.py --sizes 1000,5000
+"""
+
+import argparse
+import time
+import warnings
+from typing import Callable, Dict, List
+
+from run import FakeCloud, isolated_home, load_actions
+from tabulate import tabulate
+
+from holy_cli.cloud.aws.actions import AWSActions
+from holy_cli.cloud.options import ServerDTO
+
+SCENARIOS: Dict[str, Callable[[AWSActions, List[str]], None]] = {
+    "list_servers": lambda actions, names: actions.list_servers(),
+    "get_server_info": lambda actions, names: actions.get_server_info(
+        ServerDTO(names[-1])
+    ),
+    "delete_server": lambda actions, names: actions.delete_server(ServerDTO(names[-1])),
+    "teardown": lambda actions, names: actions.teardown(),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="100,1000,10000",
+        help="Comma separated numbers of servers to generate",
+    )
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    # yaspin warns that colours are not supported when stdout is redirected
+    warnings.simplefilter("ignore", UserWarning)
+
+    rows = []
+
+    for name, scenario in SCENARIOS.items():
+        previous = None
+
+        for size in sizes:
+            cloud = FakeCloud()
+            names = [f"bench-{i}" for i in range(size)]
+
+            for server_name in names:
+                cloud.add_server(server_name)
+
+            with isolated_home():
+                actions = load_actions(cloud)
+                start = time.perf_counter()
+                scenario(actions, names)
+                wall_time = time.perf_counter() - start
+
+            # How much slower each step up in size was, relative to how many more servers there are
+            growth = "-"
+
+            if previous is not None:
+                growth = f"{(wall_time / previous[1]) / (size / previous[0]):.2f}x"
+
+            rows.append(
+                {
+                    "Scenario": name,
+                    "Servers": size,
+                    "Wall (ms)": round(wall_time * 1000, 1),
+                    "API Calls": sum(cloud.calls.values()),
+                    "Growth / Server": growth,
+                }
+            )
+            previous = (size, wall_time)
+
+    print(tabulate(rows, headers="keys"))
+
+
+if __name__ == "__main__":
+    main()
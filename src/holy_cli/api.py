@@ -0,0 +1,280 @@
+"""
+Use holy from Python without going through the CLI. A client keeps its AWS sessions between calls,
+returns dataclasses instead of tables and raises HolyError instead of exiting:
+
+    from holy_cli.api import HolyClient
+
+    client = HolyClient(region="eu-west-2")
+    server = client.create_server("my_server", ports="22,8000-8100")
+
+    for server in client.list_servers(state="running"):
+        print(server.name, server.ip)
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from holy_cli.cloud.aws.actions import AWSActions
+from holy_cli.cloud.options import CreateServerOptions, ListServersOptions, ServerDTO
+from holy_cli.cloud.provider import CloudProvider
+from holy_cli.config import Config, GlobalConfig
+from holy_cli.exceptions import AbortError
+from holy_cli.progress import CallbackProgress
+from holy_cli.util import PortRange, parse_port_ranges
+
+__all__ = ["HolyClient", "HolyError", "AWSError", "Server", "ServerInfo"]
+
+
+class HolyError(Exception):
+    """Raised when an action can't be carried out, e.g. a server is not found"""
+
+
+class AWSError(HolyError):
+    """Raised when AWS returns an error, code is the AWS error code if there was one"""
+
+    def __init__(self, message: str, code: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+@dataclass(frozen=True)
+class Server:
+    name: str
+    state: str
+    os: Optional[str]
+    type: str
+    ip: Optional[str]
+    dns: Optional[str]
+
+
+@dataclass(frozen=True)
+class ServerInfo:
+    aws_id: str
+    holy_id: str
+    name: str
+    state: str
+    availability_zone: str
+    os: Optional[str]
+    architecture: str
+    type: str
+    disk_size: Optional[int]
+    disk_type: Optional[str]
+    disk_iops: Optional[int]
+    disk_throughput: Optional[int]  # MiB/s
+    hibernation: bool
+    open_ports: List[str]
+    public_ip: Optional[str]
+    private_ip: Optional[str]
+    dns: Optional[str]
+    ssh_username: Optional[str]
+    ssh_key: Optional[str]
+
+
+class HolyClient:
+    """
+    Carries out holy actions in one AWS region and profile (the AWS defaults when not given).
+    Each step of a long running action is passed to progress if given, e.g. "Created key pair".
+    """
+
+    def __init__(
+        self,
+        region: Optional[str] = None,
+        profile: Optional[str] = None,
+        progress: Optional[Callable[[str], None]] = None,
+        provider: Optional[CloudProvider] = None,
+    ) -> None:
+        with _errors():
+            # Creating ~/.holy can fail, e.g. without permission to the home directory
+            config = Config(GlobalConfig(), region, profile, provider)
+            self.actions = AWSActions(
+                config, lambda text: CallbackProgress(text, progress)
+            )
+
+    def list_servers(
+        self,
+        state: Optional[str] = None,
+        name: Optional[str] = None,
+        os: Optional[str] = None,
+        type: Optional[str] = None,
+        az: Optional[str] = None,
+    ) -> List[Server]:
+        """Filters work as in the CLI, e.g. state="running,stopped" and name="web*\" """
+        return list(self.iter_servers(state, name, os, type, az))
+
+    def iter_servers(
+        self,
+        state: Optional[str] = None,
+        name: Optional[str] = None,
+        os: Optional[str] = None,
+        type: Optional[str] = None,
+        az: Optional[str] = None,
+    ) -> Iterator[Server]:
+        """Yields each server as soon as its page of results arrives"""
+        with _errors():
+            options = ListServersOptions.load_from_cli(
+                state=state, name=name, os=os, type=type, az=az
+            )
+
+            for row in self.actions.iter_servers(options):
+                yield Server(
+                    name=row["Name"],
+                    state=row["State"],
+                    os=_value(row["OS"]),
+                    type=row["Type"],
+                    ip=_value(row["IP"]),
+                    dns=_value(row["DNS"]),
+                )
+
+    def get_server(self, name: str) -> ServerInfo:
+        with _errors():
+            return ServerInfo(**self.actions.get_server_details(ServerDTO(name)))
+
+    def create_server(
+        self,
+        name: str,
+        os: str = "amazon-linux",
+        architecture: str = "x86_64",
+        image_id: Optional[str] = None,
+        type: str = "t2.micro",
+        disk_size: int = 8,
+        ports: str = "22,80,443",
+        actions: Optional[str] = None,
+        script: Optional[str] = None,
+        iam_profile: Optional[str] = None,
+        subnet_id: Optional[str] = None,
+        hibernation: bool = False,
+        shared_sg: bool = False,
+        disk_type: str = "gp3",
+        iops: Optional[int] = None,
+        throughput: Optional[int] = None,
+    ) -> ServerInfo:
+        """Takes the same options as holy server create, returns once the server is running"""
+        with _errors():
+            options = CreateServerOptions.load_from_cli(
+                name=name,
+                os=os,
+                architecture=architecture,
+                image_id=image_id,
+                type=type,
+                disk_size=disk_size,
+                ports=ports,
+                actions=actions,
+                script=script,
+                iam_profile=iam_profile,
+                subnet_id=subnet_id,
+                hibernation=hibernation,
+                shared_sg=shared_sg,
+                disk_type=disk_type,
+                iops=iops,
+                throughput=throughput,
+            )
+            self.actions.create_server(options)
+
+        return self.get_server(name)
+
+    def resume_create(self, name: str) -> ServerInfo:
+        """Continue a create that was interrupted, with the options it was started with"""
+        with _errors():
+            self.actions.resume_server(ServerDTO(name))
+
+        return self.get_server(name)
+
+    def rollback_create(self, name: str) -> None:
+        """Remove everything created by a create that was interrupted"""
+        with _errors():
+            self.actions.rollback_server(ServerDTO(name))
+
+    def start_server(self, name: str) -> None:
+        with _errors():
+            self.actions.start_server(ServerDTO(name))
+
+    def stop_server(self, name: str, hibernate: bool = False) -> None:
+        with _errors():
+            self.actions.stop_server(ServerDTO(name), hibernate)
+
+    def delete_server(self, name: str) -> None:
+        with _errors():
+            self.actions.delete_server(ServerDTO(name))
+
+    def modify_disk(
+        self,
+        name: str,
+        size: Optional[int] = None,
+        disk_type: Optional[str] = None,
+        iops: Optional[int] = None,
+        throughput: Optional[int] = None,
+    ) -> ServerInfo:
+        """Changes the root disk while the server keeps running, returns once the new settings can be used"""
+        with _errors():
+            self.actions.modify_disk(ServerDTO(name), size, disk_type, iops, throughput)
+
+        return self.get_server(name)
+
+    def change_ports(
+        self,
+        name: str,
+        open: str = "",
+        close: str = "",
+        protocol: str = "tcp",
+        ip: Optional[str] = None,
+    ) -> Tuple[List[PortRange], List[PortRange]]:
+        """Open and close ports or ranges (e.g. open="80,8000-8100"), returns the ranges actually opened and closed"""
+        with _errors():
+            return self.actions.change_ports(
+                ServerDTO(name),
+                parse_port_ranges(open),
+                parse_port_ranges(close),
+                protocol,
+                ip,
+            )
+
+    def run_command(
+        self,
+        names: Sequence[str],
+        command: str,
+        username: Optional[str] = None,
+        parallel: int = 10,
+        output: Optional[Callable[[str, str], None]] = None,
+    ) -> Dict[str, int]:
+        """Runs a command over SSH on running servers matching the names (glob patterns allowed), returns each exit code"""
+        with _errors():
+            results = self.actions.run_command_on_servers(
+                names, command, username, parallel, output or (lambda name, line: None)
+            )
+
+        return {result["Name"]: result["Exit Code"] for result in results}
+
+    def get_allowed_ips(self) -> List[str]:
+        with _errors():
+            return self.actions.get_allowed_ips()
+
+    def change_allowed_ips(
+        self, add: Sequence[str] = (), remove: Sequence[str] = ()
+    ) -> List[str]:
+        with _errors():
+            return self.actions.change_allowed_ips(list(add), list(remove))
+
+
+class _errors:
+    """Turns the CLI and AWS exceptions raised by actions into HolyError"""
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if isinstance(exc, AbortError):
+            raise HolyError(exc.message) from exc
+
+        if isinstance(exc, ClientError):
+            error = exc.response.get("Error", {})
+            raise AWSError(error.get("Message") or str(exc), error.get("Code")) from exc
+
+        if isinstance(exc, BotoCoreError):
+            raise AWSError(str(exc)) from exc
+
+
+def _value(value: Optional[str]) -> Optional[str]:
+    # Tables show a dash for missing values
+    return None if value in (None, "-") else value
@@ -1,10 +1,14 @@
 import click
 from botocore.exceptions import BotoCoreError, ClientError
+from tabulate import tabulate
 
 from holy_cli import __version__
 from holy_cli.log import getLogger
+from holy_cli.throttle import configure_rate_limiter, get_rate_limiter, parse_rates
+from holy_cli.trace import enable_api_tracing, enable_span_tracing
 
-from .global_commands import teardown, update
+from .completion import completion
+from .global_commands import allowlist, teardown, update
 from .server_commands import server
 
 
@@ -26,10 +30,73 @@ def entry_point():
 
 @click.group()
 @click.version_option(__version__, prog_name="holy-cli")
-def cli() -> None:
-    pass
+@click.option(
+    "--trace-api",
+    help="Print a summary of AWS API calls on exit",
+    envvar="HOLY_TRACE_API",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--trace-api-file",
+    help="Append every AWS API call as a JSON line to this file",
+    envvar="HOLY_TRACE_API_FILE",
+    type=click.Path(dir_okay=False, writable=True),
+)
+@click.option(
+    "--trace-file",
+    help="Write timings of each step and AWS API call to this file in Chrome trace format (view in chrome://tracing or Perfetto)",
+    envvar="HOLY_TRACE_FILE",
+    type=click.Path(dir_okay=False, writable=True),
+)
+@click.option(
+    "--api-rate",
+    help="Maximum AWS API calls per second for each service (comma seperated list e.g. ec2=50,iam=5)",
+    envvar="HOLY_API_RATE",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    trace_api: bool,
+    trace_api_file: str,
+    trace_file: str,
+    api_rate: str,
+) -> None:
+    if api_rate:
+        configure_rate_limiter(parse_rates(api_rate))
+
+    if trace_api or trace_api_file or trace_file:
+        # API calls are also needed for the trace file, where they appear nested inside each step
+        api_tracer = enable_api_tracing(trace_api_file)
+        span_tracer = enable_span_tracing() if trace_file else None
+
+        def finish_tracing() -> None:
+            api_tracer.close()
+
+            if span_tracer is not None:
+                span_tracer.write(trace_file)
+
+            if trace_api:
+                summary = api_tracer.summary() or [{"Operation": "No API calls"}]
+                click.echo(
+                    tabulate(summary, headers="keys", tablefmt="simple_grid"),
+                    err=True,
+                )
+
+                limits = get_rate_limiter().summary()
+
+                if len(limits) > 0:
+                    click.echo(
+                        tabulate(limits, headers="keys", tablefmt="simple_grid"),
+                        err=True,
+                    )
+
+        ctx.call_on_close(finish_tracing)
 
 
 cli.add_command(server)
 cli.add_command(teardown)
 cli.add_command(update)
+cli.add_command(completion)
+cli.add_command(allowlist)
@@ -0,0 +1,87 @@
+from typing import List
+
+import click
+from click.shell_completion import CompletionItem, get_completion_class
+
+from holy_cli.cloud.aws import AWS_OS_USER_MAPPING
+from holy_cli.config import GlobalConfig
+from holy_cli.util import InstanceTypeCache, NameCache
+
+
+# Completion reads only from the local cache so a TAB press never waits on AWS
+def complete_server_name(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> List[CompletionItem]:
+    name_cache = NameCache(GlobalConfig().names_cache_file)
+    profile = ctx.params.get("profile")
+    region = ctx.params.get("region")
+
+    # The name usually comes before --region/--profile, so fall back to every cached name
+    names = name_cache.get_names(profile, region) if profile or region else []
+
+    if len(names) == 0:
+        names = name_cache.get_all_names()
+
+    return [CompletionItem(name) for name in names if name.startswith(incomplete)]
+
+
+def complete_region(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> List[CompletionItem]:
+    name_cache = NameCache(GlobalConfig().names_cache_file)
+    regions = name_cache.get_regions()
+
+    if len(regions) == 0:
+        # Read from the endpoint data bundled with botocore, no network call is made
+        from botocore.session import get_session
+
+        regions = get_session().get_available_regions("ec2")
+        name_cache.set_regions(regions)
+
+    return [
+        CompletionItem(region) for region in regions if region.startswith(incomplete)
+    ]
+
+
+def complete_os(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> List[CompletionItem]:
+    return [
+        CompletionItem(os) for os in AWS_OS_USER_MAPPING if os.startswith(incomplete)
+    ]
+
+
+def complete_instance_type(
+    ctx: click.Context, param: click.Parameter, incomplete: str
+) -> List[CompletionItem]:
+    # Types from the catalog cached by create, nothing is offered before the first create
+    types = InstanceTypeCache(
+        GlobalConfig().instance_types_cache_file
+    ).get_all_type_names()
+
+    return [CompletionItem(type) for type in types if type.startswith(incomplete)]
+
+
+@click.command()
+@click.argument("shell", type=click.Choice(["bash", "zsh", "fish"]))
+@click.pass_context
+def completion(ctx: click.Context, shell: str) -> None:
+    """
+    Print the shell completion script. Examples:
+
+    # Bash, add to ~/.bashrc:
+
+    eval "$(holy completion bash)"
+
+    # Zsh, add to ~/.zshrc:
+
+    eval "$(holy completion zsh)"
+
+    # Fish:
+
+    holy completion fish > ~/.config/fish/completions/holy.fish
+    """
+    completion_class = get_completion_class(shell)
+    complete = completion_class(ctx.find_root().command, {}, "holy", "_HOLY_COMPLETE")  # type: ignore
+
+    click.echo(complete.source())
@@ -4,9 +4,11 @@ from holy_cli.cloud.aws.actions import AWSActions
 from holy_cli.log import setLoggerToStream
 from holy_cli.util import version_up_to_date
 
+from .completion import complete_region
+
 
 @click.command()
-@click.option("--region", help="AWS region to use")
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def teardown(**kwargs) -> None:
@@ -24,6 +26,52 @@ def teardown(**kwargs) -> None:
     click.echo("All holy infrastructure removed")
 
 
+@click.command()
+@click.option(
+    "--add",
+    help="IP address or CIDR range to allow, can be given multiple times",
+    multiple=True,
+)
+@click.option(
+    "--remove",
+    help="IP address or CIDR range to remove, can be given multiple times",
+    multiple=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def allowlist(**kwargs) -> None:
+    """
+    Show or change the IPs allowed into servers using a shared security group. Examples:
+
+    # Show the allowed IPs:
+
+    holy allowlist
+
+    # Only allow a single IP address into every shared server:
+
+    holy allowlist --add=1.2.3.4 --remove=0.0.0.0/0
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+
+    if kwargs.get("add") or kwargs.get("remove"):
+        allowed_ips = actions.change_allowed_ips(
+            list(kwargs.get("add") or []), list(kwargs.get("remove") or [])
+        )
+    else:
+        allowed_ips = actions.get_allowed_ips()
+
+    if len(allowed_ips) == 0:
+        click.echo(
+            "No allowed IPs, the allowlist is created with the first shared server"
+        )
+    else:
+        click.echo("\n".join(allowed_ips))
+
+
 @click.command()
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def update(**kwargs) -> None:
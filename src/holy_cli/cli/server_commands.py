@@ -1,11 +1,49 @@
+import csv
+import json
+import shlex
+import threading
+from typing import List, Optional
+
 import click
 from tabulate import tabulate
 
-from holy_cli.cloud.aws import AWS_ARCHITECTURE_VALUES, AWS_OS_USER_MAPPING
+from holy_cli.cloud.aws import (
+    AWS_ARCHITECTURE_VALUES,
+    AWS_OS_USER_MAPPING,
+    AWS_VOLUME_TYPES,
+)
 from holy_cli.cloud.aws.actions import AWSActions
-from holy_cli.cloud.options import CreateServerOptions, ServerDTO
+from holy_cli.cloud.options import (
+    CreateServerOptions,
+    ListServersOptions,
+    ServerDTO,
+)
+from holy_cli.config import GlobalConfig
 from holy_cli.exceptions import AbortError
 from holy_cli.log import setLoggerToStream
+from holy_cli.tunnel import TunnelManager, parse_forward
+from holy_cli.util import (
+    format_port_range,
+    parse_duration,
+    parse_port_ranges,
+    sparkline,
+)
+
+from .completion import (
+    complete_instance_type,
+    complete_os,
+    complete_region,
+    complete_server_name,
+)
+from .watch import LiveTable, watch_footer
+
+LIST_FIELDS = ("Name", "State", "OS", "Type", "IP", "DNS")
+
+# Longest wait between refreshes of list --watch when nothing is changing
+WATCH_MAX_INTERVAL = 30
+
+# Values per CPU sparkline in server stats
+STATS_POINTS = 30
 
 
 @click.group()
@@ -23,23 +61,137 @@ def server() -> None:
     is_flag=True,
     show_default=True,
 )
-@click.option("--region", help="AWS region to use")
+@click.option(
+    "--state",
+    help="Only show servers in these states, comma seperated (e.g. running,stopped)",
+)
+@click.option(
+    "--name", help="Only show servers with a matching name, * wildcards allowed"
+)
+@click.option(
+    "--os",
+    help="Only show servers using this operating system",
+    type=click.Choice(list(AWS_OS_USER_MAPPING.keys())),
+)
+@click.option(
+    "--type",
+    help="Only show this instance type, * wildcards allowed",
+    shell_complete=complete_instance_type,
+)
+@click.option("--az", help="Only show servers in this availability zone")
+@click.option(
+    "-o",
+    "--output",
+    help="Output format, jsonl and csv print each server as soon as it is found",
+    type=click.Choice(["table", "jsonl", "csv"]),
+    default="table",
+    show_default=True,
+)
+@click.option(
+    "--fields",
+    help=f"Comma seperated list of columns to show ({', '.join(LIST_FIELDS)})",
+)
+@click.option(
+    "-w",
+    "--watch",
+    help="Keep the table on screen and update it as servers change",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--interval",
+    help="Seconds between refreshes when watching, slows down when nothing is changing",
+    type=click.FloatRange(min=1),
+    default=2,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def list_cmd(**kwargs) -> None:
-    """List all servers"""
+    """
+    List all servers. Examples:
+
+    # Print a table of all servers:
+
+    holy server list
+
+    # Print the name and IP of each server as CSV:
+
+    holy server list --output=csv --fields=name,ip
+
+    # Print running servers as JSON lines, one per server as soon as it is found:
+
+    holy server list --running --output=jsonl
+
+    # Only show stopped ubuntu servers with a name starting with web:
+
+    holy server list --state=stopped --os=ubuntu:22 --name="web*"
+
+    # Keep watching, changed rows are highlighted:
+
+    holy server list --watch
+    """
     if kwargs.get("verbose"):
         setLoggerToStream()
 
+    fields = _parse_list_fields(kwargs.get("fields"))
+    options = ListServersOptions.load_from_cli(**kwargs)
     actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
-    servers = actions.list_servers(kwargs["running"])
 
-    click.echo(tabulate(servers, headers="keys", tablefmt="simple_grid"))
+    if kwargs["watch"]:
+        if kwargs["output"] != "table":
+            raise AbortError("The --watch option can only be used with table output")
+
+        table = LiveTable()
+
+        def render(servers: List[dict], wait: float) -> None:
+            if "State" in servers[0]:
+                servers = [{field: row[field] for field in fields} for row in servers]
+
+            table.draw(servers, watch_footer(wait))
+
+        try:
+            actions.watch_servers(
+                options,
+                kwargs["interval"],
+                max(WATCH_MAX_INTERVAL, kwargs["interval"]),
+                render,
+            )
+        except KeyboardInterrupt:
+            pass
+
+        return
+
+    if kwargs["output"] == "table":
+        servers = actions.list_servers(options)
+
+        if "State" in servers[0]:
+            servers = [{field: row[field] for field in fields} for row in servers]
+
+        click.echo(tabulate(servers, headers="keys", tablefmt="simple_grid"))
+        return
+
+    # Rows are written as each page of servers arrives so consumers can start straight away
+    stdout = click.get_text_stream("stdout")
+    writer = csv.writer(stdout, lineterminator="\n")
+
+    if kwargs["output"] == "csv":
+        writer.writerow(fields)
+
+    for row in actions.iter_servers(options):
+        if kwargs["output"] == "csv":
+            writer.writerow([row[field] for field in fields])
+        else:
+            stdout.write(json.dumps({field: row[field] for field in fields}) + "\n")
+
+        stdout.flush()
 
 
 @server.command()
-@click.argument("name")
-@click.option("--region", help="AWS region to use")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def info(**kwargs) -> None:
@@ -56,17 +208,17 @@ def info(**kwargs) -> None:
 
 
 @server.command(short_help="SSH into a server")
-@click.argument("name")
+@click.argument("name", shell_complete=complete_server_name)
 @click.option("-u", "--username", help="Username to SSH in with")
 @click.option(
     "-s",
     "--save",
-    help="Save details to SSH config file (~/.ssh/config)",
+    help="Save details to SSH config file (~/.holy/ssh_config, included from ~/.ssh/config)",
     default=False,
     is_flag=True,
     show_default=True,
 )
-@click.option("--region", help="AWS region to use")
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def ssh(**kwargs) -> None:
@@ -93,12 +245,358 @@ def ssh(**kwargs) -> None:
     actions.ssh_into_server(server, kwargs.get("username"), kwargs["save"])
 
     if kwargs["save"]:
-        click.echo("SSH details written to ~/.ssh/config")
+        click.echo(
+            "SSH details written to ~/.holy/ssh_config (included from ~/.ssh/config)"
+        )
+
+
+@server.command(name="exec", short_help="Run a command on several servers")
+@click.argument("args", nargs=-1, required=True)
+@click.option(
+    "-a",
+    "--all",
+    help="Run on all running servers",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option("-u", "--username", help="Username to SSH in with")
+@click.option(
+    "-p",
+    "--parallel",
+    help="Maximum number of servers to run on at once",
+    type=click.IntRange(min=1),
+    default=10,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def exec_cmd(**kwargs) -> None:
+    """
+    Run a command on several servers at once. Examples:
+
+    # Run on servers by name (comma seperated list, glob patterns allowed):
+
+    holy server exec "web_*,db" -- sudo systemctl restart app
+
+    # Run on all running servers:
+
+    holy server exec --all -- uptime
+
+    # Arguments are quoted as given, use a shell for pipes, && etc:
+
+    holy server exec --all -- sh -c "cd app && git pull"
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    args = list(kwargs["args"])
+
+    if kwargs["all"]:
+        patterns = ["*"]
+    else:
+        patterns = [pattern.strip() for pattern in args.pop(0).split(",")]
+
+    if len(args) == 0:
+        raise AbortError("Missing command to run")
+
+    lock = threading.Lock()
+
+    def output(name: str, line: str) -> None:
+        with lock:
+            click.echo(f"{click.style(f'[{name}]', fg='cyan')} {line}")
+
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+    results = actions.run_command_on_servers(
+        patterns, shlex.join(args), kwargs.get("username"), kwargs["parallel"], output
+    )
+
+    click.echo(tabulate(results, headers="keys", tablefmt="simple_grid"))
+    failed = [result for result in results if result["Exit Code"] != 0]
+
+    if len(failed) > 0:
+        raise AbortError(f"Command failed on {len(failed)} of {len(results)} servers")
+
+
+@server.command(short_help="Sync a local directory to a server")
+@click.argument("name", shell_complete=complete_server_name)
+@click.argument("local", type=click.Path(exists=True, file_okay=False))
+@click.argument("remote")
+@click.option("-u", "--username", help="Username to SSH in with")
+@click.option(
+    "-e",
+    "--exclude",
+    help="File or directory pattern to exclude (can be used multiple times)",
+    multiple=True,
+)
+@click.option(
+    "--full",
+    help="Send every file, ignoring what was previously synced",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "-w",
+    "--watch",
+    help="Keep running and push changes as they happen",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--interval",
+    help="Seconds between checks for changes when watching",
+    type=click.FloatRange(min=0.1),
+    default=1,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def sync(**kwargs) -> None:
+    """
+    Sync a local directory to a server, only sending files that have changed. Examples:
+
+    # Sync the current directory to ~/app on the server:
+
+    holy server sync my_server . ~/app
+
+    # Keep pushing changes as they happen, ignoring the .git directory:
+
+    holy server sync my_server . ~/app --watch --exclude=.git
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    server = ServerDTO(kwargs["name"])
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+
+    try:
+        actions.sync_to_server(
+            server,
+            kwargs["local"],
+            kwargs["remote"],
+            kwargs.get("username"),
+            kwargs["exclude"],
+            kwargs["full"],
+            kwargs["watch"],
+            kwargs["interval"],
+            click.echo,
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+@server.command(short_help="Show a server's console output")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option(
+    "-f",
+    "--follow",
+    help="Keep printing new output as it arrives",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--interval",
+    help="Seconds between checks for new output when following",
+    type=click.FloatRange(min=1),
+    default=5,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def logs(**kwargs) -> None:
+    """
+    Show a server's console output, including the boot log and output of the --script run on create. Examples:
+
+    # Show the latest output:
+
+    holy server logs my_server
+
+    # Keep printing new output as it arrives:
+
+    holy server logs my_server --follow
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    server = ServerDTO(kwargs["name"])
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+
+    try:
+        actions.stream_console_output(
+            server,
+            kwargs["follow"],
+            kwargs["interval"],
+            lambda text: click.echo(text, nl=False),
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+@server.command(short_help="Show CPU, network and disk use of servers")
+@click.argument("names", required=False, shell_complete=complete_server_name)
+@click.option(
+    "-a",
+    "--all",
+    help="Show all servers",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "-w",
+    "--window",
+    help="How far back to look, in minutes, hours or days (e.g. 30m, 6h, 2d)",
+    default="1h",
+    show_default=True,
+)
+@click.option(
+    "-s",
+    "--sparkline",
+    "show_sparkline",
+    help="Show a line of CPU use over the window for each server",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def stats(**kwargs) -> None:
+    """
+    Show CPU, network and disk use of servers, fetched from CloudWatch in one batch. Examples:
+
+    # Show a server over the last hour:
+
+    holy server stats my_server
+
+    # Show servers by name (comma seperated list, glob patterns allowed) over the last day, with CPU history:
+
+    holy server stats "web_*,db" --window=1d --sparkline
+
+    # Find idle servers:
+
+    holy server stats --all --window=7d
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    if kwargs["all"]:
+        patterns = ["*"]
+    elif kwargs.get("names"):
+        patterns = [pattern.strip() for pattern in kwargs["names"].split(",")]
+    else:
+        raise AbortError("Missing server names, or --all to show all servers")
+
+    window = parse_duration(kwargs["window"])
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+    results = actions.get_server_stats(patterns, window, STATS_POINTS)
+
+    for result in results:
+        history = result.pop("CPU History")
+
+        if kwargs["show_sparkline"]:
+            result["CPU"] = sparkline(history, 100)
+
+    click.echo(tabulate(results, headers="keys", tablefmt="simple_grid"))
+
+
+@server.command(short_help="Manage background port-forward tunnels")
+@click.argument("name", required=False, shell_complete=complete_server_name)
+@click.argument("forwards", nargs=-1)
+@click.option(
+    "-l",
+    "--list",
+    "list_tunnels",
+    help="List all tunnels",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "-c",
+    "--close",
+    help="Close all tunnels to the server",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option("-u", "--username", help="Username to SSH in with")
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def tunnel(**kwargs) -> None:
+    """
+    Manage background port-forward tunnels, which reconnect automatically when dropped. Examples:
+
+    # Forward local port 5432 to port 5432 on the server:
+
+    holy server tunnel my_server 5432:localhost:5432
+
+    # Forward local port 8080 to port 80 on the server:
+
+    holy server tunnel my_server 8080:localhost:80
+
+    # List all tunnels:
+
+    holy server tunnel --list
+
+    # Close all tunnels to a server:
+
+    holy server tunnel my_server --close
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    tunnels = TunnelManager(GlobalConfig())
+
+    if kwargs["list_tunnels"]:
+        results = [
+            {
+                "Name": state["name"],
+                "Tunnels": ", ".join(state["forwards"]),
+                "Status": "running" if state["running"] else "stopped",
+                "PID": state.get("pid") or "-",
+            }
+            for state in tunnels.list()
+        ]
+
+        if len(results) == 0:
+            results.append({"Name": "No existing tunnels"})
+
+        click.echo(tabulate(results, headers="keys", tablefmt="simple_grid"))
+        return
+
+    if kwargs.get("name") is None:
+        raise AbortError("Missing server name")
+
+    server = ServerDTO(kwargs["name"])
+
+    if kwargs["close"]:
+        if not tunnels.close(server.id):
+            raise AbortError("No tunnels found for server")
+
+        click.echo(f"Tunnels to {server.name} closed")
+        return
+
+    if len(kwargs["forwards"]) == 0:
+        raise AbortError("Missing tunnel, e.g. 5432:localhost:5432")
+
+    forwards = [parse_forward(forward) for forward in kwargs["forwards"]]
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+    state = actions.open_tunnel(server, forwards, kwargs.get("username"))
+
+    click.echo(f"Tunnels to {server.name} running: {', '.join(state['forwards'])}")
 
 
 @server.command()
-@click.argument("name")
-@click.option("--region", help="AWS region to use")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def start(**kwargs) -> None:
@@ -112,8 +610,15 @@ def start(**kwargs) -> None:
 
 
 @server.command()
-@click.argument("name")
-@click.option("--region", help="AWS region to use")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option(
+    "--hibernate",
+    help="Hibernate the server so running processes resume on start (server must be created with --hibernation)",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def stop(**kwargs) -> None:
@@ -123,12 +628,12 @@ def stop(**kwargs) -> None:
 
     server = ServerDTO(kwargs["name"])
     actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
-    actions.stop_server(server)
+    actions.stop_server(server, kwargs["hibernate"])
 
 
 @server.command()
-@click.argument("name")
-@click.option("--region", help="AWS region to use")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def delete(**kwargs) -> None:
@@ -142,47 +647,159 @@ def delete(**kwargs) -> None:
 
 
 @server.command(short_help="Manage server ports")
-@click.argument("name")
-@click.option("--action", help="The action to take (open or close)", required=True)
-@click.option("--port", help="The port number", required=True, type=int)
+@click.argument("name", shell_complete=complete_server_name)
+@click.option(
+    "--open",
+    "open_ports",
+    help="Ports to open (comma seperated list, ranges allowed e.g. 80,443,8000-8100)",
+)
+@click.option(
+    "--close",
+    "close_ports",
+    help="Ports to close (comma seperated list, ranges allowed e.g. 3000-3010)",
+)
+@click.option(
+    "--protocol",
+    help="The protocol of the ports",
+    type=click.Choice(["tcp", "udp"]),
+    default="tcp",
+    show_default=True,
+)
 @click.option("--ip", help="IP address to restrict port access to")
-@click.option("--region", help="AWS region to use")
+@click.option("--action", help="The action to take (open or close), use with --port")
+@click.option("--port", help="The port number, use with --action", type=int)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def port(**kwargs) -> None:
     """
     Manage inbound server ports. Examples:
 
-    # Open port 80 to the world:
+    # Open ports 80, 443 and 8000 to 8100 to the world:
 
-    holy server port my_server --action=open --port=80
+    holy server port my_server --open=80,443,8000-8100
 
-    # Close port 80 to the world:
+    # Close port 3000 to the world:
 
-    holy server port my_server --action=close --port=80
+    holy server port my_server --close=3000
 
     # Open port 80 to a specific IP address:
 
-    holy server port my_server --action=open --port=80 --ip=1.2.3.4
+    holy server port my_server --open=80 --ip=1.2.3.4
+
+    # Open a UDP port and close another in one go:
+
+    holy server port my_server --open=51820 --close=51821 --protocol=udp
     """
     if kwargs.get("verbose"):
         setLoggerToStream()
 
-    valid_actions = ("open", "close")
+    open_ranges = parse_port_ranges(kwargs.get("open_ports"))
+    close_ranges = parse_port_ranges(kwargs.get("close_ports"))
+
+    # Still support the single port options
+    if kwargs.get("action") or kwargs.get("port") is not None:
+        valid_actions = ("open", "close")
+
+        if kwargs.get("action") not in valid_actions or kwargs.get("port") is None:
+            raise AbortError(
+                "The --action option must be one of: "
+                + ", ".join(valid_actions)
+                + " and be used with --port"
+            )
 
-    if kwargs["action"] not in valid_actions:
+        port_range = (kwargs["port"], kwargs["port"])
+        (open_ranges if kwargs["action"] == "open" else close_ranges).append(port_range)
+
+    if len(open_ranges) == 0 and len(close_ranges) == 0:
+        raise AbortError("Missing ports, use --open and/or --close")
+
+    for start, end in open_ranges:
+        if any(
+            start <= close_end and close_start <= end
+            for close_start, close_end in close_ranges
+        ):
+            raise AbortError(
+                f"Port {format_port_range((start, end))} cannot be both opened and closed"
+            )
+
+    server = ServerDTO(kwargs["name"])
+    actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
+    opened, closed = actions.change_ports(
+        server, open_ranges, close_ranges, kwargs["protocol"], kwargs.get("ip")
+    )
+    source = kwargs.get("ip") or "the world"
+
+    if len(opened) > 0:
+        click.echo(
+            f"Opened {', '.join(map(format_port_range, opened))} ({kwargs['protocol']}) to {source}"
+        )
+
+    if len(closed) > 0:
+        click.echo(
+            f"Closed {', '.join(map(format_port_range, closed))} ({kwargs['protocol']}) to {source}"
+        )
+
+    if len(opened) == 0 and len(closed) == 0:
+        click.echo("Ports are already up to date")
+
+
+@server.command(short_help="Change a server's disk")
+@click.argument("name", shell_complete=complete_server_name)
+@click.option("--size", help="New disk size in GB (can only increase)", type=int)
+@click.option("--type", help="New disk type", type=click.Choice(list(AWS_VOLUME_TYPES)))
+@click.option("--iops", help="Provisioned IOPS", type=click.IntRange(min=100))
+@click.option(
+    "--throughput", help="Provisioned throughput in MiB/s (gp3 only)", type=int
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
+@click.option("--profile", help="AWS profile to use")
+@click.option("-v", "--verbose", help="Show verbose output", count=True)
+def disk(**kwargs) -> None:
+    """
+    Change a server's disk while it keeps running. Examples:
+
+    # Grow the disk to 50GB:
+
+    holy server disk my_server --size=50
+
+    # Move to gp3 with more IOPS and throughput:
+
+    holy server disk my_server --type=gp3 --iops=6000 --throughput=500
+
+    EC2 allows one change per disk every 6 hours.
+    """
+    if kwargs.get("verbose"):
+        setLoggerToStream()
+
+    if all(
+        kwargs.get(option) is None for option in ("size", "type", "iops", "throughput")
+    ):
         raise AbortError(
-            "Invalid action value, must be one of: " + ", ".join(valid_actions)
+            "Nothing to change, use --size, --type, --iops or --throughput"
         )
 
     server = ServerDTO(kwargs["name"])
     actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
-    actions.change_port(server, kwargs["port"], kwargs["action"], kwargs.get("ip"))
-
-    click.echo(
-        f"Port {kwargs['port']} has been {'opened' if kwargs['action'] == 'open' else 'closed'} to {kwargs.get('ip') or 'the world'}"
+    state = actions.modify_disk(
+        server,
+        kwargs.get("size"),
+        kwargs.get("type"),
+        kwargs.get("iops"),
+        kwargs.get("throughput"),
     )
 
+    if state == "optimizing":
+        click.echo(
+            "The disk can be used with its new settings while EC2 finishes optimizing it in the background"
+        )
+
+    if kwargs.get("size"):
+        click.echo(
+            "To use the extra space, grow the partition and file system on the server (find the device with lsblk), e.g.\n\n"
+            + "sudo growpart /dev/nvme0n1 1 && sudo xfs_growfs -d /"
+        )
+
 
 @server.command(short_help="Create a new server")
 @click.argument("name", required=False)
@@ -191,6 +808,7 @@ def port(**kwargs) -> None:
     help="Operating system: " + ", ".join(AWS_OS_USER_MAPPING.keys()),
     default="amazon-linux",
     show_default=True,
+    shell_complete=complete_os,
 )
 @click.option(
     "--architecture",
@@ -205,6 +823,7 @@ def port(**kwargs) -> None:
 @click.option(
     "--type",
     help="Instance type to use",
+    shell_complete=complete_instance_type,
     default="t2.micro",
     show_default=True,
     required=True,
@@ -217,9 +836,26 @@ def port(**kwargs) -> None:
     show_default=True,
     required=True,
 )
+@click.option(
+    "--disk-type",
+    help="Disk type",
+    type=click.Choice(list(AWS_VOLUME_TYPES)),
+    default="gp3",
+    show_default=True,
+)
+@click.option(
+    "--iops",
+    help="Provisioned disk IOPS (gp3 3000-16000, required for io2)",
+    type=click.IntRange(min=100),
+)
+@click.option(
+    "--throughput",
+    help="Provisioned disk throughput in MiB/s (gp3 only, 125-1000)",
+    type=int,
+)
 @click.option(
     "--ports",
-    help="Port numbers to open (comma seperated list)",
+    help="Port numbers to open (comma seperated list, ranges allowed e.g. 8000-8100)",
     default="22,80,443",
     show_default=True,
 )
@@ -240,7 +876,42 @@ def port(**kwargs) -> None:
     "--subnet-id",
     help="A specific subnet ID to launch in",
 )
-@click.option("--region", help="AWS region to use")
+@click.option(
+    "--hibernation",
+    help="Enable hibernation support (adds an encrypted root volume large enough to hold RAM)",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--shared-sg",
+    help="Use a security group shared by all servers with the same ports, with allowed IPs set by: holy allowlist",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--follow-boot",
+    help="Stream the boot log once the server is running, until cloud-init has finished",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--resume",
+    help="Continue a create that was interrupted, using the options it was started with",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option(
+    "--rollback",
+    help="Remove everything created by a create that was interrupted",
+    default=False,
+    is_flag=True,
+    show_default=True,
+)
+@click.option("--region", help="AWS region to use", shell_complete=complete_region)
 @click.option("--profile", help="AWS profile to use")
 @click.option("-v", "--verbose", help="Show verbose output", count=True)
 def create(**kwargs) -> None:
@@ -270,15 +941,71 @@ def create(**kwargs) -> None:
     # Create and run a script once launched:
 
     holy server create my_server --script=/path/to/install_software.sh
+
+    # Create with hibernation support so it can be stopped with: holy server stop my_server --hibernate
+
+    holy server create my_server --hibernation
+
+    # Create with a faster disk, for I/O bound work such as builds:
+
+    holy server create my_server --disk-size=100 --iops=10000 --throughput=700
+
+    # Create using the security group shared by other servers with the same ports:
+
+    holy server create my_server --shared-sg
+
+    # Create, run a script and watch its output until the server has finished booting:
+
+    holy server create my_server --script=/path/to/install_software.sh --follow-boot
+
+    # Continue a create that was interrupted (e.g. by Ctrl-C or a network error):
+
+    holy server create my_server --resume
+
+    # Or remove what it had created so far:
+
+    holy server create my_server --rollback
     """
     if kwargs.get("verbose"):
         setLoggerToStream()
 
+    if kwargs.get("resume") or kwargs.get("rollback"):
+        if not kwargs.get("name"):
+            raise AbortError("The server name is required with --resume or --rollback")
+
+        if kwargs.get("resume") and kwargs.get("rollback"):
+            raise AbortError("Use either --resume or --rollback, not both")
+
     options = CreateServerOptions.load_from_cli(**kwargs)
     actions = AWSActions.load_from_cli(kwargs.get("region"), kwargs.get("profile"))
-    instance = actions.create_server(options)
+
+    if kwargs.get("rollback"):
+        actions.rollback_server(options)
+        click.echo(f"Server {options.name} rolled back")
+        return
+
+    if kwargs.get("resume"):
+        instance = actions.resume_server(options)
+    else:
+        instance = actions.create_server(options)
+
     ssh_cmd = f"holy server ssh {options.name}"
 
+    if kwargs.get("follow_boot"):
+        click.echo("Waiting for the boot log (press Ctrl-C to stop)...")
+
+        try:
+            actions.stream_console_output(
+                options,
+                True,
+                5,
+                lambda text: click.echo(text, nl=False),
+                until_boot_finished=True,
+            )
+            click.echo("\nBoot finished")
+        except KeyboardInterrupt:
+            pass
+
     if kwargs.get("region"):
         ssh_cmd += f" --region={kwargs['region']}"
 
@@ -288,3 +1015,23 @@ def create(**kwargs) -> None:
     click.echo(
         f"Your server is ready:\n\nIP: {instance.public_ip_address}\nDNS: {instance.public_dns_name}\n\nTo connect run: {ssh_cmd}"
     )
+
+
+def _parse_list_fields(value: Optional[str]) -> List[str]:
+    if not value:
+        return list(LIST_FIELDS)
+
+    lookup = {field.lower(): field for field in LIST_FIELDS}
+    fields = []
+
+    for field in value.split(","):
+        field = field.strip().lower()
+
+        if field not in lookup:
+            raise AbortError(
+                f"Invalid field {field}, must be one of: {', '.join(LIST_FIELDS)}"
+            )
+
+        fields.append(lookup[field])
+
+    return fields
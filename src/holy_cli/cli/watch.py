@@ -0,0 +1,71 @@
+import time
+from typing import List, Optional, Set
+
+import click
+from tabulate import tabulate
+
+
+class LiveTable:
+    """
+    Keeps a table on screen and rewrites only the lines that changed since the last draw,
+    highlighting them until the next draw. Falls back to printing each table in full when
+    the output is not a terminal.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.highlighted: Set[int] = set()
+        self.is_tty = click.get_text_stream("stdout").isatty()
+
+    def draw(self, rows: List[dict], footer: str) -> None:
+        lines = tabulate(rows, headers="keys", tablefmt="simple_grid").splitlines()
+        lines.append(click.style(footer, dim=True))
+
+        if not self.is_tty:
+            click.echo("\n".join(lines) + "\n")
+            return
+
+        # Columns may have changed width or rows been added, so start again
+        if len(lines) != len(self.lines) or self._widths(lines) != self._widths(
+            self.lines
+        ):
+            self._redraw(lines)
+            return
+
+        changed = {
+            index
+            for index in range(len(lines) - 1)
+            if lines[index] != self.lines[index]
+        }
+
+        for index in changed | self.highlighted:
+            self._write_line(
+                len(lines) - index,
+                lines[index],
+                "yellow" if index in changed else None,
+            )
+
+        self._write_line(1, lines[-1], None)
+        self.lines = lines
+        self.highlighted = changed
+
+    def _redraw(self, lines: List[str]) -> None:
+        if len(self.lines) > 0:
+            # Back to the top of the last table and clear everything below
+            click.echo(f"\x1b[{len(self.lines)}F\x1b[J", nl=False)
+
+        click.echo("\n".join(lines))
+        self.lines = lines
+        self.highlighted = set()
+
+    def _write_line(self, lines_up: int, line: str, color: Optional[str]) -> None:
+        # Up to the line, rewrite it, then back down below the table
+        text = click.style(line, fg=color) if color else line
+        click.echo(f"\x1b[{lines_up}F\x1b[2K{text}\x1b[{lines_up}E", nl=False)
+
+    def _widths(self, lines: List[str]) -> List[int]:
+        return [len(click.unstyle(line)) for line in lines[:-1]]
+
+
+def watch_footer(wait: float) -> str:
+    return f"Updated {time.strftime('%H:%M:%S')}, refreshing every {wait:.0f}s (Ctrl-C to stop)"
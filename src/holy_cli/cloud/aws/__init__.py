@@ -13,3 +13,32 @@ AWS_OS_USER_MAPPING = {
 }
 
 AWS_ARCHITECTURE_VALUES = ("x86_64", "arm64")
+
+AWS_INSTANCE_STATES = (
+    "pending",
+    "running",
+    "shutting-down",
+    "terminated",
+    "stopping",
+    "stopped",
+)
+
+# States that change by themselves, worth checking again soon
+AWS_TRANSITIONAL_STATES = ("pending", "stopping", "shutting-down")
+
+# States in which an instance still holds on to its security groups and IAM role
+AWS_LIVE_INSTANCE_STATES = ["pending", "running", "stopping", "stopped"]
+
+# RunInstances errors that only apply to one availability zone, so another zone may work
+AWS_ZONE_CAPACITY_ERRORS = ("InsufficientInstanceCapacity", "Unsupported")
+
+# Root volume types that can be chosen, with the (min, max) IOPS, max IOPS per GB and (min, max) throughput in MiB/s
+AWS_VOLUME_TYPES = ("gp3", "io2")
+AWS_VOLUME_LIMITS = {
+    "gp3": {"iops": (3000, 16000), "iops_per_gb": 500, "throughput": (125, 1000)},
+    "io2": {"iops": (100, 256000), "iops_per_gb": 1000, "throughput": None},
+}
+
+# gp3 throughput can be at most a quarter of its IOPS, the baseline when IOPS are not set
+AWS_GP3_THROUGHPUT_PER_IOPS = 0.25
+AWS_GP3_BASELINE_IOPS = 3000
@@ -1,30 +1,77 @@
 from __future__ import annotations
 
+import fnmatch
+import os
 import time
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from botocore.exceptions import ClientError
-from mypy_boto3_ec2.service_resource import Instance
-from yaspin import yaspin
 
 from holy_cli.config import Config, GlobalConfig
 from holy_cli.exceptions import AbortError
 from holy_cli.log import getLogger
-
-from ..options import CreateServerOptions, ServerDTO
-from . import AWS_OS_USER_MAPPING
+from holy_cli.progress import Progress, ProgressFactory, spinner_progress
+from holy_cli.throttle import THROTTLING_ERROR_CODES, get_rate_limiter
+from holy_cli.trace import span, traced
+from holy_cli.tunnel import TunnelManager
+from holy_cli.util import (
+    ConsoleTail,
+    NameCache,
+    PlacementCache,
+    PortRange,
+    ProvisioningJournal,
+    SyncManifest,
+    format_bytes,
+    format_port_range,
+    is_boot_finished,
+    short_hash,
+)
+
+from ..options import (
+    CreateServerOptions,
+    ListServersOptions,
+    ServerDTO,
+    check_disk_options,
+)
+from . import (
+    AWS_LIVE_INSTANCE_STATES,
+    AWS_OS_USER_MAPPING,
+    AWS_TRANSITIONAL_STATES,
+    AWS_VOLUME_TYPES,
+    AWS_ZONE_CAPACITY_ERRORS,
+)
 from .iam import IAMWrapper
 from .image import ImageWrapper
 from .instance import InstanceWrapper
+from .instance_type import InstanceTypeWrapper
 from .key_pair import KeyPairWrapper
+from .metrics import MetricsWrapper
 from .security_group import SecurityGroupWrapper
-from .ssh import SSHWrapper
+from .ssh import SSHConfigFile, SSHWrapper
 from .vpc import VPCWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Instance, Subnet, Volume
+
 
 class AWSActions:
-    def __init__(self, config: Config) -> None:
+    def __init__(
+        self, config: Config, progress: Optional[ProgressFactory] = None
+    ) -> None:
         self.config = config
+        self.progress = progress or spinner_progress
         self.log = getLogger()
         self.vpc = VPCWrapper(self.config)
         self.key_pair = KeyPairWrapper(self.config)
@@ -32,27 +79,49 @@ class AWSActions:
         self.security_group = SecurityGroupWrapper(self.config)
         self.iam = IAMWrapper(self.config)
         self.instance = InstanceWrapper(self.config)
-
+        self.instance_type = InstanceTypeWrapper(self.config)
+        self.ssh_config = SSHConfigFile(self.config.global_config)
+        self.name_cache = NameCache(self.config.global_config.names_cache_file)
+        self.placement_cache = PlacementCache(
+            self.config.global_config.placement_cache_file
+        )
+
+    @traced("Teardown")
     def teardown(self) -> None:
         def teardown_retry(attempts: int) -> None:
             self.log.debug(f"Teardown attempt #{attempts}")
 
             try:
-                self.security_group.teardown()
-                self.key_pair.teardown()
-                self.iam.teardown()
-                self.vpc.teardown()
+                with span("Security groups", attempt=attempts):
+                    self.security_group.teardown()
+
+                with span("Key pairs", attempt=attempts):
+                    self.key_pair.teardown()
+
+                with span("IAM", attempt=attempts):
+                    self.iam.teardown()
+
+                with span("VPC", attempt=attempts):
+                    self.vpc.teardown()
             except ClientError as err:
                 if err.response["Error"]["Code"] == "DependencyViolation":
                     if attempts < 10:
-                        time.sleep(5)
+                        with span("Wait for dependencies", attempt=attempts):
+                            self.config.provider.sleep(5)
+
                         teardown_retry(attempts + 1)
                         return
                 raise
 
-        with yaspin(text="Removing infrastructure", color="yellow") as spinner:
+        with self.progress("Removing infrastructure") as spinner:
             try:
-                self.instance.teardown()
+                with span("Instances"):
+                    self.instance.teardown()
+
+                self.ssh_config.clear()
+                self.name_cache.set_names(
+                    self.config.aws_profile, self.config.aws_region, []
+                )
                 teardown_retry(0)
 
                 spinner.ok("✅ ")
@@ -60,184 +129,448 @@ class AWSActions:
                 spinner.fail("💥 ")
                 raise
 
-    def create_server(self, options: CreateServerOptions) -> Instance:
+    @traced("Create server")
+    def create_server(
+        self, options: CreateServerOptions, resume: bool = False
+    ) -> Instance:
+        journal = self._get_journal(options.id)
         self.log.info(f"Creating server {options.name} with ID {options.id}")
 
-        with yaspin(text=f"Creating server {options.name}", color="yellow") as spinner:
+        with self.progress(f"Creating server {options.name}") as spinner:
             try:
-                if self.instance.exists(options.id):
-                    raise AbortError(
-                        "Server already exists, please choose a different name"
-                    )
+                if not resume:
+                    with span("Check existing"):
+                        if journal.exists():
+                            raise AbortError(
+                                "An earlier create of this server did not finish, run again with --resume to continue or --rollback to undo it"
+                            )
+
+                        if self.instance.exists(options.id):
+                            raise AbortError(
+                                "Server already exists, please choose a different name"
+                            )
+
+                    # Fail on the instance type or vCPU quota before anything is created
+                    with span("Preflight"):
+                        self.instance_type.check(
+                            options.type, options.architecture, options.hibernation
+                        )
+
+                    journal.start(options.to_dict())
+                else:
+                    with span("Unrecorded resources"):
+                        self._delete_unrecorded(journal, options.id, spinner)
+
+                # Hibernation needs room on the root volume to store the contents of RAM
+                disk_size = options.disk_size
+
+                if options.hibernation:
+                    with span("Hibernation size"):
+                        disk_size += self.instance_type.get_hibernation_size(
+                            options.type
+                        )
+
+                    self.log.info(f"Disk size with hibernation: {disk_size}GB")
+
+                with span("VPC"):
+                    # Use provided subnet / VPC
+                    if options.subnet_id:
+                        subnet = self.vpc.get_subnet_by_id(options.subnet_id)
+
+                        if subnet is None:
+                            raise AbortError("Subnet not found")
+
+                        vpc = subnet.vpc
+                        subnets = [subnet]
+                    else:
+                        # Create or use holy VPC
+                        vpc = self.vpc.get_vpc()
+
+                        if vpc is None:
+                            vpc = self.vpc.create()
+                            spinner.write("> Created VPC")
+
+                        # Start with the zone that last had capacity
+                        subnets = self.vpc.get_subnets(
+                            vpc,
+                            self.placement_cache.get_zone(
+                                self.config.aws_profile, self.config.aws_region
+                            ),
+                        )
 
-                # Use provided subnet / VPC
-                if options.subnet_id:
-                    subnet = self.vpc.get_subnet_by_id(options.subnet_id)
+                self.log.info(f"VPC ID: {vpc.id}")
 
-                    if subnet is None:
-                        raise AbortError("Subnet not found")
+                # Create a new key pair
+                step = journal.get("key_pair")
 
-                    vpc = subnet.vpc
-                else:
-                    # Create or use holy VPC
-                    vpc = self.vpc.get_vpc()
+                if step is None:
+                    with span("Key pair"):
+                        key_pair = self.key_pair.create(options.id)
 
-                    if vpc is None:
-                        vpc = self.vpc.create()
-                        spinner.write("> Created VPC")
+                    journal.record("key_pair", name=key_pair.name)
+                    step = journal.get("key_pair")
+                    spinner.write("> Created key pair")
 
-                    subnet = list(vpc.subnets.all())[0]
+                key_pair_name = step["name"]  # type: ignore
+                self.log.info(f"Key pair name: {key_pair_name}")
 
-                self.log.info(f"VPC ID: {vpc.id}")
-                self.log.info(f"Subnet ID: {subnet.id}")
+                # Use the specified AMI image or find one based on the OS and architecture
+                with span("AMI"):
+                    if options.image_id:
+                        image = self.image.get_image_by_id(options.image_id)
+
+                        if image is None:
+                            raise AbortError("Image not found")
+                    else:
+                        image = self.image.find_image_choices(
+                            options.os, options.architecture
+                        )
+                        self.log.info(f"Image ID: {image.id}")
+                        spinner.write("> Found AMI image")
+
+                # Create a new security group or use the shared one for these ports
+                step = journal.get("security_group")
+
+                if step is None:
+                    with span("Security group"):
+                        if options.shared_sg:
+                            sg = self.security_group.get_or_create_shared(
+                                vpc.id, options.ports
+                            )
+                        else:
+                            sg = self.security_group.create(
+                                vpc.id, options.id, options.name, options.ports
+                            )
+
+                    journal.record("security_group", id=sg.id, shared=options.shared_sg)
+                    step = journal.get("security_group")
+                    spinner.write(
+                        "> Using shared security group"
+                        if options.shared_sg
+                        else "> Created security group"
+                    )
 
-                # Create a new key pair
-                key_pair = self.key_pair.create(options.id)
-                self.log.info(f"Key pair name: {key_pair.name}")
-                spinner.write("> Created key pair")
+                sg_id = step["id"]  # type: ignore
+                self.log.info(f"Security group ID: {sg_id}")
 
-                # Use the specified AMI image or find one based on the OS and architecture
-                if options.image_id:
-                    image = self.image.get_image_by_id(options.image_id)
+                # Create a new IAM role and instance profile or reuse one with the same actions
+                iam_profile = options.iam_profile
 
-                    if image is None:
-                        raise AbortError("Image not found")
+                if options.actions and not options.iam_profile:
+                    step = journal.get("iam_role")
+
+                    if step is None:
+                        with span("IAM role"):
+                            profile, created = self.iam.get_or_create_instance_profile(
+                                options.actions
+                            )
+
+                        journal.record("iam_role", arn=profile.arn)
+                        step = journal.get("iam_role")
+                        spinner.write(
+                            "> Created IAM role"
+                            if created
+                            else "> Using existing IAM role"
+                        )
+
+                    iam_profile = step["arn"]  # type: ignore
+                    self.log.info(f"IAM profile ARN: {iam_profile}")
+
+                step = journal.get("instance")
+                client_token = journal.get_client_token()
+
+                # The launch may have reached EC2 before the create was interrupted
+                if step is None and resume:
+                    found = self.instance.get_by_client_token(client_token)
+
+                    if found is not None:
+                        journal.record("instance", id=found.id)
+                        step = journal.get("instance")
+
+                # A role made by holy is shared, and deleted along with its last server
+                managed_role = bool(options.actions and not options.iam_profile)
+
+                def iam_profile_exists() -> bool:
+                    return self.iam.exists(iam_profile)  # type: ignore
+
+                def launch_in(subnet: Subnet) -> Instance:
+                    zone = subnet.availability_zone
+                    self.log.info(f"Subnet ID: {subnet.id} ({zone})")
+
+                    with span("Run instance", zone=zone):
+                        return self.instance.create(
+                            server_id=options.id,
+                            server_name=options.name,
+                            os=options.os,
+                            subnet_id=subnet.id,
+                            image_id=image.id,
+                            root_device_name=image.root_device_name,
+                            instance_type=options.type,
+                            key_pair_name=key_pair_name,
+                            security_group_id=sg_id,
+                            disk_size=disk_size,
+                            script_file=options.script_file,
+                            iam_profile=iam_profile,
+                            # A different subnet or group is a different request to EC2
+                            client_token=f"{client_token}-{short_hash(f'{subnet.id}:{sg_id}')}",
+                            hibernation=options.hibernation,
+                            disk_type=options.disk_type,
+                            iops=options.iops,
+                            throughput=options.throughput,
+                            iam_profile_exists=(
+                                iam_profile_exists if managed_role else None
+                            ),
+                        )
+
+                def launch() -> Tuple[Instance, str]:
+                    # Capacity is per zone, so the other zones may still have room
+                    for subnet in subnets[:-1]:
+                        try:
+                            return launch_in(subnet), subnet.availability_zone
+                        except ClientError as err:
+                            if (
+                                err.response["Error"]["Code"]
+                                not in AWS_ZONE_CAPACITY_ERRORS
+                            ):
+                                raise
+
+                            spinner.write(
+                                f"> No capacity for {options.type} in {subnet.availability_zone}, trying the next zone"
+                            )
+
+                    return launch_in(subnets[-1]), subnets[-1].availability_zone
+
+                if step is not None:
+                    instance = self.instance.get_by_instance_id(step["id"])
                 else:
-                    image = self.image.find_image_choices(
-                        options.os, options.architecture
-                    )
-                    self.log.info(f"Image ID: {image.id}")
-                    spinner.write("> Found AMI image")
+                    try:
+                        try:
+                            instance, zone = launch()
+                        except ClientError as err:
+                            # The shared role or group was picked up just before its last server deleted it
+                            if (
+                                managed_role
+                                and self.instance.is_iam_profile_error(err)
+                                and not iam_profile_exists()
+                            ):
+                                with span("IAM role"):
+                                    (
+                                        profile,
+                                        _,
+                                    ) = self.iam.get_or_create_instance_profile(
+                                        options.actions  # type: ignore
+                                    )
+
+                                journal.record("iam_role", arn=profile.arn)
+                                iam_profile = profile.arn
+                                spinner.write(
+                                    "> Created IAM role again, it had been deleted"
+                                )
+                            elif (
+                                options.shared_sg
+                                and err.response["Error"]["Code"]
+                                == "InvalidGroup.NotFound"
+                            ):
+                                with span("Security group"):
+                                    sg = self.security_group.get_or_create_shared(
+                                        vpc.id, options.ports
+                                    )
+
+                                journal.record("security_group", id=sg.id, shared=True)
+                                sg_id = sg.id
+                                spinner.write(
+                                    "> Created shared security group again, it had been deleted"
+                                )
+                            else:
+                                raise
+
+                            instance, zone = launch()
+
+                        journal.record("instance", id=instance.id)
+                        self.placement_cache.set_zone(
+                            self.config.aws_profile, self.config.aws_region, zone
+                        )
+                    except ClientError:
+                        # Remove anything created at this stage so not to cause name conflicts
+                        with span("Cleanup"):
+                            self._rollback(journal, options.id, spinner)
+
+                        raise
+
+                    spinner.write("> Created instance")
+
+                self.log.info(f"Instance ID: {instance.id}")
+                spinner.write("> Waiting for instance to start...")
 
-                # Create a new security group
-                sg = self.security_group.create(
-                    vpc.id, options.id, options.name, options.ports
-                )
-                self.log.info(f"Security group ID: {sg.id}")
-                spinner.write("> Created security group")
+                with span("Wait until running"):
+                    instance.wait_until_running()
 
-                # Create a new IAM role and instance profile
-                iam_profile_for_actions = None
+                # Reload the instance data so that we can get the public IP and DNS
+                with span("Reload instance"):
+                    instance.reload()
 
-                if options.actions and not options.iam_profile:
-                    iam_profile_for_actions = self.iam.create_instance_profile(
-                        options.id, options.actions
-                    )
-                    self.log.info(f"IAM profile ARN: {iam_profile_for_actions.arn}")
-                    spinner.write("> Created IAM role")
-
-                try:
-                    instance = self.instance.create(
-                        server_id=options.id,
-                        server_name=options.name,
-                        os=options.os,
-                        subnet_id=subnet.id,
-                        image_id=image.id,
-                        root_device_name=image.root_device_name,
-                        instance_type=options.type,
-                        key_pair_name=key_pair.name,
-                        security_group_id=sg.id,
-                        disk_size=options.disk_size,
-                        script_file=options.script_file,
-                        iam_profile=options.iam_profile,
+                self._refresh_ssh_config([instance])
+                self.name_cache.add(
+                    self.config.aws_profile, self.config.aws_region, options.name
+                )
+                journal.delete()
+
+                spinner.ok("✅ ")
+            except:
+                if journal.exists():
+                    spinner.write(
+                        "> Progress saved, run again with --resume to continue or --rollback to undo it"
                     )
 
-                    self.log.info(f"Instance ID: {instance.id}")
-                except ClientError:
-                    # Remove anything created at this stage so not to cause name conflicts
-                    key_pair.delete()
-                    self.key_pair.delete_key_file(key_pair.name)
-                    sg.delete()
+                spinner.fail("💥 ")
+                raise
 
-                    if iam_profile_for_actions:
-                        self.iam.delete(options.id)
+        return instance
 
-                    raise
+    def resume_server(self, server: ServerDTO) -> Instance:
+        """Carries on with an unfinished create, using the options it was started with"""
+        journal = self._get_journal(server.id)
 
-                spinner.write("> Created instance")
-                spinner.write("> Waiting for instance to start...")
-                instance.wait_until_running()
+        if not journal.exists():
+            raise AbortError("No unfinished create found for this server")
 
-                # Attach the IAM instance profile once running because it takes several seconds for the permissions to propagate
-                if iam_profile_for_actions:
-                    self.instance.associate_iam_instance_profile(
-                        instance.id, iam_profile_for_actions.arn
-                    )
-                    spinner.write("> Attached IAM role")
+        options = CreateServerOptions.from_dict(journal.get_options() or {})
 
-                # Reload the instance data so that we can get the public IP and DNS
-                instance.reload()
+        return self.create_server(options, resume=True)
+
+    def rollback_server(self, server: ServerDTO) -> None:
+        journal = self._get_journal(server.id)
 
+        if not journal.exists():
+            raise AbortError("No unfinished create found for this server")
+
+        with self.progress(f"Rolling back server {server.name}") as spinner:
+            try:
+                self._rollback(journal, server.id, spinner)
                 spinner.ok("✅ ")
             except:
                 spinner.fail("💥 ")
                 raise
 
-        return instance
-
     def get_server_info(self, server: ServerDTO) -> dict:
+        details = self.get_server_details(server)
+        disk_size = details["disk_size"]
+        disk_throughput = details["disk_throughput"]
+
+        return {
+            "AWS ID": details["aws_id"],
+            "Holy ID": details["holy_id"],
+            "Name": details["name"],
+            "State": details["state"],
+            "Availability Zone": details["availability_zone"],
+            "OS": details["os"] or "-",
+            "Architecture": details["architecture"],
+            "Type": details["type"],
+            "Disk Size": f"{disk_size}GB" if disk_size is not None else "-",
+            "Disk Type": details["disk_type"] or "-",
+            "Disk IOPS": str(details["disk_iops"]) if details["disk_iops"] else "-",
+            "Disk Throughput": f"{disk_throughput} MiB/s" if disk_throughput else "-",
+            "Hibernation": "Enabled" if details["hibernation"] else "Disabled",
+            "Open Ports": ", ".join(details["open_ports"]),
+            "Public IP": details["public_ip"] or "-",
+            "Private IP": details["private_ip"] or "-",
+            "DNS": details["dns"] or "-",
+            "SSH Username": details["ssh_username"] or "-",
+            "SSH Key": details["ssh_key"] or "-",
+        }
+
+    def get_server_details(self, server: ServerDTO) -> dict:
+        """Same as get_server_info but with plain values (numbers, booleans and None) rather than text"""
         instance = self.instance.get_by_id(server.id)
-        name = self.instance.get_tag_value(instance.tags, "Name")
-        os = self.instance.get_tag_value(instance.tags, "holy-cli:os")
+        ssh_key = None
 
         if instance.state["Name"] != "terminated":
-            _, key_file_path = self.key_pair.get_name_and_path(server.id)
-        else:
-            key_file_path = "-"
+            _, ssh_key = self.key_pair.get_name_and_path(server.id)
 
-        if os in AWS_OS_USER_MAPPING:
-            username = AWS_OS_USER_MAPPING[os]
-        else:
-            username = "-"
+        os = self.instance.get_tag_value(instance.tags, "holy-cli:os")
+        volume = self._get_root_volume(instance)
+        ports: List[str] = []
 
-        volume_size = "-"
-        ports = []
+        if len(instance.security_groups) > 0:
+            shared_group_ids = self.security_group.get_shared_group_ids(instance)
 
-        if len(instance.block_device_mappings) > 0:
-            volume_id = instance.block_device_mappings[0]["Ebs"]["VolumeId"]
-            volume = self.instance.get_volume(volume_id)
+            if len(shared_group_ids) > 0:
+                sg = self.security_group.ec2.SecurityGroup(shared_group_ids[0])
+            else:
+                sg = self.security_group.get_by_server_id(server.id)
 
-            if volume:
-                volume_size = f"{volume.size}GB"
+            if sg:
+                for perm in sorted(
+                    sg.ip_permissions,
+                    key=lambda perm: (perm.get("FromPort", 0), perm.get("ToPort", 0)),
+                ):
+                    if "FromPort" not in perm:
+                        continue
 
-        if len(instance.security_groups) > 0:
-            sg = self.security_group.get_by_server_id(server.id)
+                    port = format_port_range((perm["FromPort"], perm["ToPort"]))
 
-            if sg:
-                ports = [perm["FromPort"] for perm in list(sg.ip_permissions)]
-                ports.sort()
+                    if perm["IpProtocol"] != "tcp":
+                        port += f"/{perm['IpProtocol']}"
+
+                    if port not in ports:
+                        ports.append(port)
+
+        hibernation_options = instance.hibernation_options or {}
 
         return {
-            "AWS ID": instance.id,
-            "Holy ID": server.id,
-            "Name": name,
-            "State": instance.state["Name"],
-            "Availability Zone": instance.placement["AvailabilityZone"],
-            "OS": os or "-",
-            "Architecture": instance.architecture,
-            "Type": instance.instance_type,
-            "Disk Size": volume_size,
-            "Open Ports": ", ".join(map(str, ports)),
-            "Public IP": instance.public_ip_address or "-",
-            "Private IP": instance.private_ip_address or "-",
-            "DNS": instance.public_dns_name or "-",
-            "SSH Username": username,
-            "SSH Key": key_file_path,
+            "aws_id": instance.id,
+            "holy_id": server.id,
+            "name": self.instance.get_tag_value(instance.tags, "Name"),
+            "state": instance.state["Name"],
+            "availability_zone": instance.placement["AvailabilityZone"],
+            "os": os,
+            "architecture": instance.architecture,
+            "type": instance.instance_type,
+            "disk_size": volume.size if volume else None,
+            "disk_type": volume.volume_type if volume else None,
+            "disk_iops": (volume.iops or None) if volume else None,
+            "disk_throughput": (volume.throughput or None) if volume else None,
+            "hibernation": bool(hibernation_options.get("Configured")),
+            "open_ports": ports,
+            "public_ip": instance.public_ip_address,
+            "private_ip": instance.private_ip_address,
+            "dns": instance.public_dns_name or None,
+            "ssh_username": AWS_OS_USER_MAPPING.get(os) if os else None,
+            "ssh_key": ssh_key,
         }
 
-    def list_servers(self, only_running: bool) -> List[dict]:
-        results = []
-        instances = self.instance.get_all()
+    def list_servers(self, options: Optional[ListServersOptions] = None) -> List[dict]:
+        return self._list_rows(self.iter_servers(options))
 
-        for instance in instances:
-            if only_running and instance.state["Name"] != "running":
-                continue
+    def iter_servers(
+        self, options: Optional[ListServersOptions] = None
+    ) -> Iterator[dict]:
+        """Yields a row per server as each page of results arrives"""
+        hosts: Dict[str, Optional[str]] = {}
+        names: Set[str] = set()
 
-            name = self.instance.get_tag_value(instance.tags, "Name")
-            os = self.instance.get_tag_value(instance.tags, "holy-cli:os")
+        yield from self._iter_rows(options, hosts, names)
 
-            results.append(
-                {
+        self._update_caches(options, hosts, names)
+
+    def _iter_rows(
+        self,
+        options: Optional[ListServersOptions],
+        hosts: Dict[str, Optional[str]],
+        names: Set[str],
+    ) -> Iterator[dict]:
+        """Yields a row per server, collecting the SSH hosts and names seen for the caches"""
+        for instances in self.instance.get_all_pages(options):
+            hosts.update(self._get_ssh_hosts(instances))
+
+            for instance in instances:
+                name = self.instance.get_tag_value(instance.tags, "Name")
+                os = self.instance.get_tag_value(instance.tags, "holy-cli:os")
+
+                if name and instance.state["Name"] != "terminated":
+                    names.add(name)
+
+                yield {
                     "Name": name,
                     "State": instance.state["Name"],
                     "OS": os or "-",
@@ -245,16 +578,78 @@ class AWSActions:
                     "IP": instance.public_ip_address or "-",
                     "DNS": instance.public_dns_name or "-",
                 }
-            )
 
-        if len(results) == 0:
-            results.append(
-                {
-                    "Name": "No existing servers",
-                }
+    def _update_caches(
+        self,
+        options: Optional[ListServersOptions],
+        hosts: Dict[str, Optional[str]],
+        names: Set[str],
+    ) -> None:
+        self.ssh_config.refresh(hosts)
+
+        # Only a full listing can tell which servers no longer exist
+        if options is None or not options.has_filters():
+            self.name_cache.set_names(
+                self.config.aws_profile, self.config.aws_region, names
             )
+        else:
+            for name in names:
+                self.name_cache.add(
+                    self.config.aws_profile, self.config.aws_region, name
+                )
 
-        return results
+    def watch_servers(
+        self,
+        options: Optional[ListServersOptions],
+        interval: float,
+        max_interval: float,
+        render: Callable[[List[dict], float], None],
+    ) -> None:
+        """
+        Lists the servers again and again with the same session. Polls every interval while servers
+        are changing, slowing down towards max_interval when nothing changes or the API throttles.
+        """
+        limiter = get_rate_limiter()
+        previous: Optional[List[dict]] = None
+        wait = interval
+
+        while True:
+            retries = limiter.get_count("ec2", "retries")
+
+            hosts: Dict[str, Optional[str]] = {}
+            names: Set[str] = set()
+
+            try:
+                rows: Optional[List[dict]] = self._list_rows(
+                    self._iter_rows(options, hosts, names)
+                )
+                throttled = limiter.get_count("ec2", "retries") > retries
+            except ClientError as err:
+                if err.response["Error"]["Code"] not in THROTTLING_ERROR_CODES:
+                    raise
+
+                # Keep showing the last list until the API lets up
+                rows = previous
+                throttled = True
+
+            if throttled:
+                wait = min(wait * 2, max_interval)
+            elif rows != previous or any(
+                row.get("State") in AWS_TRANSITIONAL_STATES for row in rows or []
+            ):
+                wait = interval
+            else:
+                wait = min(wait * 1.5, max_interval)
+
+            if rows is not None:
+                render(rows, wait)
+
+            # The caches only need refreshing when something they hold may have changed
+            if rows is not None and rows != previous:
+                self._update_caches(options, hosts, names)
+
+            previous = rows
+            self.config.provider.sleep(wait)
 
     def ssh_into_server(
         self, server: ServerDTO, username: Optional[str], save: bool
@@ -269,23 +664,242 @@ class AWSActions:
         else:
             ssh.ssh_into_instance(instance, key_file_path, username)
 
+    def run_command_on_servers(
+        self,
+        patterns: Sequence[str],
+        command: str,
+        username: Optional[str],
+        parallel: int,
+        output: Callable[[str, str], None],
+    ) -> List[dict]:
+        instances = self._find_instances(patterns, ["running"])
+
+        if len(instances) == 0:
+            raise AbortError("No running servers found")
+
+        ssh = SSHWrapper(self.config)
+
+        def run(instance: Instance) -> dict:
+            name = self.instance.get_tag_value(instance.tags, "Name") or instance.id
+            server_id = self.instance.get_tag_value(instance.tags, "holy-cli:server")
+            _, key_file_path = self.key_pair.get_name_and_path(server_id)  # type: ignore
+            start = time.monotonic()
+
+            try:
+                exit_code = ssh.run_command(
+                    instance,
+                    key_file_path,
+                    username,
+                    command,
+                    lambda line: output(name, line),
+                )
+            except (AbortError, OSError) as err:
+                output(name, f"Error: {err}")
+                exit_code = 255
+
+            return {
+                "Name": name,
+                "Exit Code": exit_code,
+                "Time": f"{time.monotonic() - start:.2f}s",
+            }
+
+        with ThreadPoolExecutor(max_workers=min(parallel, len(instances))) as pool:
+            return list(pool.map(run, instances))
+
+    def sync_to_server(
+        self,
+        server: ServerDTO,
+        local_dir: str,
+        remote_dir: str,
+        username: Optional[str],
+        excludes: Sequence[str],
+        full: bool,
+        watch: bool,
+        interval: float,
+        output: Callable[[str], None],
+    ) -> None:
+        instance = self.instance.get_by_id(server.id)
+        _, key_file_path = self.key_pair.get_name_and_path(server.id)
+        local_dir = os.path.abspath(local_dir)
+
+        if not os.path.isdir(local_dir):
+            raise AbortError(f"Local directory not found: {local_dir}")
+
+        # The manifest records what was last sent, so a re-created server starts from scratch
+        manifest_name = short_hash(f"{instance.id}:{local_dir}:{remote_dir}")
+        manifest = SyncManifest(
+            os.path.join(self.config.global_config.sync_dir, f"{manifest_name}.json")
+        )
+
+        if full:
+            manifest.files = {}
+
+        ssh = SSHWrapper(self.config)
+
+        while True:
+            start = time.monotonic()
+            files, changed, deleted = manifest.scan(local_dir, excludes)
+
+            if len(changed) > 0 or len(deleted) > 0:
+                missing = ssh.send_files(
+                    instance,
+                    key_file_path,
+                    username,
+                    local_dir,
+                    remote_dir,
+                    changed,
+                    deleted,
+                )
+
+                # Record what the server still has, so the next scan sees them as deleted or changed
+                for rel_path in missing:
+                    if rel_path in manifest.files:
+                        files[rel_path] = manifest.files[rel_path]
+                    else:
+                        del files[rel_path]
+
+                manifest.save(files)
+                output(
+                    f"Synced {len(changed) - len(missing)} changed and {len(deleted)} deleted files in {time.monotonic() - start:.2f}s"
+                )
+            else:
+                # Only modified times changed, save them so the files aren't read again
+                if files != manifest.files:
+                    manifest.save(files)
+
+                if not watch:
+                    output("Already up to date")
+
+            if not watch:
+                return
+
+            time.sleep(interval)
+
+    def stream_console_output(
+        self,
+        server: ServerDTO,
+        follow: bool,
+        interval: float,
+        output: Callable[[str], None],
+        until_boot_finished: bool = False,
+    ) -> bool:
+        """Outputs only new console output on each poll, returns True if cloud-init has finished"""
+        instance = self.instance.get_by_id(server.id)
+        tail = ConsoleTail()
+
+        while True:
+            text = tail.feed(self.instance.get_console_output(instance.id))
+
+            if text:
+                output(text)
+
+            finished = is_boot_finished(tail.previous)
+
+            if not follow or (until_boot_finished and finished):
+                return finished
+
+            self.config.provider.sleep(interval)
+
+    def get_server_stats(
+        self, patterns: Sequence[str], window: int, points: int
+    ) -> List[dict]:
+        """CPU, network and disk use of each matching server over the last window (seconds)"""
+        instances = self._find_instances(patterns, AWS_LIVE_INSTANCE_STATES)
+
+        if len(instances) == 0:
+            raise AbortError("No servers found")
+
+        # Only Nitro instances report the EBS use of their volumes themselves
+        catalog = self.instance_type.get_catalog()
+        volume_ids = {
+            instance.id: [
+                mapping["Ebs"]["VolumeId"]
+                for mapping in instance.block_device_mappings
+                if "Ebs" in mapping
+            ]
+            for instance in instances
+            if catalog.get(instance.instance_type, {}).get("hypervisor") != "nitro"
+        }
+        metrics = MetricsWrapper(self.config).get_instance_metrics(
+            [instance.id for instance in instances], window, points, volume_ids
+        )
+        results = []
+
+        def total(values: List[float]) -> str:
+            return format_bytes(sum(values)) if values else "-"
+
+        for instance in instances:
+            values = metrics[instance.id]
+            cpu = values["CPUUtilization"]
+
+            results.append(
+                {
+                    "Name": self.instance.get_tag_value(instance.tags, "Name"),
+                    "State": instance.state["Name"],
+                    "Type": instance.instance_type,
+                    "CPU Avg": f"{sum(cpu) / len(cpu):.1f}%" if cpu else "-",
+                    "CPU Peak": f"{max(cpu):.1f}%" if cpu else "-",
+                    "CPU History": cpu,
+                    "Network In": total(values["NetworkIn"]),
+                    "Network Out": total(values["NetworkOut"]),
+                    "Disk Read": total(values["EBSReadBytes"]),
+                    "Disk Write": total(values["EBSWriteBytes"]),
+                }
+            )
+
+        return sorted(results, key=lambda result: result["Name"] or "")
+
+    def open_tunnel(
+        self, server: ServerDTO, forwards: List[str], username: Optional[str]
+    ) -> dict:
+        tunnels = TunnelManager(self.config.global_config)
+        instance = self.instance.get_by_id(server.id)
+        _, key_file_path = self.key_pair.get_name_and_path(server.id)
+
+        ssh = SSHWrapper(self.config)
+        ssh_cmd = ssh.get_ssh_cmd(instance, key_file_path, username)
+        name = self.instance.get_tag_value(instance.tags, "Name") or server.name
+
+        return tunnels.open(
+            server.id,
+            name,
+            ssh_cmd,
+            forwards,
+            self.config.aws_region,
+            self.config.aws_profile,
+        )
+
     def start_server(self, server: ServerDTO) -> None:
-        with yaspin(text=f"Starting server {server.name}", color="yellow") as spinner:
+        with self.progress(f"Starting server {server.name}") as spinner:
             try:
                 instance = self.instance.get_by_id(server.id)
                 instance.start()
                 instance.wait_until_running()
 
+                # A new public IP is assigned on start, only fetch it if there is a saved SSH entry to update
+                if self.ssh_config.has(server.id):
+                    instance.reload()
+                    self._refresh_ssh_config([instance])
+
                 spinner.ok("✅ ")
             except:
                 spinner.fail("💥 ")
                 raise
 
-    def stop_server(self, server: ServerDTO) -> None:
-        with yaspin(text=f"Stopping server {server.name}", color="yellow") as spinner:
+    def stop_server(self, server: ServerDTO, hibernate: bool = False) -> None:
+        text = f"{'Hibernating' if hibernate else 'Stopping'} server {server.name}"
+
+        with self.progress(text) as spinner:
             try:
                 instance = self.instance.get_by_id(server.id)
-                instance.stop()
+                hibernation_options = instance.hibernation_options or {}
+
+                if hibernate and not hibernation_options.get("Configured"):
+                    raise AbortError(
+                        "Server was not created with hibernation enabled (see the --hibernation option when creating)"
+                    )
+
+                instance.stop(Hibernate=hibernate)
                 instance.wait_until_stopped()
 
                 spinner.ok("✅ ")
@@ -294,11 +908,19 @@ class AWSActions:
                 raise
 
     def delete_server(self, server: ServerDTO) -> None:
-        with yaspin(text=f"Deleting server {server.name}", color="yellow") as spinner:
+        with self.progress(f"Deleting server {server.name}") as spinner:
             try:
                 instance = self.instance.get_by_id(server.id)
+                shared_group_ids = self.security_group.get_shared_group_ids(instance)
+                iam_profile = instance.iam_instance_profile
                 instance.terminate()
                 instance.wait_until_terminated()
+                self.ssh_config.remove(server.id)
+                self.name_cache.remove(
+                    self.config.aws_profile,
+                    self.config.aws_region,
+                    self.instance.get_tag_value(instance.tags, "Name") or server.name,
+                )
                 spinner.write("> Deleted instance")
 
                 key_pair = self.key_pair.get_by_server_id(server.id)
@@ -314,11 +936,17 @@ class AWSActions:
                     sg.delete()
                     spinner.write("> Deleted security group")
 
+                # Shared groups are only removed along with the last server using them
+                for group_id in shared_group_ids:
+                    if self.security_group.release_shared(group_id):
+                        spinner.write("> Deleted shared security group")
+
+                # Roles are shared by servers with the same actions
                 if (
-                    instance.iam_instance_profile is not None
-                    and "holy-role" in instance.iam_instance_profile["Arn"]
+                    iam_profile is not None
+                    and "holy-role" in iam_profile["Arn"]
+                    and self.iam.release(iam_profile["Arn"])
                 ):
-                    self.iam.delete(server.id)
                     spinner.write("> Deleted IAM role")
 
                 spinner.ok("✅ ")
@@ -326,11 +954,250 @@ class AWSActions:
                 spinner.fail("💥 ")
                 raise
 
-    def change_port(
-        self, server: ServerDTO, port: int, action: str, ip_source: Optional[str]
-    ) -> None:
+    def change_ports(
+        self,
+        server: ServerDTO,
+        open_ranges: List[PortRange],
+        close_ranges: List[PortRange],
+        protocol: str,
+        ip_source: Optional[str],
+    ) -> Tuple[List[PortRange], List[PortRange]]:
+        sg = self.security_group.get_by_server_id(server.id)
+
+        if sg is None:
+            instance = self.instance.get_by_id(server.id)
+
+            if len(self.security_group.get_shared_group_ids(instance)) > 0:
+                raise AbortError(
+                    "Server uses a shared security group, its ports can't be changed on their own (allowed IPs can be changed with: holy allowlist)"
+                )
+
+            raise AbortError("Could not find security group")
+
+        return self.security_group.change_ports(
+            sg, open_ranges, close_ranges, protocol, ip_source
+        )
+
+    def modify_disk(
+        self,
+        server: ServerDTO,
+        size: Optional[int],
+        disk_type: Optional[str],
+        iops: Optional[int],
+        throughput: Optional[int],
+    ) -> str:
+        """Changes the root volume while the server keeps running, returns the modification state"""
         instance = self.instance.get_by_id(server.id)
-        self.security_group.change_port(server.id, port, action, ip_source)
+        volume = self._get_root_volume(instance)
+
+        if volume is None:
+            raise AbortError("Server has no disk")
+
+        if size is not None and size < volume.size:
+            raise AbortError(
+                f"Disk size can only be increased, it is currently {volume.size}GB"
+            )
+
+        new_type = disk_type or volume.volume_type
+
+        if new_type in AWS_VOLUME_TYPES:
+            # IOPS and throughput are kept from the current disk unless changed
+            if new_type == volume.volume_type:
+                iops = iops if iops is not None else volume.iops
+                throughput = throughput if throughput is not None else volume.throughput
+
+            check_disk_options(new_type, size or volume.size, iops, throughput)
+        elif iops is not None or throughput is not None:
+            raise AbortError(
+                f"IOPS and throughput can't be set on {new_type} disks, change the type to one of: "
+                + ", ".join(AWS_VOLUME_TYPES)
+            )
+
+        changes: dict = {}
+
+        if size is not None and size != volume.size:
+            changes["Size"] = size
+
+        if new_type != volume.volume_type:
+            changes["VolumeType"] = new_type
+
+        if iops is not None and iops != volume.iops:
+            changes["Iops"] = iops
+
+        if throughput is not None and throughput != volume.throughput:
+            changes["Throughput"] = throughput
+
+        if len(changes) == 0:
+            raise AbortError("Nothing to change, the disk already has these settings")
+
+        with self.progress(f"Changing disk of server {server.name}") as spinner:
+            try:
+                self.instance.modify_volume(volume.id, changes)
+                state = self.instance.wait_until_volume_modified(volume.id)
+
+                spinner.ok("✅ ")
+            except:
+                spinner.fail("💥 ")
+                raise
+
+        return state
+
+    def get_allowed_ips(self) -> List[str]:
+        return self.security_group.get_allowed_ips()
+
+    def change_allowed_ips(self, add: List[str], remove: List[str]) -> List[str]:
+        return self.security_group.change_allowed_ips(add, remove)
+
+    def _get_root_volume(self, instance: Instance) -> Optional[Volume]:
+        mappings = [
+            mapping for mapping in instance.block_device_mappings if "Ebs" in mapping
+        ]
+        root = next(
+            (
+                mapping
+                for mapping in mappings
+                if mapping["DeviceName"] == instance.root_device_name
+            ),
+            mappings[0] if len(mappings) > 0 else None,
+        )
+
+        if root is None:
+            return None
+
+        return self.instance.get_volume(root["Ebs"]["VolumeId"])
+
+    def _find_instances(
+        self, patterns: Sequence[str], states: List[str]
+    ) -> List[Instance]:
+        # Resolve every server with a single describe call, names may be glob patterns
+        instances = []
+
+        # Names are matched case insensitively here, EC2 tag filters are case sensitive
+        for page in self.instance.get_all_pages(ListServersOptions(states=states)):
+            for instance in page:
+                name = self.instance.get_tag_value(instance.tags, "Name") or ""
+
+                if any(
+                    fnmatch.fnmatch(name.lower(), pattern.lower())
+                    for pattern in patterns
+                ):
+                    instances.append(instance)
+
+        return instances
+
+    def _get_journal(self, server_id: str) -> ProvisioningJournal:
+        # The same name can be used in another account or region
+        name = short_hash(
+            f"{self.config.aws_profile or ''}:{self.config.aws_region or ''}:{server_id}"
+        )
+
+        return ProvisioningJournal(
+            os.path.join(self.config.global_config.journal_dir, f"{name}.json")
+        )
+
+    def _rollback(
+        self, journal: ProvisioningJournal, server_id: str, spinner: Progress
+    ) -> None:
+        """Undo the recorded steps in reverse, each is forgotten once undone so this can be re-run"""
+        step = journal.get("instance")
+
+        # Also terminate an instance launched just before the create was interrupted
+        if step is None:
+            found = self.instance.get_by_client_token(journal.get_client_token())
+
+            if found is not None:
+                journal.record("instance", id=found.id)
+                step = journal.get("instance")
+
+        if step is not None:
+            instance = self.instance.get_by_instance_id(step["id"])
+            instance.terminate()
+            instance.wait_until_terminated()
+            journal.remove("instance")
+            spinner.write("> Deleted instance")
+
+        self._delete_unrecorded(journal, server_id, spinner)
+
+        step = journal.get("iam_role")
+
+        if step is not None:
+            if self.iam.release(step["arn"]):
+                spinner.write("> Deleted IAM role")
+
+            journal.remove("iam_role")
+
+        step = journal.get("security_group")
+
+        if step is not None:
+            if step["shared"]:
+                self.security_group.release_shared(step["id"])
+            else:
+                self.security_group.delete(step["id"])
+                spinner.write("> Deleted security group")
+
+            journal.remove("security_group")
+
+        step = journal.get("key_pair")
+
+        if step is not None:
+            self.key_pair.delete(step["name"])
+            journal.remove("key_pair")
+            spinner.write("> Deleted key pair")
+
+        journal.delete()
+
+    def _delete_unrecorded(
+        self, journal: ProvisioningJournal, server_id: str, spinner: Progress
+    ) -> None:
+        """
+        Deletes a key pair or security group created just before the create was interrupted, before
+        it could be recorded. Found by their server tag, they are made again on resume as the private
+        key may not have been saved or the group rules not added.
+        """
+        if journal.get("key_pair") is None:
+            key_pair = self.key_pair.get_by_server_id(server_id)
+
+            if key_pair is not None:
+                self.key_pair.delete(key_pair.name)
+                spinner.write("> Deleted unrecorded key pair")
+
+        if journal.get("security_group") is None:
+            sg = self.security_group.get_by_server_id(server_id)
+
+            if sg is not None:
+                self.security_group.delete(sg.id)
+                spinner.write("> Deleted unrecorded security group")
+
+    def _refresh_ssh_config(self, instances: List[Instance]) -> None:
+        self.ssh_config.refresh(self._get_ssh_hosts(instances))
+
+    def _list_rows(self, rows: Iterable[dict]) -> List[dict]:
+        results = list(rows)
+
+        if len(results) == 0:
+            results.append(
+                {
+                    "Name": "No existing servers",
+                }
+            )
+
+        return results
+
+    def _get_ssh_hosts(self, instances: List[Instance]) -> Dict[str, Optional[str]]:
+        hosts: Dict[str, Optional[str]] = {}
+
+        for instance in instances:
+            server_id = self.instance.get_tag_value(instance.tags, "holy-cli:server")
+
+            if server_id is None:
+                continue
+
+            if instance.state["Name"] == "terminated":
+                hosts[server_id] = None
+            elif instance.public_ip_address:
+                hosts[server_id] = instance.public_ip_address
+
+        return hosts
 
     @classmethod
     def load_from_cli(cls, region: Optional[str], profile: Optional[str]) -> AWSActions:
@@ -1,15 +1,20 @@
-from typing import List, Optional, Sequence
+from __future__ import annotations
 
-from boto3 import Session
-from mypy_boto3_ec2 import EC2ServiceResource
-from mypy_boto3_ec2.literals import ResourceTypeType
-from mypy_boto3_ec2.type_defs import TagSpecificationTypeDef, TagTypeDef
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence
 
 from holy_cli.config import Config
 from holy_cli.log import getLogger
+from holy_cli.throttle import get_client_config, get_rate_limiter
+from holy_cli.trace import get_api_tracer
 
 from . import AWS_OS_USER_MAPPING, AWS_TAG_KEY, AWS_TAG_VALUE
 
+if TYPE_CHECKING:
+    from boto3 import Session
+    from mypy_boto3_ec2 import EC2ServiceResource
+    from mypy_boto3_ec2.literals import ResourceTypeType
+    from mypy_boto3_ec2.type_defs import TagSpecificationTypeDef, TagTypeDef
+
 
 class BaseWrapper:
     def __init__(self, config: Config) -> None:
@@ -18,12 +23,30 @@ class BaseWrapper:
         self.ec2 = self.init_ec2()
 
     def init_ec2(self) -> EC2ServiceResource:
-        session = self.init_boto3_session()
-        return session.resource("ec2")
+        return self.init_resource("ec2")
 
     def init_boto3_session(self) -> Session:
-        return Session(
-            region_name=self.config.aws_region, profile_name=self.config.aws_profile
+        session = self.config.provider.create_session(
+            self.config.aws_region, self.config.aws_profile
+        )
+        api_tracer = get_api_tracer()
+
+        if api_tracer is not None:
+            api_tracer.register(session)
+
+        # Every client made from the session shares the rate limiter and retry policy
+        get_rate_limiter().register(session, self.config.provider.sleep)
+
+        return session
+
+    def init_client(self, service_name: str) -> Any:
+        return self.init_boto3_session().client(
+            service_name, config=get_client_config()
+        )
+
+    def init_resource(self, service_name: str) -> Any:
+        return self.init_boto3_session().resource(
+            service_name, config=get_client_config()
         )
 
     def get_tags_for_resource(
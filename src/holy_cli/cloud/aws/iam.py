@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 import json
+from typing import TYPE_CHECKING, List, Tuple
 
-from mypy_boto3_iam.client import IAMClient
-from mypy_boto3_iam.service_resource import IAMServiceResource, InstanceProfile
+from botocore.exceptions import ClientError
 
 from holy_cli.config import Config
+from holy_cli.util import short_hash
 
+from . import AWS_LIVE_INSTANCE_STATES
 from .base import BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_iam.client import IAMClient
+    from mypy_boto3_iam.service_resource import IAMServiceResource, InstanceProfile
+
 POLICY_PATH_PREFIX = "/holy/"
 POLICY_INLINE_NAME = "holy-custom-policy"
 
@@ -16,29 +24,110 @@ class IAMWrapper(BaseWrapper):
 
     def __init__(self, config: Config) -> None:
         super().__init__(config)
-        session = self.init_boto3_session()
-        self.iam: IAMServiceResource = session.resource("iam")
-
-    def create_instance_profile(self, server_id: str, actions: str) -> InstanceProfile:
-        role_name = f"holy-role-{server_id}"
-        tags = self.get_tags(None, {"holy-cli:server": server_id})
-
-        role = self.iam.create_role(
-            RoleName=role_name,
-            Path=POLICY_PATH_PREFIX,
-            AssumeRolePolicyDocument=self._get_trust_ec2_policy(),
-            Tags=tags,  # type: ignore
-        )
+        self.iam: IAMServiceResource = self.init_resource("iam")
+
+    def get_or_create_instance_profile(
+        self, actions: str
+    ) -> Tuple[InstanceProfile, bool]:
+        """
+        Servers with the same actions share a role named by a hash of the action list, so a
+        repeat create reuses a profile that has already propagated. Returns True if it was created.
+        """
+        actions_list = self._get_actions_list(actions)
+        actions_hash = short_hash(",".join(actions_list).lower())
+        role_name = f"holy-role-{actions_hash}"
+
+        try:
+            profile = self.iam.InstanceProfile(role_name)
+            profile.load()
+
+            if len(profile.roles_attribute) > 0:
+                self.log.debug(f"Using existing instance profile {role_name}")
+                return profile, False
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "NoSuchEntity":
+                raise
+
+        tags = self.get_tags(None, {"holy-cli:actions": actions_hash})
+
+        # Each step may have been done already by an interrupted create, or by another create
+        # with the same actions running at the same time
+        try:
+            role = self.iam.create_role(
+                RoleName=role_name,
+                Path=POLICY_PATH_PREFIX,
+                AssumeRolePolicyDocument=self._get_trust_ec2_policy(),
+                Tags=tags,  # type: ignore
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "EntityAlreadyExists":
+                raise
+
+            self.log.debug(f"Using existing role {role_name}")
+            role = self.iam.Role(role_name)
 
         role_policy = self.iam.RolePolicy(role.name, POLICY_INLINE_NAME)
-        role_policy.put(PolicyDocument=self._get_custom_policy(actions))
-
-        profile = self.iam.create_instance_profile(
-            InstanceProfileName=role.name, Tags=tags  # type: ignore
+        role_policy.put(PolicyDocument=self._get_custom_policy(actions_list))
+
+        try:
+            profile = self.iam.create_instance_profile(
+                InstanceProfileName=role.name, Tags=tags  # type: ignore
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "EntityAlreadyExists":
+                raise
+
+            profile = self.iam.InstanceProfile(role.name)
+            profile.load()
+
+        if not self._has_role(profile, role.name):
+            try:
+                profile.add_role(RoleName=role.name)
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "LimitExceeded":
+                    raise
+
+                # A profile holds one role, another create may have just added it
+                profile.reload()
+
+                if not self._has_role(profile, role.name):
+                    raise
+
+        return profile, True
+
+    def exists(self, profile_arn: str) -> bool:
+        """True if the instance profile still exists with its role"""
+        try:
+            profile = self.iam.InstanceProfile(profile_arn.split("/")[-1])
+            profile.load()
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "NoSuchEntity":
+                raise
+
+            return False
+
+        return len(profile.roles_attribute) > 0
+
+    def release(self, profile_arn: str) -> bool:
+        """Deletes a holy role once no servers are using it, returns True if it was deleted"""
+        in_use = list(
+            self.ec2.instances.filter(
+                Filters=[
+                    {"Name": "iam-instance-profile.arn", "Values": [profile_arn]},
+                    {"Name": "instance-state-name", "Values": AWS_LIVE_INSTANCE_STATES},
+                ]
+            ).limit(1)
         )
-        profile.add_role(RoleName=role.name)
 
-        return profile
+        if len(in_use) > 0:
+            return False
+
+        self.delete(profile_arn.split("/")[-1])
+
+        return True
+
+    def _has_role(self, profile: InstanceProfile, role_name: str) -> bool:
+        return any(role["RoleName"] == role_name for role in profile.roles_attribute)
 
     def _get_trust_ec2_policy(self) -> str:
         return json.dumps(
@@ -54,9 +143,13 @@ class IAMWrapper(BaseWrapper):
             }
         )
 
-    def _get_custom_policy(self, actions: str) -> str:
-        actions_list = [action.strip() for action in actions.split(",")]
+    def _get_actions_list(self, actions: str) -> List[str]:
+        # Sorted without duplicates so the same permissions always give the same role
+        return sorted(
+            {action.strip() for action in actions.split(",") if action.strip() != ""}
+        )
 
+    def _get_custom_policy(self, actions_list: List[str]) -> str:
         return json.dumps(
             {
                 "Version": "2012-10-17",
@@ -79,10 +172,8 @@ class IAMWrapper(BaseWrapper):
 
             role.delete()
 
-    def delete(self, server_id: str) -> None:
-        session = self.init_boto3_session()
-        client: IAMClient = session.client("iam")
-        role_name = f"holy-role-{server_id}"
+    def delete(self, role_name: str) -> None:
+        client: IAMClient = self.init_client("iam")
 
         client.remove_role_from_instance_profile(
             InstanceProfileName=role_name, RoleName=role_name
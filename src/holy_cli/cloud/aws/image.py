@@ -1,22 +1,24 @@
-from datetime import datetime
-from typing import Optional
+from __future__ import annotations
 
-from mypy_boto3_ec2.service_resource import Image
-from mypy_boto3_ssm.client import SSMClient
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional
 
 from holy_cli.config import Config
 from holy_cli.exceptions import AbortError
 
 from .base import BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Image
+    from mypy_boto3_ssm.client import SSMClient
+
 
 class ImageWrapper(BaseWrapper):
     """Encapsulates Amazon EC2 AMI image actions."""
 
     def __init__(self, config: Config) -> None:
         super().__init__(config)
-        session = self.init_boto3_session()
-        self.ssm: SSMClient = session.client("ssm")
+        self.ssm: SSMClient = self.init_client("ssm")
 
     def find_image_choices(self, os: str, architecture: str) -> Image:
         if os == "amazon-linux":
@@ -1,17 +1,34 @@
-from typing import List, Optional
+from __future__ import annotations
 
-from mypy_boto3_ec2.client import EC2Client
-from mypy_boto3_ec2.service_resource import Instance, Volume
-from mypy_boto3_ec2.type_defs import IamInstanceProfileSpecificationTypeDef
+from typing import TYPE_CHECKING, Callable, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
 
 from holy_cli.exceptions import AbortError
 
+from ..options import ListServersOptions
 from .base import AWS_TAG_KEY, AWS_TAG_VALUE, BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Instance, Volume
+    from mypy_boto3_ec2.type_defs import (
+        FilterTypeDef,
+        IamInstanceProfileSpecificationTypeDef,
+    )
+
+IAM_PROPAGATION_ATTEMPTS = 10
+IAM_PROPAGATION_DELAY = 2
+
+# A volume modification usually reaches optimizing within a minute, larger volumes can take longer
+VOLUME_MODIFICATION_ATTEMPTS = 120
+VOLUME_MODIFICATION_DELAY = 5
+
 
 class InstanceWrapper(BaseWrapper):
     """Encapsulates Amazon EC2 instance actions."""
 
+    latest_console_output = True
+
     def create(
         self,
         server_id: str,
@@ -26,6 +43,12 @@ class InstanceWrapper(BaseWrapper):
         disk_size: int,
         script_file: Optional[str],
         iam_profile: Optional[str],
+        client_token: str,
+        hibernation: bool = False,
+        disk_type: str = "gp3",
+        iops: Optional[int] = None,
+        throughput: Optional[int] = None,
+        iam_profile_exists: Optional[Callable[[], bool]] = None,
     ) -> Instance:
         user_data = self._get_script_file(script_file) if script_file else ""
         additional_tags = {"holy-cli:server": server_id}
@@ -41,34 +64,77 @@ class InstanceWrapper(BaseWrapper):
             else:
                 iam_instance_profile["Name"] = iam_profile
 
-        instance = self.ec2.create_instances(
-            ImageId=image_id,
-            InstanceType=instance_type,  # type: ignore
-            KeyName=key_pair_name,
-            MinCount=1,
-            MaxCount=1,
-            IamInstanceProfile=iam_instance_profile,
-            TagSpecifications=self.get_tags_for_resource(
-                "instance", server_name, additional_tags
-            ),
-            BlockDeviceMappings=[
-                {
-                    "DeviceName": root_device_name,
-                    "Ebs": {"DeleteOnTermination": True, "VolumeSize": disk_size},
-                }
-            ],
-            NetworkInterfaces=[
-                {
-                    "SubnetId": subnet_id,
-                    "DeviceIndex": 0,
-                    "AssociatePublicIpAddress": True,
-                    "Groups": [security_group_id],
-                }
-            ],
-            UserData=user_data,
-        )[0]
-
-        return instance
+        # Set the type rather than taking the AMI's, which is often gp2
+        ebs = {
+            "DeleteOnTermination": True,
+            "VolumeSize": disk_size,
+            "VolumeType": disk_type,
+        }
+
+        if iops is not None:
+            ebs["Iops"] = iops
+
+        if throughput is not None:
+            ebs["Throughput"] = throughput
+
+        # Hibernation writes RAM to the root volume so it must be encrypted
+        if hibernation:
+            ebs["Encrypted"] = True
+
+        # A new IAM profile takes a few seconds before EC2 accepts it, the same client token
+        # is sent each time so EC2 launches at most one instance however often this is retried
+        attempts = 0
+
+        while True:
+            try:
+                return self.ec2.create_instances(
+                    ClientToken=client_token,
+                    ImageId=image_id,
+                    InstanceType=instance_type,  # type: ignore
+                    KeyName=key_pair_name,
+                    MinCount=1,
+                    MaxCount=1,
+                    IamInstanceProfile=iam_instance_profile,
+                    TagSpecifications=self.get_tags_for_resource(
+                        "instance", server_name, additional_tags
+                    ),
+                    BlockDeviceMappings=[
+                        {
+                            "DeviceName": root_device_name,
+                            "Ebs": ebs,  # type: ignore
+                        }
+                    ],
+                    HibernationOptions={"Configured": hibernation},
+                    NetworkInterfaces=[
+                        {
+                            "SubnetId": subnet_id,
+                            "DeviceIndex": 0,
+                            "AssociatePublicIpAddress": True,
+                            "Groups": [security_group_id],
+                        }
+                    ],
+                    UserData=user_data,
+                )[0]
+            except ClientError as err:
+                attempts += 1
+
+                if (
+                    not self.is_iam_profile_error(err)
+                    or attempts == IAM_PROPAGATION_ATTEMPTS
+                    # A deleted profile will never propagate
+                    or (iam_profile_exists is not None and not iam_profile_exists())
+                ):
+                    raise
+
+                self.log.debug("IAM instance profile not ready yet, retrying")
+                self.config.provider.sleep(IAM_PROPAGATION_DELAY)
+
+    def is_iam_profile_error(self, err: ClientError) -> bool:
+        error = err.response["Error"]
+
+        return error["Code"] == "InvalidParameterValue" and "iamInstanceProfile" in (
+            error.get("Message") or ""
+        )
 
     def get_by_id(self, server_id: str) -> Instance:
         results = list(
@@ -82,6 +148,43 @@ class InstanceWrapper(BaseWrapper):
 
         raise AbortError("Could not find server")
 
+    def get_console_output(self, instance_id: str) -> str:
+        """The most recent console output, botocore decodes it from base64"""
+        client = self.ec2.meta.client
+
+        # Only Nitro instances can return the latest output, others lag by a few minutes
+        if self.latest_console_output:
+            try:
+                response = client.get_console_output(
+                    InstanceId=instance_id, Latest=True
+                )
+                return response.get("Output") or ""
+            except ClientError as err:
+                if err.response["Error"]["Code"] != "UnsupportedOperation":
+                    raise
+
+                self.latest_console_output = False
+
+        response = client.get_console_output(InstanceId=instance_id)
+
+        return response.get("Output") or ""
+
+    def get_by_instance_id(self, instance_id: str) -> Instance:
+        return self.ec2.Instance(instance_id)
+
+    def get_by_client_token(self, client_token: str) -> Optional[Instance]:
+        """Finds an instance launched with a client token (or one starting with it) that isn't terminated"""
+        results = [
+            instance
+            for instance in self.ec2.instances.filter(
+                Filters=[{"Name": "client-token", "Values": [f"{client_token}*"]}]
+            )
+            if instance.state["Name"] not in ("shutting-down", "terminated")
+        ]
+
+        if len(results) > 0:
+            return results[0]
+
     def exists(self, server_id: str) -> bool:
         try:
             instance = self.get_by_id(server_id)
@@ -97,20 +200,84 @@ class InstanceWrapper(BaseWrapper):
             )
         )
 
+    def get_all_pages(
+        self, options: Optional[ListServersOptions] = None
+    ) -> Iterator[List[Instance]]:
+        """Yields the servers a page at a time as each describe call returns"""
+        yield from self.ec2.instances.filter(
+            Filters=self._get_list_filters(options)
+        ).pages()
+
+    def _get_list_filters(
+        self, options: Optional[ListServersOptions]
+    ) -> List[FilterTypeDef]:
+        filters: List[FilterTypeDef] = [
+            {"Name": f"tag:{AWS_TAG_KEY}", "Values": [AWS_TAG_VALUE]}
+        ]
+
+        if options is None:
+            return filters
+
+        # EC2 filter values support * and ? wildcards
+        for name, value in (
+            ("tag:Name", options.name),
+            ("tag:holy-cli:os", options.os),
+            ("instance-type", options.type),
+            ("availability-zone", options.availability_zone),
+        ):
+            if value:
+                filters.append({"Name": name, "Values": [value]})
+
+        if options.states:
+            filters.append({"Name": "instance-state-name", "Values": options.states})
+
+        return filters
+
     def get_volume(self, volume_id: str) -> Optional[Volume]:
         results = list(self.ec2.volumes.filter(VolumeIds=[volume_id]))
 
         if len(results) > 0:
             return results[0]
 
-    def associate_iam_instance_profile(
-        self, instance_id: str, profile_arn: str
-    ) -> None:
-        session = self.init_boto3_session()
-        client: EC2Client = session.client("ec2")
-        client.associate_iam_instance_profile(
-            InstanceId=instance_id, IamInstanceProfile={"Arn": profile_arn}
-        )
+    def modify_volume(self, volume_id: str, changes: dict) -> None:
+        """Changes the size, type, IOPS or throughput of a volume while it stays attached"""
+        try:
+            self.ec2.meta.client.modify_volume(VolumeId=volume_id, **changes)
+        except ClientError as err:
+            # EC2 allows one modification per volume every 6 hours
+            if err.response["Error"]["Code"] in (
+                "IncorrectModificationState",
+                "VolumeModificationRateExceeded",
+            ):
+                raise AbortError(
+                    f"The disk can't be changed yet: {err.response['Error']['Message']}"
+                )
+            raise
+
+    def wait_until_volume_modified(self, volume_id: str) -> str:
+        """
+        Waits until the new size and performance can be used, i.e. the modification is
+        optimizing (which carries on in the background) or completed. Returns the state.
+        """
+        for _ in range(VOLUME_MODIFICATION_ATTEMPTS):
+            results = self.ec2.meta.client.describe_volumes_modifications(
+                VolumeIds=[volume_id]
+            )
+
+            for modification in results["VolumesModifications"]:
+                state = modification["ModificationState"]
+
+                if state == "failed":
+                    raise AbortError(
+                        f"Disk change failed: {modification.get('StatusMessage', 'unknown error')}"
+                    )
+
+                if state in ("optimizing", "completed"):
+                    return state
+
+            self.config.provider.sleep(VOLUME_MODIFICATION_DELAY)
+
+        raise AbortError("Timed out waiting for the disk change")
 
     def teardown(self) -> None:
         instances = self.get_all()
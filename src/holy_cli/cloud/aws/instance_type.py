@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import difflib
+import math
+import re
+from typing import TYPE_CHECKING, Dict, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from holy_cli.config import Config
+from holy_cli.exceptions import AbortError
+from holy_cli.util import InstanceTypeCache
+
+from .base import BaseWrapper
+
+if TYPE_CHECKING:
+    from mypy_boto3_service_quotas import ServiceQuotasClient
+
+# New instance types come out every few weeks, quotas change only when an increase is requested
+CATALOG_TTL = 7 * 24 * 60 * 60
+QUOTA_TTL = 24 * 60 * 60
+
+# Without permission to read a quota, or with no such quota in the region, asking again
+# gives the same answer, so it is remembered for a while (in case permission is granted)
+UNREADABLE_QUOTA_TTL = 60 * 60
+UNREADABLE_QUOTA_ERROR_CODES = (
+    "AccessDenied",
+    "AccessDeniedException",
+    "NoSuchResourceException",
+)
+
+# On-Demand vCPU quotas, each shared by a group of instance families
+VCPU_QUOTAS = {
+    "L-1216C47A": "Standard (A, C, D, H, I, M, R, T, Z)",
+    "L-74FC7D96": "F",
+    "L-DB2E81BA": "G and VT",
+    "L-417A185B": "P",
+    "L-7295265B": "X",
+    "L-43DA4232": "High Memory",
+    "L-1945791B": "Inf",
+    "L-6E869C2A": "DL",
+    "L-2C3B7624": "Trn",
+    "L-F7808C92": "HPC",
+}
+
+# Checked in order, the first matching family prefix wins (inf before i, etc)
+FAMILY_QUOTA_CODES = (
+    ("inf", "L-1945791B"),
+    ("dl", "L-6E869C2A"),
+    ("trn", "L-2C3B7624"),
+    ("hpc", "L-F7808C92"),
+    ("vt", "L-DB2E81BA"),
+    ("mac", None),
+    ("u", "L-43DA4232"),
+    ("f", "L-74FC7D96"),
+    ("g", "L-DB2E81BA"),
+    ("p", "L-417A185B"),
+    ("x", "L-7295265B"),
+    ("a", "L-1216C47A"),
+    ("c", "L-1216C47A"),
+    ("d", "L-1216C47A"),
+    ("h", "L-1216C47A"),
+    ("i", "L-1216C47A"),
+    ("m", "L-1216C47A"),
+    ("r", "L-1216C47A"),
+    ("t", "L-1216C47A"),
+    ("z", "L-1216C47A"),
+)
+
+
+class InstanceTypeWrapper(BaseWrapper):
+    """Validates instance types and vCPU quotas against a locally cached catalog."""
+
+    def __init__(self, config: Config) -> None:
+        super().__init__(config)
+        self.cache = InstanceTypeCache(config.global_config.instance_types_cache_file)
+        self.catalog: Optional[Dict[str, dict]] = None
+        self.catalog_fetched = False
+        self._quotas_client: Optional[ServiceQuotasClient] = None
+
+    def get_catalog(self) -> Dict[str, dict]:
+        if self.catalog is None:
+            self.catalog = self.cache.get_types(
+                self.config.aws_profile, self.config.aws_region, CATALOG_TTL
+            )
+
+        if self.catalog is None:
+            self.catalog = self._fetch_catalog()
+
+        return self.catalog
+
+    def get(self, instance_type: str) -> dict:
+        catalog = self.get_catalog()
+
+        # The type may be newer than the cached catalog, fetch again at most once per run
+        if instance_type not in catalog and not self.catalog_fetched:
+            self.catalog = catalog = self._fetch_catalog()
+
+        if instance_type not in catalog:
+            message = f"Invalid instance type: {instance_type}"
+            suggestions = difflib.get_close_matches(instance_type, catalog.keys(), n=3)
+
+            if len(suggestions) > 0:
+                message += f" (did you mean {', '.join(suggestions)}?)"
+
+            raise AbortError(message)
+
+        return catalog[instance_type]
+
+    def check(
+        self, instance_type: str, architecture: Optional[str], hibernation: bool
+    ) -> None:
+        """Raises AbortError if the type can't be launched, before anything has been created"""
+        info = self.get(instance_type)
+
+        if architecture and architecture not in info["architectures"]:
+            raise AbortError(
+                f"Instance type {instance_type} does not support {architecture}, it supports: "
+                + ", ".join(info["architectures"])
+            )
+
+        if hibernation and not info["hibernation"]:
+            raise AbortError(
+                f"Instance type {instance_type} does not support hibernation"
+            )
+
+        self.check_vcpu_quota(instance_type)
+
+    def check_vcpu_quota(self, instance_type: str) -> None:
+        quota_code = get_quota_code(instance_type)
+
+        if quota_code is None:
+            return
+
+        limit = self.get_vcpu_quota(quota_code)
+
+        # Without a quota that can be read, leave it to RunInstances
+        if limit is None:
+            return
+
+        needed = self.get(instance_type)["vcpus"]
+        used = self.get_vcpus_used(quota_code)
+
+        if used + needed > limit:
+            raise AbortError(
+                f"Instance type {instance_type} needs {needed} vCPUs but only {max(limit - used, 0):g} of the "
+                f"{limit:g} vCPU quota for {VCPU_QUOTAS[quota_code]} instances is free, "
+                f"stop some servers or request an increase of quota {quota_code} in Service Quotas"
+            )
+
+    def get_vcpu_quota(self, quota_code: str) -> Optional[float]:
+        cached, value = self.cache.get_quota(
+            self.config.aws_profile,
+            self.config.aws_region,
+            quota_code,
+            QUOTA_TTL,
+            UNREADABLE_QUOTA_TTL,
+        )
+
+        if cached:
+            return value
+
+        try:
+            value = self._fetch_quota(quota_code)
+        except (BotoCoreError, ClientError) as err:
+            code = (
+                err.response["Error"]["Code"]
+                if isinstance(err, ClientError)
+                else type(err).__name__
+            )
+            self.log.info(f"Could not read quota {quota_code}: {code}")
+
+            # Throttling and connection errors may not happen next time
+            if code not in UNREADABLE_QUOTA_ERROR_CODES:
+                return None
+
+            value = None
+
+        self.cache.set_quota(
+            self.config.aws_profile, self.config.aws_region, quota_code, value
+        )
+
+        return value
+
+    def get_vcpus_used(self, quota_code: str) -> float:
+        """vCPUs of every running instance in the region (not only holy servers) counted by the quota"""
+        paginator = self.ec2.meta.client.get_paginator("describe_instances")
+        used = 0
+
+        for page in paginator.paginate(
+            Filters=[{"Name": "instance-state-name", "Values": ["pending", "running"]}]
+        ):
+            for reservation in page["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instance_type = instance["InstanceType"]
+
+                    if get_quota_code(instance_type) != quota_code:
+                        continue
+
+                    cpu_options = instance.get("CpuOptions")
+
+                    if cpu_options:
+                        used += cpu_options["CoreCount"] * cpu_options["ThreadsPerCore"]
+                    elif instance_type in self.get_catalog():
+                        used += self.get_catalog()[instance_type]["vcpus"]
+
+        return used
+
+    def get_hibernation_size(self, instance_type: str) -> int:
+        """Returns the extra disk space (GB) needed to hibernate an instance type"""
+        info = self.get(instance_type)
+
+        if not info["hibernation"]:
+            raise AbortError(
+                f"Instance type {instance_type} does not support hibernation"
+            )
+
+        return math.ceil(info["memory"] / 1024)
+
+    def _fetch_catalog(self) -> Dict[str, dict]:
+        self.log.info("Fetching instance types")
+        paginator = self.ec2.meta.client.get_paginator("describe_instance_types")
+        catalog = {}
+
+        for page in paginator.paginate():
+            for info in page["InstanceTypes"]:
+                catalog[info["InstanceType"]] = {
+                    "vcpus": info["VCpuInfo"]["DefaultVCpus"],
+                    "memory": info["MemoryInfo"]["SizeInMiB"],
+                    "architectures": info["ProcessorInfo"]["SupportedArchitectures"],
+                    "hibernation": info.get("HibernationSupported", False),
+                    "hypervisor": info.get("Hypervisor"),
+                }
+
+        self.cache.set_types(self.config.aws_profile, self.config.aws_region, catalog)
+        self.catalog_fetched = True
+
+        return catalog
+
+    def _fetch_quota(self, quota_code: str) -> float:
+        if self._quotas_client is None:
+            self._quotas_client = self.init_client("service-quotas")
+
+        client = self._quotas_client
+
+        try:
+            result = client.get_service_quota(ServiceCode="ec2", QuotaCode=quota_code)
+        except ClientError as err:
+            # Quotas that were never changed are only listed with their default
+            if err.response["Error"]["Code"] != "NoSuchResourceException":
+                raise
+
+            result = client.get_aws_default_service_quota(
+                ServiceCode="ec2", QuotaCode=quota_code
+            )
+
+        return result["Quota"]["Value"]
+
+
+def get_quota_code(instance_type: str) -> Optional[str]:
+    match = re.match(r"[a-z]+", instance_type)
+    family = match.group(0) if match else ""
+
+    for prefix, quota_code in FAMILY_QUOTA_CODES:
+        if family.startswith(prefix):
+            return quota_code
+
+    return None
@@ -1,10 +1,13 @@
-import os
-from typing import Optional, Tuple
+from __future__ import annotations
 
-from mypy_boto3_ec2.service_resource import KeyPair, KeyPairInfo
+import os
+from typing import TYPE_CHECKING, Optional, Tuple
 
 from .base import AWS_TAG_KEY, AWS_TAG_VALUE, BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import KeyPair, KeyPairInfo
+
 
 class KeyPairWrapper(BaseWrapper):
     """Encapsulates Amazon EC2 key pair actions."""
@@ -58,6 +61,11 @@ class KeyPairWrapper(BaseWrapper):
         if len(results) > 0:
             return results[0]
 
+    def delete(self, key_name: str) -> None:
+        self.log.debug(f"Deleting key pair {key_name}")
+        self.ec2.meta.client.delete_key_pair(KeyName=key_name)
+        self.delete_key_file(key_name)
+
     def delete_key_file(self, key_name: str) -> None:
         key_file_path = self._get_path(key_name)
 
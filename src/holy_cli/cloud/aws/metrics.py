@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+
+from holy_cli.config import Config
+
+from .base import BaseWrapper
+
+if TYPE_CHECKING:
+    from mypy_boto3_cloudwatch.client import CloudWatchClient
+    from mypy_boto3_cloudwatch.type_defs import MetricDataQueryTypeDef
+
+# Metric name and statistic of each series fetched per instance
+INSTANCE_METRICS = (
+    ("CPUUtilization", "Average"),
+    ("NetworkIn", "Sum"),
+    ("NetworkOut", "Sum"),
+    ("EBSReadBytes", "Sum"),
+    ("EBSWriteBytes", "Sum"),
+)
+
+# Instances not built on Nitro have no EBS metrics of their own, these come from each volume
+VOLUME_METRICS = {
+    "EBSReadBytes": "VolumeReadBytes",
+    "EBSWriteBytes": "VolumeWriteBytes",
+}
+
+# GetMetricData takes up to 500 queries per request
+MAX_QUERIES = 500
+
+# Basic monitoring only has a data point every 5 minutes
+MIN_PERIOD = 300
+
+# CloudWatch keeps 1 minute data for 15 days, then 5 minute data up to 63 days, then hourly
+# data, and periods reaching back further must be a multiple of what is kept
+PERIOD_RETENTION = (
+    (63 * 24 * 60 * 60, 3600),
+    (15 * 24 * 60 * 60, 300),
+)
+
+
+class MetricsWrapper(BaseWrapper):
+    """Encapsulates Amazon CloudWatch actions."""
+
+    def __init__(self, config: Config) -> None:
+        super().__init__(config)
+        self.cloudwatch: CloudWatchClient = self.init_client("cloudwatch")
+
+    def get_instance_metrics(
+        self,
+        instance_ids: Sequence[str],
+        window: int,
+        points: int,
+        volume_ids: Optional[Dict[str, List[str]]] = None,
+    ) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Fetches every metric of every instance over the last window (seconds) with batched
+        GetMetricData requests, returning about the given number of values per metric oldest first.
+        The EBS metrics of instances in volume_ids are made up of the values of their volumes instead.
+        """
+        period = get_period(window, points)
+        end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        start = end - timedelta(seconds=window)
+        volume_ids = volume_ids or {}
+        queries: List[MetricDataQueryTypeDef] = []
+        keys: Dict[str, Tuple[str, str]] = {}
+
+        def add_query(
+            key: Tuple[str, str],
+            namespace: str,
+            metric_name: str,
+            dimension: Tuple[str, str],
+            stat: str,
+        ) -> None:
+            # Query IDs must start with a lowercase letter
+            query_id = f"m{len(queries)}"
+            keys[query_id] = key
+            queries.append(
+                {
+                    "Id": query_id,
+                    "MetricStat": {
+                        "Metric": {
+                            "Namespace": namespace,
+                            "MetricName": metric_name,
+                            "Dimensions": [
+                                {"Name": dimension[0], "Value": dimension[1]}
+                            ],
+                        },
+                        "Period": period,
+                        "Stat": stat,
+                    },
+                    "ReturnData": True,
+                }
+            )
+
+        for instance_id in instance_ids:
+            for metric_name, stat in INSTANCE_METRICS:
+                if instance_id in volume_ids and metric_name in VOLUME_METRICS:
+                    continue
+
+                add_query(
+                    (instance_id, metric_name),
+                    "AWS/EC2",
+                    metric_name,
+                    ("InstanceId", instance_id),
+                    stat,
+                )
+
+            for volume_id in volume_ids.get(instance_id, []):
+                for metric_name, volume_metric_name in VOLUME_METRICS.items():
+                    add_query(
+                        (instance_id, metric_name),
+                        "AWS/EBS",
+                        volume_metric_name,
+                        ("VolumeId", volume_id),
+                        "Sum",
+                    )
+
+        results: Dict[str, Dict[str, List[float]]] = {
+            instance_id: {metric_name: [] for metric_name, _ in INSTANCE_METRICS}
+            for instance_id in instance_ids
+        }
+        paginator = self.cloudwatch.get_paginator("get_metric_data")
+
+        for offset in range(0, len(queries), MAX_QUERIES):
+            for page in paginator.paginate(
+                MetricDataQueries=queries[offset : offset + MAX_QUERIES],
+                StartTime=start,
+                EndTime=end,
+                ScanBy="TimestampAscending",
+            ):
+                for result in page["MetricDataResults"]:
+                    instance_id, metric_name = keys[result["Id"]]
+                    results[instance_id][metric_name].extend(result["Values"])
+
+        return results
+
+
+def get_period(window: int, points: int) -> int:
+    """Seconds per data point to get about the given number of points over the window"""
+    period = max(MIN_PERIOD, math.ceil(window / points / 60) * 60)
+
+    for age, multiple in PERIOD_RETENTION:
+        if window > age:
+            return math.ceil(period / multiple) * multiple
+
+    return period
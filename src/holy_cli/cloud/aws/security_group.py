@@ -1,12 +1,32 @@
-from typing import Optional, Sequence
+from __future__ import annotations
 
-from mypy_boto3_ec2.service_resource import SecurityGroup
-from mypy_boto3_ec2.type_defs import IpPermissionTypeDef
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
 
 from holy_cli.exceptions import AbortError
+from holy_cli.util import (
+    PortRange,
+    format_port_range,
+    merge_port_ranges,
+    parse_port_ranges,
+    short_hash,
+    subtract_port_ranges,
+)
 
+from . import AWS_LIVE_INSTANCE_STATES
 from .base import AWS_TAG_KEY, AWS_TAG_VALUE, BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Instance, SecurityGroup
+    from mypy_boto3_ec2.type_defs import IpPermissionTypeDef
+
+SHARED_GROUP_PREFIX = "holy-sg-shared-"
+PREFIX_LIST_NAME = "holy-allowed-ips"
+
+# Each entry counts as a rule in every group that references the list
+PREFIX_LIST_MAX_ENTRIES = 20
+
 
 class SecurityGroupWrapper(BaseWrapper):
     """Encapsulates Amazon Elastic Compute Cloud (Amazon EC2) security group actions."""
@@ -22,6 +42,15 @@ class SecurityGroupWrapper(BaseWrapper):
             self.log.debug(f"Deleting security group {sg.group_name}")
             sg.delete()
 
+        # Deleted last as it can't be removed while a group still references it
+        prefix_list = self.get_prefix_list()
+
+        if prefix_list is not None:
+            self.log.debug(f"Deleting prefix list {prefix_list['PrefixListId']}")
+            self.ec2.meta.client.delete_managed_prefix_list(
+                PrefixListId=prefix_list["PrefixListId"]
+            )
+
     def create(
         self, vpc_id: str, server_id: str, server_name: str, ports: Optional[str]
     ) -> SecurityGroup:
@@ -37,28 +66,175 @@ class SecurityGroupWrapper(BaseWrapper):
             ),
         )
 
-        ip_permissions: Sequence[IpPermissionTypeDef] = []
+        # Port 0 on its own means no ports are opened
+        port_ranges = [
+            port_range
+            for port_range in parse_port_ranges(ports)
+            if port_range != (0, 0)
+        ]
+        ip_permissions = self._get_ip_permissions(port_ranges, "tcp", "0.0.0.0/0")
 
-        if ports:
-            for port in ports.split(","):
-                port = int(port.strip())
+        if len(ip_permissions) > 0:
+            security_group.authorize_ingress(IpPermissions=ip_permissions)
 
-                if port == 0:
-                    continue
+        return security_group
 
-                ip_permissions.append(
+    def get_or_create_shared(self, vpc_id: str, ports: Optional[str]) -> SecurityGroup:
+        """
+        Servers with the same ports share one group, named by a hash of its rules, whose sources
+        come from the holy prefix list. The group is removed with the last server using it.
+        """
+        port_ranges = [
+            port_range
+            for port_range in parse_port_ranges(ports)
+            if port_range != (0, 0)
+        ]
+        rules_hash = short_hash(
+            ",".join(format_port_range(port_range) for port_range in port_ranges)
+        )
+        group_name = f"{SHARED_GROUP_PREFIX}{rules_hash}"
+
+        sg = self._get_by_name(vpc_id, group_name)
+
+        if sg is not None:
+            self.log.debug(f"Using shared security group {group_name}")
+            return sg
+
+        prefix_list_id = self.get_or_create_prefix_list()["PrefixListId"]
+        self.log.debug(f"Creating shared security group {group_name}")
+
+        try:
+            sg = self.ec2.create_security_group(
+                VpcId=vpc_id,
+                GroupName=group_name,
+                Description="Shared security group created with holy-cli",
+                TagSpecifications=self.get_tags_for_resource(
+                    "security-group", group_name, {"holy-cli:shared": rules_hash}
+                ),
+            )
+        except ClientError as err:
+            # Another server created the same group first
+            if err.response["Error"]["Code"] == "InvalidGroup.Duplicate":
+                return self._get_by_name(vpc_id, group_name)  # type: ignore
+
+            raise
+
+        if len(port_ranges) > 0:
+            sg.authorize_ingress(
+                IpPermissions=[
                     {
                         "IpProtocol": "tcp",
-                        "FromPort": port,
-                        "ToPort": port,
-                        "IpRanges": [{"CidrIp": "0.0.0.0/0"}],
+                        "FromPort": start,
+                        "ToPort": end,
+                        "PrefixListIds": [{"PrefixListId": prefix_list_id}],
                     }
-                )
+                    for start, end in port_ranges
+                ]
+            )
 
-        if len(ip_permissions) > 0:
-            security_group.authorize_ingress(IpPermissions=ip_permissions)
+        return sg
 
-        return security_group
+    def release_shared(self, group_id: str) -> bool:
+        """Deletes a shared group once no servers are using it, returns True if it was deleted"""
+        in_use = list(
+            self.ec2.instances.filter(
+                Filters=[
+                    {"Name": "instance.group-id", "Values": [group_id]},
+                    {"Name": "instance-state-name", "Values": AWS_LIVE_INSTANCE_STATES},
+                ]
+            ).limit(1)
+        )
+
+        if len(in_use) > 0:
+            return False
+
+        self.log.debug(f"Deleting shared security group {group_id}")
+        self.ec2.SecurityGroup(group_id).delete()
+
+        return True
+
+    def get_shared_group_ids(self, instance: Instance) -> List[str]:
+        return [
+            group["GroupId"]
+            for group in instance.security_groups
+            if group["GroupName"].startswith(SHARED_GROUP_PREFIX)
+        ]
+
+    def get_prefix_list(self) -> Optional[dict]:
+        results = self.ec2.meta.client.describe_managed_prefix_lists(
+            Filters=[{"Name": "prefix-list-name", "Values": [PREFIX_LIST_NAME]}]
+        )["PrefixLists"]
+
+        if len(results) > 0:
+            return results[0]  # type: ignore
+
+    def get_or_create_prefix_list(self) -> dict:
+        prefix_list = self.get_prefix_list()
+
+        if prefix_list is not None:
+            return prefix_list
+
+        # Open to the world until the allowlist is changed, the same as a server's own group
+        self.log.debug(f"Creating prefix list {PREFIX_LIST_NAME}")
+        response = self.ec2.meta.client.create_managed_prefix_list(
+            PrefixListName=PREFIX_LIST_NAME,
+            AddressFamily="IPv4",
+            MaxEntries=PREFIX_LIST_MAX_ENTRIES,
+            Entries=[{"Cidr": "0.0.0.0/0", "Description": "Anyone"}],
+            TagSpecifications=self.get_tags_for_resource(
+                "prefix-list", PREFIX_LIST_NAME
+            ),
+        )
+
+        return response["PrefixList"]  # type: ignore
+
+    def get_allowed_ips(self, prefix_list: Optional[dict] = None) -> List[str]:
+        if prefix_list is None:
+            prefix_list = self.get_prefix_list()
+
+        if prefix_list is None:
+            return []
+
+        paginator = self.ec2.meta.client.get_paginator(
+            "get_managed_prefix_list_entries"
+        )
+
+        return [
+            entry["Cidr"]
+            for page in paginator.paginate(PrefixListId=prefix_list["PrefixListId"])
+            for entry in page["Entries"]
+        ]
+
+    def change_allowed_ips(self, add: List[str], remove: List[str]) -> List[str]:
+        """Updates the sources for every shared group with a single call, returns the new list"""
+        prefix_list = self.get_or_create_prefix_list()
+        current = self.get_allowed_ips(prefix_list)
+
+        add = [self._get_cidr(ip) for ip in add]
+        remove = [self._get_cidr(ip) for ip in remove]
+        to_add = [cidr for cidr in add if cidr not in current]
+        to_remove = [cidr for cidr in remove if cidr in current and cidr not in add]
+
+        if len(to_add) == 0 and len(to_remove) == 0:
+            return current
+
+        if len(current) + len(to_add) - len(to_remove) > PREFIX_LIST_MAX_ENTRIES:
+            raise AbortError(
+                f"The allowlist can hold at most {PREFIX_LIST_MAX_ENTRIES} entries"
+            )
+
+        self.ec2.meta.client.modify_managed_prefix_list(
+            PrefixListId=prefix_list["PrefixListId"],
+            CurrentVersion=prefix_list["Version"],
+            AddEntries=[{"Cidr": cidr} for cidr in to_add],
+            RemoveEntries=[{"Cidr": cidr} for cidr in to_remove],
+        )
+
+        return [cidr for cidr in current if cidr not in to_remove] + to_add
+
+    def delete(self, group_id: str) -> None:
+        self.log.debug(f"Deleting security group {group_id}")
+        self.ec2.SecurityGroup(group_id).delete()
 
     def get_by_server_id(self, server_id: str) -> Optional[SecurityGroup]:
         results = list(
@@ -70,31 +246,93 @@ class SecurityGroupWrapper(BaseWrapper):
         if len(results) > 0:
             return results[0]
 
-    def change_port(
-        self, server_id: str, port: int, action: str, ip_source: Optional[str]
-    ) -> None:
-        sg = self.get_by_server_id(server_id)
-
-        if sg is None:
-            raise AbortError("Could not find security group")
-
-        if ip_source is None:
-            ip_source = "0.0.0.0/0"
-        elif "/" not in ip_source:
-            ip_source = f"{ip_source}/32"
-
-        for perm in list(sg.ip_permissions):
-            if perm["FromPort"] == port:
-                for ip_range in perm["IpRanges"]:
-                    if ip_range["CidrIp"] == ip_source:
-                        sg.revoke_ingress(
-                            CidrIp=ip_range["CidrIp"],
-                            FromPort=perm["FromPort"],
-                            ToPort=perm["ToPort"],
-                            IpProtocol="tcp",
-                        )
-
-        if action == "open":
+    def change_ports(
+        self,
+        sg: SecurityGroup,
+        open_ranges: List[PortRange],
+        close_ranges: List[PortRange],
+        protocol: str,
+        ip_source: Optional[str],
+    ) -> Tuple[List[PortRange], List[PortRange]]:
+        """
+        Applies the difference from the current rules with at most one revoke and one authorize call,
+        returning the ranges opened and the parts of open rules that were closed
+        """
+        ip_source = self._get_cidr(ip_source or "0.0.0.0/0")
+
+        current = [
+            (perm["FromPort"], perm["ToPort"])
+            for perm in list(sg.ip_permissions)
+            if perm["IpProtocol"] == protocol
+            and any(ip_range["CidrIp"] == ip_source for ip_range in perm["IpRanges"])
+        ]
+        to_close: List[PortRange] = []
+        to_open: List[PortRange] = []
+        closed: List[PortRange] = []
+
+        # A rule partly inside a range to close is replaced by the parts left open
+        for port_range in current:
+            remaining = subtract_port_ranges(port_range, close_ranges)
+
+            if remaining == [port_range]:
+                continue
+
+            to_close.append(port_range)
+            to_open.extend(remaining)
+            closed.extend(
+                (max(port_range[0], start), min(port_range[1], end))
+                for start, end in close_ranges
+                if start <= port_range[1] and port_range[0] <= end
+            )
+
+        kept = [port_range for port_range in current if port_range not in to_close]
+        opened = [
+            port_range
+            for port_range in open_ranges
+            if port_range not in kept and port_range not in to_open
+        ]
+        to_open = sorted(
+            {port_range for port_range in to_open + opened if port_range not in kept}
+        )
+
+        if len(to_close) > 0:
+            sg.revoke_ingress(
+                IpPermissions=self._get_ip_permissions(to_close, protocol, ip_source)
+            )
+
+        if len(to_open) > 0:
             sg.authorize_ingress(
-                CidrIp=ip_source, FromPort=port, ToPort=port, IpProtocol="tcp"
+                IpPermissions=self._get_ip_permissions(to_open, protocol, ip_source)
+            )
+
+        # Overlapping ranges to close can cover the same part of a rule more than once
+        return opened, merge_port_ranges(closed)
+
+    def _get_by_name(self, vpc_id: str, group_name: str) -> Optional[SecurityGroup]:
+        results = list(
+            self.ec2.security_groups.filter(
+                Filters=[
+                    {"Name": "vpc-id", "Values": [vpc_id]},
+                    {"Name": "group-name", "Values": [group_name]},
+                ]
             )
+        )
+
+        if len(results) > 0:
+            return results[0]
+
+    def _get_cidr(self, ip: str) -> str:
+        return ip if "/" in ip else f"{ip}/32"
+
+    def _get_ip_permissions(
+        self, port_ranges: List[PortRange], protocol: str, ip_source: str
+    ) -> List[IpPermissionTypeDef]:
+        return [
+            {
+                "IpProtocol": protocol,
+                "FromPort": start,
+                "ToPort": end,
+                "IpRanges": [{"CidrIp": ip_source}],
+            }
+            for start, end in port_ranges
+        ]
@@ -1,15 +1,150 @@
+from __future__ import annotations
+
+import gzip
+import json
 import os
 import platform
+import shlex
 import subprocess
 import sys
-from typing import Optional
-
-from mypy_boto3_ec2.service_resource import Instance
+import tarfile
+import tempfile
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Sequence
 
+from holy_cli.config import GlobalConfig
 from holy_cli.exceptions import AbortError
 
 from .base import AWS_OS_USER_MAPPING, BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Instance
+
+# How long an idle master connection is kept open for later connections to reuse
+SSH_CONTROL_PERSIST = "10m"
+
+SSH_CONFIG_HEADER = "# Generated by holy-cli, changes will be overwritten"
+
+
+def get_multiplexing_options(global_config: GlobalConfig) -> List[str]:
+    # Windows OpenSSH does not support connection multiplexing
+    if sys.platform == "win32":
+        return []
+
+    # %C is a hash of the connection details, keeping the socket path short
+    control_path = os.path.join(global_config.sockets_dir, "%C")
+
+    return [
+        "ControlMaster=auto",
+        f"ControlPath={control_path}",
+        f"ControlPersist={SSH_CONTROL_PERSIST}",
+    ]
+
+
+class SSHConfigFile:
+    """Manages the holy SSH config file (~/.holy/ssh_config), one entry per server."""
+
+    def __init__(self, global_config: GlobalConfig) -> None:
+        self.global_config = global_config
+        self.hosts = self._load_hosts()
+
+    def save(
+        self, server_id: str, name: str, user: str, host: str, key_file_path: str
+    ) -> None:
+        self.hosts[server_id] = {
+            "name": name,
+            "user": user,
+            "host": host,
+            "key": key_file_path,
+        }
+        self._write()
+        self._add_include()
+
+    def refresh(self, hosts: Dict[str, Optional[str]]) -> None:
+        """Update saved entries with new public IPs, a value of None removes the entry"""
+        changed = False
+
+        for server_id, host in hosts.items():
+            if server_id not in self.hosts:
+                continue
+
+            if host is None:
+                del self.hosts[server_id]
+                changed = True
+            elif self.hosts[server_id]["host"] != host:
+                self.hosts[server_id]["host"] = host
+                changed = True
+
+        if changed:
+            self._write()
+
+    def remove(self, server_id: str) -> None:
+        self.refresh({server_id: None})
+
+    def clear(self) -> None:
+        self.refresh(dict.fromkeys(self.hosts))
+
+    def has(self, server_id: str) -> bool:
+        return server_id in self.hosts
+
+    def render(self) -> str:
+        contents = SSH_CONFIG_HEADER + "\n"
+        options = get_multiplexing_options(self.global_config)
+
+        for entry in sorted(self.hosts.values(), key=lambda entry: entry["name"]):
+            contents += f"\nHost {entry['name']}\n\tUser {entry['user']}\n\tHostName {entry['host']}\n\tIdentityFile {entry['key']}\n"
+
+            for option in options:
+                key, value = option.split("=", 1)
+                contents += f"\t{key} {value}\n"
+
+        return contents
+
+    def _load_hosts(self) -> Dict[str, dict]:
+        try:
+            with open(self.global_config.ssh_hosts_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self) -> None:
+        self._write_atomic(
+            self.global_config.ssh_hosts_file, json.dumps(self.hosts, indent=2)
+        )
+        self._write_atomic(self.global_config.ssh_config_file, self.render())
+
+    def _write_atomic(self, path: str, contents: str) -> None:
+        # Write to a temporary file and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(contents)
+
+            os.replace(tmp_path, path)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def _add_include(self) -> None:
+        ssh_dir = os.path.expanduser("~/.ssh")
+        ssh_config_file_path = os.path.join(ssh_dir, "config")
+        include_line = f"Include {self.global_config.ssh_config_file}"
+        contents = ""
+
+        if not os.path.isdir(ssh_dir):
+            os.mkdir(ssh_dir, 0o700)
+
+        if os.path.exists(ssh_config_file_path):
+            with open(ssh_config_file_path, "r") as f:
+                contents = f.read()
+
+            if include_line in [line.strip() for line in contents.splitlines()]:
+                return
+
+        # Include must come before any Host block, otherwise it only applies to that host
+        with open(ssh_config_file_path, "w") as f:
+            f.write(f"{include_line}\n\n{contents}")
+
 
 class SSHWrapper(BaseWrapper):
     def ssh_into_instance(
@@ -67,11 +202,155 @@ class SSHWrapper(BaseWrapper):
         user = username or self._get_instance_username(instance)
         host = instance.public_ip_address
         name = self.get_tag_value(instance.tags, "Name")
-        ssh_config_file_path = os.path.expanduser("~/.ssh/config")
-        ssh_contents = f"\nHost {name}\n\tUser {user}\n\tHostName {host}\n\tIdentityFile {key_file_path}"
+        server_id = self.get_tag_value(instance.tags, "holy-cli:server")
+
+        ssh_config = SSHConfigFile(self.config.global_config)
+        ssh_config.save(server_id, name, user, host, key_file_path)  # type: ignore
+
+    def get_ssh_cmd(
+        self, instance: Instance, key_file_path: str, username: Optional[str]
+    ) -> List[str]:
+        if instance.state["Name"] != "running":
+            raise AbortError("Server is not running")
+
+        if not os.path.exists(key_file_path):
+            raise AbortError(
+                f"Key file is missing, you may need to re-create the server"
+            )
+
+        user = username or self._get_instance_username(instance)
 
-        with open(ssh_config_file_path, "a") as f:
-            f.write(ssh_contents)
+        return self._get_ssh_cmd(key_file_path, user, instance.public_ip_address)
+
+    def run_command(
+        self,
+        instance: Instance,
+        key_file_path: str,
+        username: Optional[str],
+        command: str,
+        output: Callable[[str], None],
+    ) -> int:
+        """Run a command on the server, passing each line of output to the callback and returning the exit code"""
+        if instance.state["Name"] != "running":
+            raise AbortError("Server is not running")
+
+        if not os.path.exists(key_file_path):
+            raise AbortError(
+                f"Key file is missing, you may need to re-create the server"
+            )
+
+        user = username or self._get_instance_username(instance)
+        cmd = self._get_ssh_cmd(key_file_path, user, instance.public_ip_address)
+
+        # Never prompt for input, there is no terminal when running on several servers at once
+        cmd[1:1] = ["-T", "-o", "BatchMode=yes"]
+        cmd.append(command)
+
+        self.log.debug(f"Running SSH command: {' '.join(cmd)}")
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+
+        for line in process.stdout:  # type: ignore
+            output(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+
+        return process.wait()
+
+    def send_files(
+        self,
+        instance: Instance,
+        key_file_path: str,
+        username: Optional[str],
+        local_dir: str,
+        remote_dir: str,
+        changed: Sequence[str],
+        deleted: Sequence[str],
+    ) -> List[str]:
+        """
+        Send changed files as one compressed tar stream and remove deleted files, over a single SSH connection.
+        Returns the changed files that were removed locally before they could be sent.
+        """
+        if instance.state["Name"] != "running":
+            raise AbortError("Server is not running")
+
+        if not os.path.exists(key_file_path):
+            raise AbortError(
+                f"Key file is missing, you may need to re-create the server"
+            )
+
+        remote = self._quote_remote_path(remote_dir)
+        command = f"mkdir -p {remote} && cd {remote}"
+
+        # The deleted paths could be too many for a command line, they are sent ahead of the tar
+        # stream instead and head reads exactly their length
+        removals = b"".join(path.encode("utf-8") + b"\0" for path in deleted)
+
+        if len(removals) > 0:
+            command += f" && head -c {len(removals)} | xargs -0 rm -f --"
+
+        command += " && tar -xzf -"
+
+        user = username or self._get_instance_username(instance)
+        cmd = self._get_ssh_cmd(key_file_path, user, instance.public_ip_address)
+        cmd[1:1] = ["-T", "-o", "BatchMode=yes"]
+        cmd.append(command)
+
+        self.log.debug(f"Running SSH command: {' '.join(cmd)}")
+        missing: List[str] = []
+
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr,
+            )
+
+            try:
+                process.stdin.write(removals)  # type: ignore
+
+                # Favour speed over size, the bottleneck is usually reading files
+                with gzip.GzipFile(
+                    fileobj=process.stdin, mode="wb", compresslevel=1
+                ) as stream:
+                    with tarfile.open(fileobj=stream, mode="w|") as tar:
+                        for rel_path in changed:
+                            # Editors saving through temporary files often remove them straight away
+                            try:
+                                tar.add(
+                                    os.path.join(local_dir, rel_path),
+                                    arcname=rel_path,
+                                    recursive=False,
+                                )
+                            except FileNotFoundError:
+                                missing.append(rel_path)
+            except BrokenPipeError:
+                pass
+            finally:
+                process.stdin.close()  # type: ignore
+
+            returncode = process.wait()
+            stderr.seek(0)
+            err = stderr.read().decode("utf-8", errors="replace")
+
+        if returncode:
+            self.log.error(f"SSH error response: {err}")
+            raise AbortError(f"Could not sync files to server: {err.strip()}")
+
+        return missing
+
+    def _quote_remote_path(self, path: str) -> str:
+        # Keep ~ expanding to the home directory while quoting the rest of the path
+        if path == "~":
+            return '"$HOME"'
+
+        if path.startswith("~/"):
+            return '"$HOME"/' + shlex.quote(path[2:])
+
+        return shlex.quote(path)
 
     def _get_instance_username(self, instance: Instance) -> str:
         os = self.get_tag_value(instance.tags, "holy-cli:os")
@@ -90,6 +369,12 @@ class SSHWrapper(BaseWrapper):
     def _run_ssh_cmd(
         self, key_path: str, user: str, host: str
     ) -> subprocess.CompletedProcess:
+        cmd = self._get_ssh_cmd(key_path, user, host)
+
+        self.log.debug(f"Trying SSH command: {' '.join(cmd)}")
+        return subprocess.run(cmd, stderr=subprocess.PIPE)
+
+    def _get_ssh_cmd(self, key_path: str, user: str, host: str) -> List[str]:
         cmd = [
             self._get_ssh_path(),
             "-i",
@@ -100,11 +385,14 @@ class SSHWrapper(BaseWrapper):
             "UserKnownHostsFile=/dev/null",
             "-o",
             "LogLevel=ERROR",
-            f"{user}@{host}",
         ]
 
-        self.log.debug(f"Trying SSH command: {' '.join(cmd)}")
-        return subprocess.run(cmd, stderr=subprocess.PIPE)
+        for option in get_multiplexing_options(self.config.global_config):
+            cmd += ["-o", option]
+
+        cmd.append(f"{user}@{host}")
+
+        return cmd
 
     def _get_ssh_path(self) -> str:
         if sys.platform == "win32":
@@ -1,9 +1,12 @@
-from typing import Optional
+from __future__ import annotations
 
-from mypy_boto3_ec2.service_resource import Subnet, Vpc
+from typing import TYPE_CHECKING, List, Optional
 
 from .base import AWS_TAG_KEY, AWS_TAG_VALUE, BaseWrapper
 
+if TYPE_CHECKING:
+    from mypy_boto3_ec2.service_resource import Subnet, Vpc
+
 
 class VPCWrapper(BaseWrapper):
     """Encapsulates Amazon EC2 VPC actions."""
@@ -36,6 +39,16 @@ class VPCWrapper(BaseWrapper):
         if len(results) > 0:
             return results[0]
 
+    def get_subnets(
+        self, vpc: Vpc, preferred_zone: Optional[str] = None
+    ) -> List[Subnet]:
+        """Subnets in availability zone order, starting with the preferred zone"""
+        subnets = sorted(vpc.subnets.all(), key=lambda subnet: subnet.availability_zone)
+
+        return sorted(
+            subnets, key=lambda subnet: subnet.availability_zone != preferred_zone
+        )
+
     def get_subnet_by_id(self, subnet_id: str) -> Optional[Subnet]:
         results = list(self.ec2.subnets.filter(SubnetIds=[subnet_id]))
 
@@ -68,21 +81,33 @@ class VPCWrapper(BaseWrapper):
         vpc.modify_attribute(EnableDnsHostnames={"Value": True})
         self.log.debug("Enabled DNS hostnames on VPC")
 
-        # Create Public Subnet
-        subnet = vpc.create_subnet(
-            CidrBlock=vpc_cidr_block,
-            TagSpecifications=self.get_tags_for_resource("subnet", "holy-subnet"),
-        )
-        self.log.debug(f"Public Subnet {subnet.id} created")
+        # Create a public /20 subnet in each availability zone (a /16 holds 16 of them)
+        zones = self.ec2.meta.client.describe_availability_zones(
+            Filters=[
+                {"Name": "state", "Values": ["available"]},
+                {"Name": "zone-type", "Values": ["availability-zone"]},
+            ]
+        )["AvailabilityZones"]
+        zone_names = sorted(zone["ZoneName"] for zone in zones)[:16]
+
+        for index, zone_name in enumerate(zone_names):
+            subnet = vpc.create_subnet(
+                CidrBlock=f"10.0.{index * 16}.0/20",
+                AvailabilityZone=zone_name,
+                TagSpecifications=self.get_tags_for_resource(
+                    "subnet", f"holy-subnet-{zone_name}"
+                ),
+            )
+            self.log.debug(f"Public Subnet {subnet.id} created in {zone_name}")
 
-        # Add route to Internet Gateway
+            # Modify Subnet to enable auto-assign public IPv4 addresses
+            # https://github.com/boto/boto3/issues/276
+            subnet.meta.client.modify_subnet_attribute(SubnetId=subnet.id, MapPublicIpOnLaunch={"Value": True})  # type: ignore
+            self.log.debug("Public IP auto-assign enabled for Subnet")
+
+        # Add route to Internet Gateway, the main route table applies to every subnet
         route_tables = list(vpc.route_tables.all())
         route_tables[0].create_route(DestinationCidrBlock="0.0.0.0/0", GatewayId=igw.id)
         self.log.debug("Added route to Internet Gateway")
 
-        # Modify Subnet to enable auto-assign public IPv4 addresses
-        # https://github.com/boto/boto3/issues/276
-        subnet.meta.client.modify_subnet_attribute(SubnetId=subnet.id, MapPublicIpOnLaunch={"Value": True})  # type: ignore
-        self.log.debug("Public IP auto-assign enabled for Subnet")
-
         return vpc
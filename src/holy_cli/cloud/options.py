@@ -1,10 +1,19 @@
 from __future__ import annotations
 
-from typing import Optional
+import inspect
+from typing import List, Optional, Sequence
 
-from holy_cli.cloud.aws import AWS_ARCHITECTURE_VALUES, AWS_OS_USER_MAPPING
+from holy_cli.cloud.aws import (
+    AWS_ARCHITECTURE_VALUES,
+    AWS_GP3_BASELINE_IOPS,
+    AWS_GP3_THROUGHPUT_PER_IOPS,
+    AWS_INSTANCE_STATES,
+    AWS_OS_USER_MAPPING,
+    AWS_VOLUME_LIMITS,
+    AWS_VOLUME_TYPES,
+)
 from holy_cli.exceptions import AbortError
-from holy_cli.util import get_random_name, hash_server_name
+from holy_cli.util import get_random_name, hash_server_name, parse_port_ranges
 
 
 class ServerDTO:
@@ -13,6 +22,54 @@ class ServerDTO:
         self.id = hash_server_name(self.name.lower())
 
 
+class ListServersOptions:
+    """Filters for listing servers, these are applied by EC2 rather than after fetching every server"""
+
+    def __init__(
+        self,
+        states: Sequence[str] = (),
+        name: Optional[str] = None,
+        os: Optional[str] = None,
+        type: Optional[str] = None,
+        availability_zone: Optional[str] = None,
+    ) -> None:
+        self.states = list(states)
+        self.name = name
+        self.os = os
+        self.type = type
+        self.availability_zone = availability_zone
+
+    def has_filters(self) -> bool:
+        return any((self.states, self.name, self.os, self.type, self.availability_zone))
+
+    @classmethod
+    def load_from_cli(cls, **kwargs) -> ListServersOptions:
+        states: List[str] = []
+
+        if kwargs.get("state"):
+            if kwargs.get("running"):
+                raise AbortError("The --running and --state options cannot be combined")
+
+            states = [state.strip() for state in kwargs["state"].split(",")]
+
+            for state in states:
+                if state not in AWS_INSTANCE_STATES:
+                    raise AbortError(
+                        "Invalid state value, must be one of: "
+                        + ", ".join(AWS_INSTANCE_STATES)
+                    )
+        elif kwargs.get("running"):
+            states = ["running"]
+
+        return cls(
+            states=states,
+            name=kwargs.get("name"),
+            os=kwargs.get("os"),
+            type=kwargs.get("type"),
+            availability_zone=kwargs.get("az"),
+        )
+
+
 class CreateServerOptions(ServerDTO):
     def __init__(
         self,
@@ -27,6 +84,11 @@ class CreateServerOptions(ServerDTO):
         script_file: Optional[str],
         iam_profile: Optional[str],
         subnet_id: Optional[str],
+        hibernation: bool = False,
+        shared_sg: bool = False,
+        disk_type: str = "gp3",
+        iops: Optional[int] = None,
+        throughput: Optional[int] = None,
     ) -> None:
         super().__init__(name)
         self.os = os
@@ -39,6 +101,59 @@ class CreateServerOptions(ServerDTO):
         self.script_file = script_file
         self.iam_profile = iam_profile
         self.subnet_id = subnet_id
+        self.hibernation = hibernation
+        self.shared_sg = shared_sg
+        self.disk_type = disk_type
+        self.iops = iops
+        self.throughput = throughput
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "os": self.os,
+            "architecture": self.architecture,
+            "image_id": self.image_id,
+            "type": self.type,
+            "disk_size": self.disk_size,
+            "ports": self.ports,
+            "actions": self.actions,
+            "script_file": self.script_file,
+            "iam_profile": self.iam_profile,
+            "subnet_id": self.subnet_id,
+            "hibernation": self.hibernation,
+            "shared_sg": self.shared_sg,
+            "disk_type": self.disk_type,
+            "iops": self.iops,
+            "throughput": self.throughput,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> CreateServerOptions:
+        parameters = list(inspect.signature(cls.__init__).parameters.values())[1:]
+        names = {parameter.name for parameter in parameters}
+        required = {
+            parameter.name
+            for parameter in parameters
+            if parameter.default is inspect.Parameter.empty
+        }
+        unknown = sorted(set(data) - names)
+        missing = sorted(required - set(data))
+
+        # The journal may have been edited by hand or written by another version
+        if unknown or missing:
+            problems = []
+
+            if unknown:
+                problems.append(f"unknown {', '.join(unknown)}")
+
+            if missing:
+                problems.append(f"missing {', '.join(missing)}")
+
+            raise AbortError(
+                f"Saved create options are invalid ({'; '.join(problems)}), run again with --rollback to undo it"
+            )
+
+        return cls(**data)
 
     @classmethod
     def load_from_cli(cls, **kwargs) -> CreateServerOptions:
@@ -63,6 +178,15 @@ class CreateServerOptions(ServerDTO):
             os = None
             architecture = None
 
+        # Check the ports and disk before anything is created
+        parse_port_ranges(kwargs.get("ports"))
+        check_disk_options(
+            kwargs.get("disk_type") or "gp3",
+            int(kwargs["disk_size"]),
+            kwargs.get("iops"),
+            kwargs.get("throughput"),
+        )
+
         return cls(
             name=(kwargs.get("name") or get_random_name()),
             os=os,
@@ -75,4 +199,49 @@ class CreateServerOptions(ServerDTO):
             script_file=kwargs.get("script"),
             iam_profile=kwargs.get("iam_profile"),
             subnet_id=kwargs.get("subnet_id"),
+            hibernation=bool(kwargs.get("hibernation")),
+            shared_sg=bool(kwargs.get("shared_sg")),
+            disk_type=kwargs.get("disk_type") or "gp3",
+            iops=kwargs.get("iops"),
+            throughput=kwargs.get("throughput"),
+        )
+
+
+def check_disk_options(
+    disk_type: str, size: int, iops: Optional[int], throughput: Optional[int]
+) -> None:
+    """Raises AbortError if EC2 would reject the volume, see the limits in AWS_VOLUME_LIMITS"""
+    if disk_type not in AWS_VOLUME_TYPES:
+        raise AbortError(
+            "Invalid disk type, must be one of: " + ", ".join(AWS_VOLUME_TYPES)
         )
+
+    limits = AWS_VOLUME_LIMITS[disk_type]
+
+    if iops is None:
+        if disk_type == "io2":
+            raise AbortError("IOPS must be set for io2 disks (--iops)")
+    else:
+        # The IOPS per GB ratio only limits IOPS above the minimum, which any size can have
+        min_iops, max_iops = limits["iops"]
+        max_iops = max(min_iops, min(max_iops, size * limits["iops_per_gb"]))
+
+        if not (min_iops <= iops <= max_iops):
+            raise AbortError(
+                f"IOPS for a {size}GB {disk_type} disk must be between {min_iops} and {max_iops}"
+            )
+
+    if throughput is not None:
+        if limits["throughput"] is None:
+            raise AbortError(f"Throughput can't be set for {disk_type} disks")
+
+        min_throughput, max_throughput = limits["throughput"]
+        max_throughput = min(
+            max_throughput,
+            int((iops or AWS_GP3_BASELINE_IOPS) * AWS_GP3_THROUGHPUT_PER_IOPS),
+        )
+
+        if not (min_throughput <= throughput <= max_throughput):
+            raise AbortError(
+                f"Throughput for a {disk_type} disk with {iops or AWS_GP3_BASELINE_IOPS} IOPS must be between {min_throughput} and {max_throughput} MiB/s"
+            )
@@ -0,0 +1,30 @@
+import time
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from boto3 import Session
+
+
+class CloudProvider(ABC):
+    """Supplies the boto3 sessions used by the AWS wrappers, swap it out to run them against something other than AWS"""
+
+    @abstractmethod
+    def create_session(
+        self, region: Optional[str], profile: Optional[str]
+    ) -> "Session":
+        pass
+
+    def sleep(self, seconds: float) -> None:
+        """Waits for AWS to catch up (rate limits, propagation, polling)"""
+        time.sleep(seconds)
+
+
+class AWSProvider(CloudProvider):
+    def create_session(
+        self, region: Optional[str], profile: Optional[str]
+    ) -> "Session":
+        # Imported here as boto3 is slow to load and not needed for shell completion
+        from boto3 import Session
+
+        return Session(region_name=region, profile_name=profile)
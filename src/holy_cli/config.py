@@ -1,6 +1,7 @@
 import os
 from typing import Optional
 
+from .cloud.provider import AWSProvider, CloudProvider
 from .exceptions import AbortError
 
 
@@ -8,21 +9,46 @@ class GlobalConfig:
     def __init__(self) -> None:
         self.root_dir = os.path.expanduser("~/.holy")
         self.keys_dir = os.path.join(self.root_dir, "keys")
+        self.sockets_dir = os.path.join(self.root_dir, "sockets")
+        self.sync_dir = os.path.join(self.root_dir, "sync")
+        self.tunnels_dir = os.path.join(self.root_dir, "tunnels")
+        self.cache_dir = os.path.join(self.root_dir, "cache")
+        self.journal_dir = os.path.join(self.root_dir, "journal")
+        self.names_cache_file = os.path.join(self.cache_dir, "names.json")
+        self.placement_cache_file = os.path.join(self.cache_dir, "placement.json")
+        self.instance_types_cache_file = os.path.join(
+            self.cache_dir, "instance_types.json"
+        )
+        self.ssh_config_file = os.path.join(self.root_dir, "ssh_config")
+        self.ssh_hosts_file = os.path.join(self.root_dir, "ssh_hosts.json")
         self._check_root_dir()
 
     def _check_root_dir(self):
-        if not os.path.isdir(self.root_dir):
-            try:
-                os.mkdir(self.root_dir)
-                os.mkdir(self.keys_dir)
-            except:
-                raise AbortError(f"Could not create directory: {self.root_dir}")
+        for dir in (
+            self.root_dir,
+            self.keys_dir,
+            self.sockets_dir,
+            self.sync_dir,
+            self.tunnels_dir,
+            self.cache_dir,
+            self.journal_dir,
+        ):
+            if not os.path.isdir(dir):
+                try:
+                    os.mkdir(dir, 0o700)
+                except:
+                    raise AbortError(f"Could not create directory: {dir}")
 
 
 class Config:
     def __init__(
-        self, global_config: GlobalConfig, region: Optional[str], profile: Optional[str]
+        self,
+        global_config: GlobalConfig,
+        region: Optional[str],
+        profile: Optional[str],
+        provider: Optional[CloudProvider] = None,
     ) -> None:
         self.global_config = global_config
         self.aws_region = region
         self.aws_profile = profile
+        self.provider = provider or AWSProvider()
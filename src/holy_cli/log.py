@@ -1,7 +1,5 @@
 import logging
 
-import boto3
-
 
 class ColorPercentStyle(logging.PercentStyle):
     grey = "38"
@@ -38,7 +36,7 @@ def getLogger() -> logging.Logger:
     logger = logging.getLogger("holy-cli")
 
     if not logger.hasHandlers():
-        logger.addHandler(boto3.NullHandler())
+        logger.addHandler(logging.NullHandler())
 
     return logger
 
@@ -54,4 +52,7 @@ def setLoggerToStream() -> None:
     stream.setFormatter(formatter)
     logger.addHandler(stream)
 
+    # Imported here as boto3 is slow to load and not needed for every command
+    import boto3
+
     boto3.set_stream_logger("boto3.resources", logging.DEBUG, format_string)
@@ -0,0 +1,50 @@
+from typing import Callable, ContextManager, Optional, Protocol
+
+
+class Progress(Protocol):
+    """What actions report their steps through, the same methods as a yaspin spinner"""
+
+    def write(self, text: str) -> None: ...
+
+    def ok(self, text: str = "") -> None: ...
+
+    def fail(self, text: str = "") -> None: ...
+
+
+# Starts reporting a long running action, given its description
+ProgressFactory = Callable[[str], ContextManager[Progress]]
+
+
+class CallbackProgress:
+    """Passes each step to a callback, or does nothing without one"""
+
+    def __init__(self, text: str, callback: Optional[Callable[[str], None]]) -> None:
+        self.text = text
+        self.callback = callback
+
+    def __enter__(self) -> "CallbackProgress":
+        self._send(self.text)
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def write(self, text: str) -> None:
+        # Steps are written as "> Created key pair" for the spinner
+        self._send(text[2:] if text.startswith("> ") else text)
+
+    def ok(self, text: str = "") -> None:
+        pass
+
+    def fail(self, text: str = "") -> None:
+        pass
+
+    def _send(self, text: str) -> None:
+        if self.callback is not None:
+            self.callback(text)
+
+
+def spinner_progress(text: str) -> ContextManager[Progress]:
+    from yaspin import yaspin
+
+    return yaspin(text=text, color="yellow")
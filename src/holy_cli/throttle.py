@@ -0,0 +1,186 @@
+import threading
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from .exceptions import AbortError
+
+if TYPE_CHECKING:
+    from boto3 import Session
+    from botocore.config import Config
+
+# Calls per second and burst size for each service, kept under the default account limits
+DEFAULT_RATES = {
+    "ec2": (20.0, 100),
+    "iam": (10.0, 20),
+    "ssm": (40.0, 40),
+}
+DEFAULT_RATE = (10.0, 20)
+
+# Retries use botocore's adaptive mode, which also slows down a client after being throttled
+MAX_ATTEMPTS = 10
+
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, sleep: Callable[[float], None] = time.sleep) -> float:
+        """Takes a token, sleeping until one is free, and returns the seconds waited"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            # Reserve the token now so threads are served in the order they arrive
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            sleep(wait)
+
+        return wait
+
+
+class RateLimiter:
+    """Limits AWS API calls per service across every session and thread, counting waits, retries and throttles."""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None) -> None:
+        self.rates = rates or {}
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.counters: Dict[str, Dict[str, float]] = {}
+        self.lock = threading.Lock()
+
+    def register(
+        self, session: "Session", sleep: Callable[[float], None] = time.sleep
+    ) -> None:
+        # Registered first so the wait happens before any other handler, including the API tracer
+        session.events.register_first(
+            "before-call.*.*", partial(self._before_call, sleep=sleep)
+        )
+        session.events.register("after-call.*.*", self._after_call)
+
+    def summary(self) -> List[dict]:
+        with self.lock:
+            return [
+                {
+                    "Service": service,
+                    "Rate (/s)": self.buckets[service].rate,
+                    "Calls": int(counters["calls"]),
+                    "Waited (ms)": round(counters["waited"] * 1000, 1),
+                    "Retries": int(counters["retries"]),
+                    "Throttled": int(counters["throttled"]),
+                }
+                for service, counters in sorted(self.counters.items())
+            ]
+
+    def get_count(self, service: str, name: str) -> float:
+        with self.lock:
+            return self.counters.get(service, {}).get(name, 0)
+
+    def _get_bucket(self, service: str) -> TokenBucket:
+        with self.lock:
+            if service not in self.buckets:
+                rate, burst = DEFAULT_RATES.get(service, DEFAULT_RATE)
+
+                if service in self.rates:
+                    rate = self.rates[service]
+                    burst = max(int(rate), 1)
+
+                self.buckets[service] = TokenBucket(rate, burst)
+                self.counters[service] = {
+                    "calls": 0,
+                    "waited": 0.0,
+                    "retries": 0,
+                    "throttled": 0,
+                }
+
+            return self.buckets[service]
+
+    def _before_call(self, model, sleep: Callable[[float], None], **kwargs) -> None:
+        service = model.service_model.service_name
+        waited = self._get_bucket(service).acquire(sleep)
+
+        with self.lock:
+            self.counters[service]["calls"] += 1
+            self.counters[service]["waited"] += waited
+
+    def _after_call(self, parsed, model, **kwargs) -> None:
+        service = model.service_model.service_name
+
+        with self.lock:
+            counters = self.counters.get(service)
+
+            if counters is None:
+                return
+
+            counters["retries"] += parsed.get("ResponseMetadata", {}).get(
+                "RetryAttempts", 0
+            )
+
+            # Only counts calls that still failed after every retry
+            if parsed.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+                counters["throttled"] += 1
+
+
+def parse_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse per service rates, e.g. ec2=50,iam=5"""
+    rates: Dict[str, float] = {}
+
+    for part in (value or "").split(","):
+        if part.strip() == "":
+            continue
+
+        service, _, rate = part.partition("=")
+
+        try:
+            rates[service.strip()] = float(rate)
+        except ValueError:
+            raise AbortError(f"Invalid API rate {part}, must be like ec2=20")
+
+        if rates[service.strip()] <= 0:
+            raise AbortError(f"Invalid API rate {part}, must be above 0")
+
+    return rates
+
+
+def get_client_config() -> "Config":
+    from botocore.config import Config
+
+    return Config(retries={"mode": "adaptive", "max_attempts": MAX_ATTEMPTS})
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def configure_rate_limiter(rates: Optional[Dict[str, float]] = None) -> RateLimiter:
+    global _rate_limiter
+
+    _rate_limiter = RateLimiter(rates)
+
+    return _rate_limiter
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+
+    return _rate_limiter
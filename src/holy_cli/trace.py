@@ -0,0 +1,248 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, TypeVar
+from urllib.parse import urlencode
+
+if TYPE_CHECKING:
+    from boto3 import Session
+
+F = TypeVar("F", bound=Callable)
+
+
+class ApiTracer:
+    """Records every AWS API call made through a traced boto3 session using botocore event hooks."""
+
+    def __init__(self, events_file: Optional[str] = None) -> None:
+        self.calls: Dict[str, List[dict]] = {}
+        self.lock = threading.Lock()
+        self.events_file: Optional[IO[str]] = (
+            open(events_file, "a") if events_file else None
+        )
+
+    def register(self, session: "Session") -> None:
+        # Must be called before any clients are created, they copy the session's handlers.
+        # Registered first so the call is timed even if another handler short-circuits it.
+        session.events.register_first("before-call.*.*", self._before_call)
+        session.events.register("after-call.*.*", self._after_call)
+        # Connection errors and timeouts raise instead of returning a response
+        session.events.register("after-call-error.*.*", self._after_call_error)
+
+    def summary(self) -> List[dict]:
+        results = []
+
+        with self.lock:
+            for key in sorted(self.calls.keys()):
+                calls = self.calls[key]
+                durations = sorted(call["duration_ms"] for call in calls)
+                p95_index = max(math.ceil(len(durations) * 0.95) - 1, 0)
+
+                results.append(
+                    {
+                        "Operation": key,
+                        "Calls": len(calls),
+                        "Total (ms)": round(sum(durations), 1),
+                        "p95 (ms)": round(durations[p95_index], 1),
+                        "Retries": sum(call["retries"] for call in calls),
+                        "Errors": sum(1 for call in calls if call["error_code"]),
+                        "Bytes": sum(
+                            call["request_bytes"] + call["response_bytes"]
+                            for call in calls
+                        ),
+                    }
+                )
+
+        return results
+
+    def close(self) -> None:
+        if self.events_file is not None:
+            self.events_file.close()
+            self.events_file = None
+
+    def _before_call(self, model, params, context, **kwargs) -> None:
+        body = params.get("body") or b""
+
+        # Query protocol services (EC2, IAM) have not encoded the body yet
+        if isinstance(body, dict):
+            body = urlencode(body, doseq=True)
+
+        context["holy_trace_start"] = time.perf_counter()
+        context["holy_trace_request_bytes"] = len(body)
+        context["holy_trace_operation"] = (
+            model.service_model.service_name,
+            model.name,
+        )
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs) -> None:
+        metadata = parsed.get("ResponseMetadata", {})
+
+        self._record(
+            context,
+            model.service_model.service_name,
+            model.name,
+            status=getattr(http_response, "status_code", None),
+            retries=metadata.get("RetryAttempts", 0),
+            error_code=parsed.get("Error", {}).get("Code"),
+            response_bytes=len(getattr(http_response, "content", None) or b""),
+        )
+
+    def _after_call_error(self, exception, context, **kwargs) -> None:
+        # The error event has no model, the operation was noted before the call
+        operation = context.get("holy_trace_operation")
+
+        if operation is None:
+            return
+
+        self._record(
+            context,
+            operation[0],
+            operation[1],
+            status=None,
+            retries=max(context.get("retries", {}).get("attempt", 1) - 1, 0),
+            error_code=type(exception).__name__,
+            response_bytes=0,
+        )
+
+    def _record(
+        self,
+        context: dict,
+        service: str,
+        operation: str,
+        status: Optional[int],
+        retries: int,
+        error_code: Optional[str],
+        response_bytes: int,
+    ) -> None:
+        start = context.get("holy_trace_start")
+
+        if start is None:
+            return
+
+        end = time.perf_counter()
+        event = {
+            "timestamp": time.time(),
+            "service": service,
+            "operation": operation,
+            "duration_ms": (end - start) * 1000,
+            "status": status,
+            "retries": retries,
+            "error_code": error_code,
+            "request_bytes": context.get("holy_trace_request_bytes", 0),
+            "response_bytes": response_bytes,
+        }
+        key = f"{service}:{operation}"
+
+        with self.lock:
+            self.calls.setdefault(key, []).append(event)
+
+            if self.events_file is not None:
+                self.events_file.write(json.dumps(event) + "\n")
+
+        # Show the call nested inside whichever phase span is running
+        span_tracer = get_span_tracer()
+
+        if span_tracer is not None:
+            span_tracer.add(key, "aws", start, end, event)
+
+
+class SpanTracer:
+    """Collects timed spans and writes them in Chrome trace event format (chrome://tracing or Perfetto)."""
+
+    def __init__(self) -> None:
+        self.events: List[dict] = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def span(self, name: str, category: str = "holy", **args) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.add(name, category, start, time.perf_counter(), args)
+
+    def add(
+        self, name: str, category: str, start: float, end: float, args: dict
+    ) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1_000_000,
+            "dur": (end - start) * 1_000_000,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path: str) -> None:
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_api_tracer: Optional[ApiTracer] = None
+
+
+def enable_api_tracing(events_file: Optional[str] = None) -> ApiTracer:
+    global _api_tracer
+
+    if _api_tracer is None:
+        _api_tracer = ApiTracer(events_file)
+
+    return _api_tracer
+
+
+def get_api_tracer() -> Optional[ApiTracer]:
+    return _api_tracer
+
+
+_span_tracer: Optional[SpanTracer] = None
+
+
+def enable_span_tracing() -> SpanTracer:
+    global _span_tracer
+
+    if _span_tracer is None:
+        _span_tracer = SpanTracer()
+
+    return _span_tracer
+
+
+def get_span_tracer() -> Optional[SpanTracer]:
+    return _span_tracer
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[None]:
+    """Time a block of work, this does nothing unless span tracing is enabled"""
+    if _span_tracer is None:
+        yield
+        return
+
+    with _span_tracer.span(name, **args):
+        yield
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator to time a whole function as a span"""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore
+
+    return decorator
@@ -0,0 +1,283 @@
+"""
+Background port-forward tunnels. Each server gets one supervisor process which keeps a
+single SSH connection open with all of its forwards, reconnecting with backoff when it drops.
+
+The supervisor is started as: python -m holy_cli.tunnel /path/to/state.json
+"""
+
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from holy_cli.config import Config, GlobalConfig
+from holy_cli.exceptions import AbortError
+
+FORWARD_PATTERN = re.compile(
+    r"^(?:([\w.\-*]+|\[[0-9a-fA-F:]+\]):)?(\d+):([\w.\-]+|\[[0-9a-fA-F:]+\]):(\d+)$"
+)
+
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+# Options placed before the shared SSH options, as the first value given takes precedence.
+# The tunnel has its own connection, as a client of another master it would hand the forwards
+# over and exit, and they would close along with that master.
+SUPERVISOR_SSH_OPTIONS = [
+    "-N",
+    "-T",
+    "-o",
+    "BatchMode=yes",
+    "-o",
+    "ControlMaster=no",
+    "-o",
+    "ControlPath=none",
+    "-o",
+    "ControlPersist=no",
+    "-o",
+    "ExitOnForwardFailure=yes",
+    "-o",
+    "ServerAliveInterval=15",
+    "-o",
+    "ServerAliveCountMax=3",
+]
+
+
+def parse_forward(spec: str) -> str:
+    """Validate a forward spec, a single port is shorthand for PORT:localhost:PORT"""
+    spec = spec.strip()
+
+    if spec.isdigit():
+        return f"{spec}:localhost:{spec}"
+
+    if FORWARD_PATTERN.match(spec) is None:
+        raise AbortError(
+            f"Invalid tunnel {spec}, must be in the format [bind_address:]port:host:hostport"
+        )
+
+    return spec
+
+
+class TunnelManager:
+    """Manages the tunnel supervisor processes, state is kept in ~/.holy/tunnels"""
+
+    def __init__(self, global_config: GlobalConfig) -> None:
+        if sys.platform == "win32":
+            raise AbortError("Tunnels are not supported on Windows")
+
+        self.tunnels_dir = global_config.tunnels_dir
+
+    def open(
+        self,
+        server_id: str,
+        name: str,
+        ssh_cmd: List[str],
+        forwards: List[str],
+        region: Optional[str] = None,
+        profile: Optional[str] = None,
+    ) -> dict:
+        state = self.get(server_id) or {"forwards": []}
+        state["server_id"] = server_id
+        state["name"] = name
+        state["ssh_cmd"] = ssh_cmd
+
+        # Used by the supervisor to look up the server's IP again, it changes on stop and start
+        state["region"] = region
+        state["profile"] = profile
+
+        for forward in forwards:
+            if forward not in state["forwards"]:
+                state["forwards"].append(forward)
+
+        self._write_state(server_id, state)
+
+        # A running supervisor picks up the changes from the state file
+        if self._is_running(state.get("pid")):
+            return state
+
+        with open(self._get_path(server_id, "log"), "a") as log_file:
+            process = subprocess.Popen(
+                [sys.executable, "-m", "holy_cli.tunnel", self._get_path(server_id)],
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=log_file,
+                start_new_session=True,
+            )
+
+        state["pid"] = process.pid
+        self._write_state(server_id, state)
+
+        return state
+
+    def list(self) -> List[dict]:
+        results = []
+
+        for file_name in sorted(os.listdir(self.tunnels_dir)):
+            if not file_name.endswith(".json"):
+                continue
+
+            state = self.get(file_name[:-5])
+
+            if state is not None:
+                state["running"] = self._is_running(state.get("pid"))
+                results.append(state)
+
+        return results
+
+    def get(self, server_id: str) -> Optional[dict]:
+        return load_state(self._get_path(server_id))
+
+    def close(self, server_id: str) -> bool:
+        state = self.get(server_id)
+
+        if state is None:
+            return False
+
+        os.remove(self._get_path(server_id))
+
+        # The supervisor leads its own process group, so this stops the SSH connection too
+        if self._is_running(state.get("pid")):
+            os.killpg(state["pid"], signal.SIGTERM)
+
+        return True
+
+    def _is_running(self, pid: Optional[int]) -> bool:
+        if pid is None:
+            return False
+
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+
+        return True
+
+    def _write_state(self, server_id: str, state: dict) -> None:
+        write_state(self._get_path(server_id), state)
+
+    def _get_path(self, server_id: str, extension: str = "json") -> str:
+        return os.path.join(self.tunnels_dir, f"{server_id}.{extension}")
+
+
+def load_state(path: str) -> Optional[dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_state(path: str, state: dict) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+
+    os.replace(tmp_path, path)
+
+
+def lookup_host(state: dict) -> Optional[str]:
+    """The server's current public IP, or None if it is not running or can't be looked up"""
+    from holy_cli.cloud.aws.instance import InstanceWrapper
+
+    try:
+        config = Config(GlobalConfig(), state.get("region"), state.get("profile"))
+        instance = InstanceWrapper(config).get_by_id(state["server_id"])
+    except Exception as err:
+        print(f"Could not look up the server: {err}", flush=True)
+        return None
+
+    if instance.state["Name"] != "running":
+        return None
+
+    return instance.public_ip_address
+
+
+def refresh_host(state_path: str, state: dict) -> None:
+    """Points the tunnel at the server's current IP, in case it was stopped and started"""
+    if "server_id" not in state:
+        return
+
+    host = lookup_host(state)
+    user, _, current = state["ssh_cmd"][-1].rpartition("@")
+
+    if host is None or host == current:
+        return
+
+    # Read again so as not to overwrite forwards added in the meantime
+    latest = load_state(state_path)
+
+    if latest is None:
+        return
+
+    latest["ssh_cmd"][-1] = f"{user}@{host}"
+    write_state(state_path, latest)
+    print(f"Server IP changed to {host}", flush=True)
+
+
+def build_ssh_cmd(state: dict) -> List[str]:
+    ssh_cmd = state["ssh_cmd"]
+    forwards = [arg for forward in state["forwards"] for arg in ("-L", forward)]
+
+    return ssh_cmd[:1] + SUPERVISOR_SSH_OPTIONS + forwards + ssh_cmd[1:]
+
+
+def supervise(state_path: str) -> None:
+    delay = RECONNECT_MIN_DELAY
+    process: Optional[subprocess.Popen] = None
+
+    def stop(*args) -> None:
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+
+    while True:
+        state = load_state(state_path)
+
+        # The state file is removed when the tunnel is closed
+        if state is None:
+            stop()
+
+        cmd = build_ssh_cmd(state)  # type: ignore
+        print(f"Connecting: {' '.join(cmd)}", flush=True)
+        started = time.monotonic()
+        changed = False
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+
+        # Restart straight away if the tunnel settings change, otherwise wait for SSH to exit
+        while process.poll() is None:
+            time.sleep(1)
+            latest = load_state(state_path)
+
+            if latest is None or build_ssh_cmd(latest) != cmd:
+                print("Tunnel settings changed, reconnecting", flush=True)
+                process.terminate()
+                process.wait()
+                changed = True
+                break
+
+        if changed:
+            continue
+
+        # A connection that stayed up for a while resets the backoff
+        if time.monotonic() - started > RECONNECT_MAX_DELAY:
+            delay = RECONNECT_MIN_DELAY
+
+        print(
+            f"SSH exited with code {process.returncode}, reconnecting in {delay}s",
+            flush=True,
+        )
+        time.sleep(delay)
+        delay = min(delay * 2, RECONNECT_MAX_DELAY)
+        refresh_host(state_path, state)  # type: ignore
+
+
+if __name__ == "__main__":
+    supervise(sys.argv[1])
@@ -1,3 +1,15 @@
-from .hash import hash_server_name
+from .cache import InstanceTypeCache, NameCache, PlacementCache
+from .console import ConsoleTail, is_boot_finished
+from .hash import hash_server_name, short_hash
+from .journal import ProvisioningJournal
 from .names import get_random_name
+from .ports import (
+    PortRange,
+    format_port_range,
+    merge_port_ranges,
+    parse_port_ranges,
+    subtract_port_ranges,
+)
+from .stats import format_bytes, parse_duration, sparkline
+from .sync import SyncManifest
 from .version_check import version_up_to_date
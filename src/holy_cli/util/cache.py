@@ -0,0 +1,171 @@
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class JSONCache:
+    """A small JSON file of values kept per AWS profile and region"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data: Dict[str, dict] = self._load()
+
+    def _get_key(self, profile: Optional[str], region: Optional[str]) -> str:
+        # Keyed by the options given, an empty value means the AWS default
+        return f"{profile or ''}:{region or ''}"
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f)
+
+        os.replace(tmp_path, self.path)
+
+
+class NameCache(JSONCache):
+    """
+    Server names seen per AWS profile and region, kept up to date as a side effect of
+    list, create and delete so that shell completion never needs to call AWS
+    """
+
+    def get_names(self, profile: Optional[str], region: Optional[str]) -> List[str]:
+        entry = self.data.get("names", {}).get(self._get_key(profile, region))
+
+        if entry is None:
+            return []
+
+        return entry["names"]
+
+    def get_all_names(self) -> List[str]:
+        names = set()
+
+        for entry in self.data.get("names", {}).values():
+            names.update(entry["names"])
+
+        return sorted(names)
+
+    def set_names(
+        self, profile: Optional[str], region: Optional[str], names: Iterable[str]
+    ) -> None:
+        self._update(profile, region, set(names))
+
+    def add(self, profile: Optional[str], region: Optional[str], name: str) -> None:
+        self._update(profile, region, set(self.get_names(profile, region)) | {name})
+
+    def remove(self, profile: Optional[str], region: Optional[str], name: str) -> None:
+        self._update(profile, region, set(self.get_names(profile, region)) - {name})
+
+    def get_regions(self) -> List[str]:
+        return self.data.get("regions", [])
+
+    def set_regions(self, regions: Iterable[str]) -> None:
+        self.data["regions"] = sorted(regions)
+        self._save()
+
+    def _update(
+        self, profile: Optional[str], region: Optional[str], names: set
+    ) -> None:
+        key = self._get_key(profile, region)
+        entry = self.data.setdefault("names", {}).get(key)
+
+        if entry is not None and set(entry["names"]) == names:
+            return
+
+        self.data["names"][key] = {"names": sorted(names), "updated": time.time()}
+        self._save()
+
+
+class PlacementCache(JSONCache):
+    """The availability zone a server was last launched in, tried first next time"""
+
+    def get_zone(self, profile: Optional[str], region: Optional[str]) -> Optional[str]:
+        return self.data.get("zones", {}).get(self._get_key(profile, region))
+
+    def set_zone(
+        self, profile: Optional[str], region: Optional[str], zone: str
+    ) -> None:
+        if self.get_zone(profile, region) == zone:
+            return
+
+        self.data.setdefault("zones", {})[self._get_key(profile, region)] = zone
+        self._save()
+
+
+class InstanceTypeCache(JSONCache):
+    """
+    The instance types and vCPU quotas of each AWS profile and region. Both rarely change
+    so they are fetched again only once older than their TTL (in seconds).
+    """
+
+    def get_types(
+        self, profile: Optional[str], region: Optional[str], ttl: float
+    ) -> Optional[Dict[str, dict]]:
+        entry = self.data.get("types", {}).get(self._get_key(profile, region))
+
+        if entry is None or time.time() - entry["updated"] > ttl:
+            return None
+
+        return entry["types"]
+
+    def get_all_type_names(self) -> List[str]:
+        names = set()
+
+        for entry in self.data.get("types", {}).values():
+            names.update(entry["types"])
+
+        return sorted(names)
+
+    def set_types(
+        self, profile: Optional[str], region: Optional[str], types: Dict[str, dict]
+    ) -> None:
+        self.data.setdefault("types", {})[self._get_key(profile, region)] = {
+            "types": types,
+            "updated": time.time(),
+        }
+        self._save()
+
+    def get_quota(
+        self,
+        profile: Optional[str],
+        region: Optional[str],
+        quota_code: str,
+        ttl: float,
+        unreadable_ttl: float,
+    ) -> Tuple[bool, Optional[float]]:
+        """Returns whether a fresh value is cached, and the value (None if it couldn't be read)"""
+        key = f"{self._get_key(profile, region)}:{quota_code}"
+        entry = self.data.get("quotas", {}).get(key)
+
+        if entry is None:
+            return False, None
+
+        if entry["value"] is None:
+            ttl = unreadable_ttl
+
+        if time.time() - entry["updated"] > ttl:
+            return False, None
+
+        return True, entry["value"]
+
+    def set_quota(
+        self,
+        profile: Optional[str],
+        region: Optional[str],
+        quota_code: str,
+        value: Optional[float],
+    ) -> None:
+        key = f"{self._get_key(profile, region)}:{quota_code}"
+        self.data.setdefault("quotas", {})[key] = {
+            "value": value,
+            "updated": time.time(),
+        }
+        self._save()
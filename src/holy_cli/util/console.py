@@ -0,0 +1,46 @@
+import re
+
+# Printed by cloud-init once every boot stage, including user-data scripts, has run
+BOOT_FINISHED_PATTERN = re.compile(r"Cloud-init v\. \S+ finished at")
+
+# How much of the start of each output is used to find it within the last output
+OVERLAP_SIZE = 256
+
+
+class ConsoleTail:
+    """
+    EC2 only returns the most recent console output (up to 64KB), so each poll overlaps the last.
+    Works out which part of each poll has not been seen yet.
+    """
+
+    def __init__(self) -> None:
+        self.previous = ""
+
+    def feed(self, output: str) -> str:
+        # Early in boot and now and then there is no output at all, which says nothing new
+        if output == "":
+            return ""
+
+        previous = self.previous
+        self.previous = output
+
+        if output.startswith(previous):
+            return output[len(previous) :]
+
+        # The start has scrolled out of the buffer, find where the new output begins in the last
+        head = output[:OVERLAP_SIZE]
+        index = previous.rfind(head)
+
+        while index != -1:
+            overlap = previous[index:]
+
+            if output.startswith(overlap):
+                return output[len(overlap) :]
+
+            index = previous.rfind(head, 0, index + len(head) - 1)
+
+        return output
+
+
+def is_boot_finished(output: str) -> bool:
+    return BOOT_FINISHED_PATTERN.search(output) is not None
@@ -1,5 +1,10 @@
 import hashlib
 
 
+def short_hash(value: str) -> str:
+    """A short stable hash, for naming things after their contents"""
+    return hashlib.md5(value.encode("utf-8")).hexdigest()[0:16]
+
+
 def hash_server_name(name: str) -> str:
-    return hashlib.md5(name.encode("utf-8")).hexdigest()[0:16]
+    return short_hash(name)
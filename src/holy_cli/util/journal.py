@@ -0,0 +1,66 @@
+import json
+import os
+import uuid
+from typing import Optional
+
+
+class ProvisioningJournal:
+    """
+    Records each resource created for a new server as soon as it exists, so an interrupted
+    create can be resumed from the last completed step or rolled back without leaving orphans
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.data: dict = self._load()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def start(self, options: dict) -> None:
+        # Sent with RunInstances so a launch whose response was lost can be found, not repeated
+        self.data = {"options": options, "steps": {}, "client_token": uuid.uuid4().hex}
+        self._save()
+
+    def get_options(self) -> Optional[dict]:
+        return self.data.get("options")
+
+    def get_client_token(self) -> str:
+        # Journals written before tokens were added get one on resume
+        if "client_token" not in self.data:
+            self.data["client_token"] = uuid.uuid4().hex
+            self._save()
+
+        return self.data["client_token"]
+
+    def get(self, step: str) -> Optional[dict]:
+        return self.data.get("steps", {}).get(step)
+
+    def record(self, step: str, **values) -> None:
+        self.data.setdefault("steps", {})[step] = values
+        self._save()
+
+    def remove(self, step: str) -> None:
+        if self.data.get("steps", {}).pop(step, None) is not None:
+            self._save()
+
+    def delete(self) -> None:
+        self.data = {}
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f)
+
+        os.replace(tmp_path, self.path)
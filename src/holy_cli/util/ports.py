@@ -0,0 +1,72 @@
+from typing import List, Optional, Tuple
+
+from holy_cli.exceptions import AbortError
+
+# An inclusive range of ports, a single port has the same start and end
+PortRange = Tuple[int, int]
+
+
+def parse_port_ranges(value: Optional[str]) -> List[PortRange]:
+    """Parse a comma seperated list of ports and ranges, e.g. 80,443,8000-8100"""
+    ranges: List[PortRange] = []
+
+    if not value:
+        return ranges
+
+    for part in value.split(","):
+        part = part.strip()
+
+        if part == "":
+            continue
+
+        start, _, end = part.partition("-")
+
+        try:
+            port_range = (int(start), int(end or start))
+        except ValueError:
+            raise AbortError(f"Invalid port {part}, must be a number or range (80-90)")
+
+        if not (0 <= port_range[0] <= port_range[1] <= 65535):
+            raise AbortError(f"Invalid port range {part}")
+
+        if port_range not in ranges:
+            ranges.append(port_range)
+
+    return sorted(ranges)
+
+
+def subtract_port_ranges(
+    port_range: PortRange, ranges: List[PortRange]
+) -> List[PortRange]:
+    """The parts of a range not covered by any of the ranges, e.g. 20-30 without 22 is 20-21 and 23-30"""
+    remaining = [port_range]
+
+    for start, end in ranges:
+        remaining = [
+            part
+            for low, high in remaining
+            for part in ((low, min(high, start - 1)), (max(low, end + 1), high))
+            if part[0] <= part[1]
+        ]
+
+    return remaining
+
+
+def merge_port_ranges(ranges: List[PortRange]) -> List[PortRange]:
+    """Sorted ranges with overlapping and touching ones joined, e.g. 80-90 and 85-95 is 80-95"""
+    merged: List[PortRange] = []
+
+    for start, end in sorted(ranges):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def format_port_range(port_range: PortRange) -> str:
+    if port_range[0] == port_range[1]:
+        return str(port_range[0])
+
+    return f"{port_range[0]}-{port_range[1]}"
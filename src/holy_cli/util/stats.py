@@ -0,0 +1,49 @@
+from typing import List, Sequence
+
+from holy_cli.exceptions import AbortError
+
+SPARKLINE_CHARACTERS = "▁▂▃▄▅▆▇█"
+
+DURATION_UNITS = {"m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_duration(value: str) -> int:
+    """Parse a duration in minutes, hours or days to seconds, e.g. 30m, 6h, 2d"""
+    value = value.strip().lower()
+
+    try:
+        seconds = int(value[:-1]) * DURATION_UNITS[value[-1:]]
+    except (KeyError, ValueError):
+        raise AbortError(f"Invalid duration {value}, must be like 30m, 6h or 2d")
+
+    if seconds <= 0:
+        raise AbortError(f"Invalid duration {value}, must be above 0")
+
+    return seconds
+
+
+def sparkline(values: Sequence[float], maximum: float = 0) -> str:
+    """Draw values as a line of block characters, scaled to the maximum (the largest value if not given)"""
+    maximum = max([maximum, *values])
+
+    if maximum <= 0:
+        return SPARKLINE_CHARACTERS[0] * len(values)
+
+    last = len(SPARKLINE_CHARACTERS) - 1
+
+    return "".join(
+        SPARKLINE_CHARACTERS[min(round(value / maximum * last), last)]
+        for value in values
+    )
+
+
+def format_bytes(value: float) -> str:
+    units: List[str] = ["B", "KB", "MB", "GB", "TB"]
+
+    for unit in units[:-1]:
+        if abs(value) < 1024:
+            return f"{value:.0f}{unit}" if unit == "B" else f"{value:.1f}{unit}"
+
+        value /= 1024
+
+    return f"{value:.1f}{units[-1]}"
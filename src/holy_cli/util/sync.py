@@ -0,0 +1,111 @@
+import fnmatch
+import hashlib
+import json
+import os
+from typing import Dict, List, Sequence, Tuple
+
+# Files are identified by (size, modified time ns, content hash)
+FileEntry = Tuple[int, int, str]
+
+
+class SyncManifest:
+    """Tracks the files last sent to a server so that only changes need to be sent again"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: Dict[str, FileEntry] = self._load()
+
+    def scan(
+        self, local_dir: str, excludes: Sequence[str] = ()
+    ) -> Tuple[Dict[str, FileEntry], List[str], List[str]]:
+        """Returns the current local files along with which have changed and which have been deleted"""
+        files: Dict[str, FileEntry] = {}
+        changed = []
+
+        for root, dirs, names in os.walk(local_dir):
+            rel_root = os.path.relpath(root, local_dir)
+            dirs[:] = [
+                dir
+                for dir in dirs
+                if not self._is_excluded(self._join(rel_root, dir), excludes)
+            ]
+
+            for name in names:
+                rel_path = self._join(rel_root, name)
+
+                if self._is_excluded(rel_path, excludes):
+                    continue
+
+                full_path = os.path.join(root, name)
+                previous = self.files.get(rel_path)
+
+                # A file removed since the directory was listed is left out, as if deleted
+                try:
+                    stat = os.lstat(full_path)
+
+                    # Only read the file when its size or modified time has changed
+                    if previous and (previous[0], previous[1]) == (
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                    ):
+                        files[rel_path] = previous
+                        continue
+
+                    entry = (stat.st_size, stat.st_mtime_ns, self._hash(full_path))
+                except FileNotFoundError:
+                    continue
+
+                files[rel_path] = entry
+
+                if previous is None or previous[2] != entry[2]:
+                    changed.append(rel_path)
+
+        deleted = [rel_path for rel_path in self.files if rel_path not in files]
+
+        return files, sorted(changed), sorted(deleted)
+
+    def save(self, files: Dict[str, FileEntry]) -> None:
+        self.files = files
+        tmp_path = f"{self.path}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump({"files": files}, f)
+
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> Dict[str, FileEntry]:
+        try:
+            with open(self.path, "r") as f:
+                return {
+                    rel_path: tuple(entry)  # type: ignore
+                    for rel_path, entry in json.load(f)["files"].items()
+                }
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _hash(self, path: str) -> str:
+        if os.path.islink(path):
+            return hashlib.sha1(os.readlink(path).encode("utf-8")).hexdigest()
+
+        digest = hashlib.sha1()
+
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _join(self, rel_root: str, name: str) -> str:
+        # Always use forward slashes as the paths are used on the server
+        if rel_root == ".":
+            return name
+
+        return f"{rel_root.replace(os.sep, '/')}/{name}"
+
+    def _is_excluded(self, rel_path: str, excludes: Sequence[str]) -> bool:
+        name = rel_path.rsplit("/", 1)[-1]
+
+        return any(
+            fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+            for pattern in excludes
+        )
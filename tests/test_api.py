@@ -0,0 +1,142 @@
+import pytest
+from fake_cloud import FakeClientError, FakeCloud, FakeProvider
+
+from holy_cli.api import AWSError, HolyClient, HolyError
+
+
+def load_client(cloud, tmp_path, monkeypatch, **kwargs):
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    return HolyClient("us-east-1", provider=FakeProvider(cloud), **kwargs)
+
+
+def test_create_list_and_delete(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    steps = []
+    client = load_client(cloud, tmp_path, monkeypatch, progress=steps.append)
+
+    server = client.create_server("my_server", ports="22,8000-8100")
+
+    assert server.name == "my_server"
+    assert server.state == "running"
+    assert server.open_ports == ["22", "8000-8100"]
+    assert server.hibernation is False
+    assert "Created key pair" in steps
+
+    servers = client.list_servers(state="running")
+
+    assert [server.name for server in servers] == ["my_server"]
+
+    client.delete_server("my_server")
+
+    assert cloud.key_pairs == {}
+
+
+def test_config_errors_are_plain_exceptions(tmp_path, monkeypatch):
+    home = tmp_path / "home"
+    home.write_text("not a directory")
+
+    with pytest.raises(HolyError, match="Could not create directory"):
+        load_client(FakeCloud(), home, monkeypatch)
+
+
+def test_errors_are_plain_exceptions(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    client = load_client(cloud, tmp_path, monkeypatch)
+
+    with pytest.raises(HolyError):
+        client.list_servers(state="sleeping")
+
+    with pytest.raises(HolyError) as err:
+        client.start_server("missing")
+
+    assert not isinstance(err.value, AWSError)
+
+
+def test_aws_errors_keep_their_code(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("my_server", state="stopped")
+    client = load_client(cloud, tmp_path, monkeypatch)
+
+    def start_instances(params):
+        raise FakeClientError("UnauthorizedOperation", "You are not authorized")
+
+    monkeypatch.setattr(cloud, "_ec2_StartInstances", start_instances)
+
+    with pytest.raises(AWSError, match="not authorized") as err:
+        client.start_server("my_server")
+
+    assert err.value.code == "UnauthorizedOperation"
+
+
+def test_get_server_has_plain_values(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    client = load_client(cloud, tmp_path, monkeypatch)
+
+    server = client.create_server("my_server", disk_size=20, iops=6000)
+
+    assert server.disk_size == 20
+    assert server.disk_type == "gp3"
+    assert server.disk_iops == 6000
+    assert server.disk_throughput == 125
+    assert server.os == "amazon-linux"
+    assert server.ssh_username == "ec2-user"
+
+
+def test_resume_create(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    client = load_client(cloud, tmp_path, monkeypatch)
+
+    def interrupt(*args):
+        raise KeyboardInterrupt()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client.actions.image, "find_image_choices", interrupt)
+
+        with pytest.raises(KeyboardInterrupt):
+            client.create_server("my_server", type="t3.micro", ports="22,3000")
+
+    server = client.resume_create("my_server")
+
+    assert server.state == "running"
+    assert server.type == "t3.micro"
+    assert server.open_ports == ["22", "3000"]
+
+    with pytest.raises(HolyError, match="No unfinished create"):
+        client.resume_create("my_server")
+
+
+def test_change_ports(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    client = load_client(cloud, tmp_path, monkeypatch)
+    client.create_server("my_server", ports="22")
+
+    opened, closed = client.change_ports("my_server", open="80,8000-8100", close="22")
+
+    assert opened == [(80, 80), (8000, 8100)]
+    assert closed == [(22, 22)]
+    assert client.get_server("my_server").open_ports == ["80", "8000-8100"]
+
+
+def test_run_command(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("web-1")
+    cloud.add_server("web-2")
+    cloud.add_server("db")
+    client = load_client(cloud, tmp_path, monkeypatch)
+    lines = []
+
+    def run_command(ssh, instance, key_file_path, username, command, output):
+        output(f"ran {command}")
+        return 0
+
+    monkeypatch.setattr(
+        "holy_cli.cloud.aws.actions.SSHWrapper.run_command", run_command
+    )
+
+    results = client.run_command(
+        ["web-*"], "uptime", output=lambda name, line: lines.append((name, line))
+    )
+
+    assert results == {"web-1": 0, "web-2": 0}
+    assert sorted(lines) == [("web-1", "ran uptime"), ("web-2", "ran uptime")]
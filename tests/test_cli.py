@@ -15,3 +15,10 @@ def test_server_cmd():
     runner = CliRunner()
     result = runner.invoke(cli, ["server"])
     assert result.exit_code == 0
+
+
+def test_server_exec_cmd_requires_command():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["server", "exec", "my_server"])
+    assert result.exit_code == 1
+    assert "Missing command to run" in result.output
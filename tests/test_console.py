@@ -0,0 +1,26 @@
+from holy_cli.util import ConsoleTail, is_boot_finished
+
+
+def test_console_tail_only_returns_new_output():
+    tail = ConsoleTail()
+
+    assert tail.feed("booting\n") == "booting\n"
+    assert tail.feed("booting\nstarting ssh\n") == "starting ssh\n"
+    assert tail.feed("booting\nstarting ssh\n") == ""
+
+    # An empty poll doesn't make the next one repeat everything
+    assert tail.feed("") == ""
+    assert tail.previous == "booting\nstarting ssh\n"
+    assert tail.feed("booting\nstarting ssh\nready\n") == "ready\n"
+
+    # The start of the buffer is dropped once it is full
+    lines = "".join(f"line {i}\n" for i in range(100))
+    tail.feed(lines)
+    assert tail.feed(lines[50:] + "running script\n") == "running script\n"
+
+
+def test_is_boot_finished():
+    assert is_boot_finished(
+        "Cloud-init v. 22.2.2 finished at Mon, 01 Jan 2024 00:00:00 +0000. Up 30.5 seconds"
+    )
+    assert not is_boot_finished("Cloud-init v. 22.2.2 running 'modules:final'")
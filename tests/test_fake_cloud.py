@@ -0,0 +1,641 @@
+import os
+import subprocess
+
+import pytest
+from fake_cloud import FakeClientError, FakeCloud, FakeProvider
+
+from holy_cli.cloud.aws.actions import AWSActions
+from holy_cli.cloud.options import CreateServerOptions, ListServersOptions, ServerDTO
+from holy_cli.config import Config, GlobalConfig
+from holy_cli.exceptions import AbortError
+from holy_cli.throttle import configure_rate_limiter
+from holy_cli.util import ProvisioningJournal, SyncManifest
+
+
+def load_actions(cloud, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    config = Config(GlobalConfig(), "us-east-1", None, FakeProvider(cloud))
+
+    return AWSActions(config)
+
+
+def make_options(**overrides):
+    options = dict(
+        name="my_server",
+        os="amazon-linux",
+        architecture="x86_64",
+        type="t2.micro",
+        disk_size=10,
+        ports="22",
+    )
+    options.update(overrides)
+
+    return CreateServerOptions.load_from_cli(**options)
+
+
+def test_create_and_delete_server(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    options = make_options()
+
+    instance = actions.create_server(options)
+    info = actions.get_server_info(ServerDTO("my_server"))
+
+    assert info["AWS ID"] == instance.id
+    assert info["State"] == "running"
+    assert info["Open Ports"] == "22"
+
+    actions.delete_server(ServerDTO("my_server"))
+
+    assert cloud.security_groups == {}
+    assert cloud.key_pairs == {}
+
+
+def test_list_servers_paginates(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+
+    for i in range(1500):
+        cloud.add_server(f"server-{i}")
+
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    assert len(actions.list_servers()) == 1500
+    assert cloud.calls["ec2:DescribeInstances"] == 2
+
+    options = ListServersOptions.load_from_cli(running=True, name="server-1??")
+    assert len(actions.list_servers(options)) == 100
+
+
+def test_change_ports_in_single_calls(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("my_server")
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    server = ServerDTO("my_server")
+
+    opened, closed = actions.change_ports(
+        server, [(22, 22), (80, 80), (8000, 8100)], [], "tcp", None
+    )
+    assert opened == [(22, 22), (80, 80), (8000, 8100)]
+
+    opened, closed = actions.change_ports(
+        server, [(80, 80), (443, 443)], [(8000, 9000)], "tcp", None
+    )
+    assert opened == [(443, 443)]
+    assert closed == [(8000, 8100)]
+    assert cloud.calls["ec2:AuthorizeSecurityGroupIngress"] == 2
+    assert cloud.calls["ec2:RevokeSecurityGroupIngress"] == 1
+    assert actions.get_server_info(server)["Open Ports"] == "22, 80, 443"
+
+    # Closing part of an open range leaves the rest of it open
+    actions.change_ports(server, [(3000, 3999)], [], "tcp", None)
+    opened, closed = actions.change_ports(server, [], [(3500, 3500)], "tcp", None)
+
+    assert opened == []
+    assert closed == [(3500, 3500)]
+    assert (
+        actions.get_server_info(server)["Open Ports"]
+        == "22, 80, 443, 3000-3499, 3501-3999"
+    )
+
+    # Overlapping ranges to close report each closed port once
+    opened, closed = actions.change_ports(
+        server, [], [(3000, 3100), (3050, 3200)], "tcp", None
+    )
+    assert closed == [(3000, 3200)]
+
+
+def test_shared_security_group(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    for name in ("server-1", "server-2"):
+        actions.create_server(make_options(name=name, ports="22,80", shared_sg=True))
+
+    assert len(cloud.security_groups) == 1
+    assert actions.get_server_info(ServerDTO("server-2"))["Open Ports"] == "22, 80"
+
+    assert actions.change_allowed_ips(["1.2.3.4"], ["0.0.0.0/0"]) == ["1.2.3.4/32"]
+    assert cloud.calls["ec2:ModifyManagedPrefixList"] == 1
+
+    actions.delete_server(ServerDTO("server-1"))
+    assert len(cloud.security_groups) == 1
+
+    actions.delete_server(ServerDTO("server-2"))
+    assert cloud.security_groups == {}
+
+    actions.teardown()
+    assert cloud.prefix_lists == {}
+
+
+def test_create_server_falls_back_to_zone_with_capacity(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.no_capacity.add(("us-east-1a", "c5.large"))
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    def create(name):
+        return actions.create_server(make_options(name=name, type="c5.large"))
+
+    assert create("server-1").placement["AvailabilityZone"] == "us-east-1b"
+    assert len(cloud.subnets) == 3
+    assert cloud.calls["ec2:CreateKeyPair"] == 1
+
+    # The zone that worked is tried first next time
+    assert create("server-2").placement["AvailabilityZone"] == "us-east-1b"
+    assert cloud.calls["ec2:RunInstances"] == 3
+
+
+def test_servers_with_same_actions_share_role(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    for name, server_actions in (
+        ("server-1", "s3:ListAllMyBuckets,logs:GetLogEvents"),
+        ("server-2", "logs:GetLogEvents, s3:ListAllMyBuckets"),
+    ):
+        actions.create_server(make_options(name=name, actions=server_actions))
+
+    assert cloud.calls["iam:CreateRole"] == 1
+    assert cloud.calls["ec2:AssociateIamInstanceProfile"] == 0
+
+    actions.delete_server(ServerDTO("server-1"))
+    assert len(cloud.roles) == 1
+
+    actions.delete_server(ServerDTO("server-2"))
+    assert cloud.roles == {}
+    assert cloud.instance_profiles == {}
+
+
+def test_create_reuses_half_created_role(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    def interrupted(**kwargs):
+        raise KeyboardInterrupt()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(actions.iam.iam, "create_instance_profile", interrupted)
+
+        with pytest.raises(KeyboardInterrupt):
+            actions.create_server(
+                make_options(name="server-1", actions="s3:ListAllMyBuckets")
+            )
+
+    assert len(cloud.roles) == 1
+    assert cloud.instance_profiles == {}
+
+    actions.create_server(make_options(name="server-2", actions="s3:ListAllMyBuckets"))
+    (profile,) = cloud.instance_profiles.values()
+    assert profile["Roles"] == list(cloud.roles)
+
+    # Interrupted after the profile was created, before it was given the role
+    profile["Roles"] = []
+    actions.resume_server(ServerDTO("server-1"))
+
+    assert profile["Roles"] == list(cloud.roles)
+    assert cloud.calls["iam:CreateRole"] == 3
+    assert cloud.calls["iam:CreateInstanceProfile"] == 2
+
+
+def test_create_recreates_role_deleted_by_another_server(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    actions.create_server(make_options(name="server-1", actions="s3:ListAllMyBuckets"))
+    get_or_create = actions.iam.get_or_create_instance_profile
+
+    # The only other server using the role is deleted just after it was picked up
+    def picked_up_then_deleted(server_actions):
+        result = get_or_create(server_actions)
+
+        if cloud.calls["ec2:TerminateInstances"] == 0:
+            actions.delete_server(ServerDTO("server-1"))
+
+        return result
+
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            actions.iam, "get_or_create_instance_profile", picked_up_then_deleted
+        )
+        actions.create_server(
+            make_options(name="server-2", actions="s3:ListAllMyBuckets")
+        )
+
+    assert cloud.calls["iam:CreateRole"] == 2
+    assert cloud.calls["ec2:RunInstances"] == 3
+    assert len(cloud.instance_profiles) == 1
+
+
+def test_create_recreates_shared_group_deleted_by_another_server(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    actions.create_server(make_options(name="server-1", shared_sg=True))
+    get_or_create = actions.security_group.get_or_create_shared
+
+    # The only other server using the group is deleted just after it was picked up
+    def picked_up_then_deleted(vpc_id, ports):
+        sg = get_or_create(vpc_id, ports)
+
+        if cloud.calls["ec2:TerminateInstances"] == 0:
+            actions.delete_server(ServerDTO("server-1"))
+
+        return sg
+
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            actions.security_group, "get_or_create_shared", picked_up_then_deleted
+        )
+        actions.create_server(make_options(name="server-2", shared_sg=True))
+
+    assert cloud.calls["ec2:CreateSecurityGroup"] == 2
+    assert cloud.calls["ec2:RunInstances"] == 3
+    assert len(cloud.security_groups) == 1
+    assert actions.get_server_info(ServerDTO("server-2"))["Open Ports"] == "22"
+
+
+def test_rate_limiter_counts_calls(tmp_path, monkeypatch):
+    limiter = configure_rate_limiter()
+    cloud = FakeCloud()
+    cloud.add_server("my_server")
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    actions.list_servers()
+
+    summary = {row["Service"]: row for row in limiter.summary()}
+    assert summary["ec2"]["Calls"] == cloud.calls["ec2:DescribeInstances"]
+    assert summary["ec2"]["Throttled"] == 0
+
+
+def test_resume_and_rollback_interrupted_create(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    options = make_options()
+
+    def interrupt(*args):
+        raise KeyboardInterrupt()
+
+    # Stop after the key pair is created
+    with monkeypatch.context() as patch:
+        patch.setattr(actions.image, "find_image_choices", interrupt)
+
+        with pytest.raises(KeyboardInterrupt):
+            actions.create_server(options)
+
+    with pytest.raises(AbortError):
+        actions.create_server(options)
+
+    actions.resume_server(ServerDTO("my_server"))
+    assert cloud.calls["ec2:CreateKeyPair"] == 1
+    assert len(cloud.instances) == 1
+
+    with pytest.raises(AbortError):
+        actions.rollback_server(ServerDTO("my_server"))
+
+    actions.delete_server(ServerDTO("my_server"))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(actions.image, "find_image_choices", interrupt)
+
+        with pytest.raises(KeyboardInterrupt):
+            actions.create_server(options)
+
+    actions.rollback_server(ServerDTO("my_server"))
+    assert cloud.key_pairs == {}
+    assert cloud.security_groups == {}
+
+
+def test_resume_and_rollback_resources_created_before_recording(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    def interrupt_after(wrapper):
+        create = wrapper.create
+
+        def created_then_interrupted(*args):
+            create(*args)
+            raise KeyboardInterrupt()
+
+        return created_then_interrupted
+
+    for name, wrapper in (
+        ("server-1", actions.key_pair),
+        ("server-2", actions.security_group),
+    ):
+        options = make_options(name=name)
+
+        # Ctrl-C after the create call returns, before the journal records it
+        with monkeypatch.context() as patch:
+            patch.setattr(wrapper, "create", interrupt_after(wrapper))
+
+            with pytest.raises(KeyboardInterrupt):
+                actions.create_server(options)
+
+        actions.resume_server(ServerDTO(name))
+        assert len(cloud.key_pairs) == 1
+        assert len(cloud.security_groups) == 1
+
+        actions.delete_server(ServerDTO(name))
+
+        with monkeypatch.context() as patch:
+            patch.setattr(wrapper, "create", interrupt_after(wrapper))
+
+            with pytest.raises(KeyboardInterrupt):
+                actions.create_server(options)
+
+        actions.rollback_server(ServerDTO(name))
+        assert cloud.key_pairs == {}
+        assert cloud.security_groups == {}
+
+    # Nothing is left behind to stop the name being used again
+    actions.create_server(make_options(name="server-1"))
+    assert len(cloud.key_pairs) == 1
+
+
+def test_resume_after_launch_response_was_lost(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    options = make_options()
+    record = ProvisioningJournal.record
+
+    def interrupt_instance(journal, step, **values):
+        if step == "instance":
+            raise KeyboardInterrupt()
+
+        record(journal, step, **values)
+
+    # RunInstances succeeds but the create stops before recording it
+    with monkeypatch.context() as patch:
+        patch.setattr(ProvisioningJournal, "record", interrupt_instance)
+
+        with pytest.raises(KeyboardInterrupt):
+            actions.create_server(options)
+
+    actions.resume_server(ServerDTO("my_server"))
+    assert cloud.calls["ec2:RunInstances"] == 1
+    assert len(cloud.instances) == 1
+
+    actions.delete_server(ServerDTO("my_server"))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ProvisioningJournal, "record", interrupt_instance)
+
+        with pytest.raises(KeyboardInterrupt):
+            actions.create_server(options)
+
+    actions.rollback_server(ServerDTO("my_server"))
+    assert all(
+        instance["State"]["Name"] == "terminated"
+        for instance in cloud.instances.values()
+    )
+
+
+def test_resume_with_invalid_saved_options():
+    with pytest.raises(AbortError, match="unknown colour; missing actions"):
+        CreateServerOptions.from_dict(
+            {"name": "my_server", "colour": "red", "disk_size": 8}
+        )
+
+
+def test_stream_console_output(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    instance = cloud.add_server("my_server")
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    output = []
+
+    cloud.console_output[instance["InstanceId"]] = "booting\n"
+    assert not actions.stream_console_output(
+        ServerDTO("my_server"), False, 0, output.append
+    )
+
+    cloud.console_output[
+        instance["InstanceId"]
+    ] += "Cloud-init v. 22.2.2 finished at Mon, 01 Jan 2024 00:00:00 +0000\n"
+    assert actions.stream_console_output(
+        ServerDTO("my_server"), True, 0, output.append, until_boot_finished=True
+    )
+    assert output[0] == "booting\n"
+
+
+def test_watch_servers_slows_down_when_nothing_changes(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("my_server")
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    waits = []
+    update_caches = actions._update_caches
+    updates = []
+
+    def record_update(*args):
+        updates.append(len(waits))
+        update_caches(*args)
+
+    monkeypatch.setattr(actions, "_update_caches", record_update)
+
+    def render(rows, wait):
+        waits.append(wait)
+
+        if len(waits) == 3:
+            cloud.add_server("other_server")
+
+        if len(waits) == 5:
+            raise KeyboardInterrupt()
+
+    with pytest.raises(KeyboardInterrupt):
+        actions.watch_servers(None, 2, 4, render)
+
+    assert waits == [2, 3, 4, 2, 3]
+    # Only the first listing and the one after the new server changed the caches
+    assert updates == [1, 4]
+
+
+def test_preflight_fails_before_creating_anything(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("big_server", instance_type="c5.4xlarge")
+    cloud.quotas["L-1216C47A"] = 20
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    def create(name, type, architecture="x86_64"):
+        return actions.create_server(
+            make_options(name=name, architecture=architecture, type=type)
+        )
+
+    with pytest.raises(AbortError, match="did you mean t2.micro"):
+        create("my_server", "t2.mcro")
+
+    with pytest.raises(AbortError, match="does not support x86_64"):
+        create("my_server", "t4g.micro")
+
+    with pytest.raises(AbortError, match="only 4 of the 20 vCPU quota"):
+        create("my_server", "c5.4xlarge")
+
+    assert len(cloud.key_pairs) == 1
+    assert cloud.calls["ec2:RunInstances"] == 0
+
+    create("my_server", "t2.micro")
+
+    # The catalog and quota are fetched once, then read from the cache
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    create("other_server", "t3.micro")
+
+    assert cloud.calls["ec2:DescribeInstanceTypes"] == 1
+    assert cloud.calls["service-quotas:GetServiceQuota"] == 1
+
+
+def test_quota_is_only_remembered_when_unreadable(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    error = "ThrottlingException"
+
+    def get_service_quota(params):
+        raise FakeClientError(error, "Rate exceeded")
+
+    monkeypatch.setattr(cloud, "_service_quotas_GetServiceQuota", get_service_quota)
+
+    for _ in range(2):
+        assert actions.instance_type.get_vcpu_quota("L-1216C47A") is None
+
+    assert cloud.calls["service-quotas:GetServiceQuota"] == 2
+
+    error = "AccessDeniedException"
+
+    for _ in range(2):
+        assert actions.instance_type.get_vcpu_quota("L-1216C47A") is None
+
+    assert cloud.calls["service-quotas:GetServiceQuota"] == 3
+
+    # Not a quota in this region, there is no default either
+    error = "NoSuchResourceException"
+
+    for _ in range(2):
+        assert actions.instance_type.get_vcpu_quota("L-7295265B") is None
+
+    assert cloud.calls["service-quotas:GetAWSDefaultServiceQuota"] == 1
+
+
+def test_server_stats_in_one_batch(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    busy = cloud.add_server("busy")
+    nitro = cloud.add_server("nitro", instance_type="t3.micro")
+    cloud.add_server("idle")
+    cloud.add_server("other")
+    cloud.metrics[(busy["InstanceId"], "CPUUtilization")] = [50.0, 100.0]
+    cloud.metrics[(busy["InstanceId"], "NetworkIn")] = [1024.0, 1024.0]
+    cloud.metrics[(nitro["InstanceId"], "EBSReadBytes")] = [2048.0]
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    # t2 instances are not built on Nitro, their disk use comes from the volume
+    volume_id = busy["BlockDeviceMappings"][0]["Ebs"]["VolumeId"]
+    cloud.metrics[(volume_id, "VolumeReadBytes")] = [512.0, 512.0]
+    cloud.metrics[(busy["InstanceId"], "EBSReadBytes")] = [4096.0]
+
+    results = actions.get_server_stats(["busy", "idle", "nitro"], 3600, 30)
+
+    assert [result["Name"] for result in results] == ["busy", "idle", "nitro"]
+    assert results[0]["CPU Avg"] == "75.0%"
+    assert results[0]["Network In"] == "2.0KB"
+    assert results[0]["Disk Read"] == "1.0KB"
+    assert results[1]["CPU Avg"] == "-"
+    assert results[1]["Network In"] == "-"
+    assert results[2]["Disk Read"] == "2.0KB"
+    assert cloud.calls["cloudwatch:GetMetricData"] == 1
+
+
+def test_create_with_gp3_disk_and_modify(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+
+    with pytest.raises(AbortError, match="must be set for io2"):
+        make_options(disk_size=20, disk_type="io2")
+
+    with pytest.raises(AbortError, match="between 125 and 1000"):
+        make_options(disk_size=20, iops=6000, throughput=1200)
+
+    # Small gp3 disks still get the baseline IOPS, but no more
+    make_options(disk_size=4, iops=3000)
+
+    with pytest.raises(AbortError, match="between 3000 and 3000"):
+        make_options(disk_size=4, iops=4000)
+
+    actions.create_server(make_options(disk_size=20, iops=6000, throughput=500))
+    info = actions.get_server_info(ServerDTO("my_server"))
+
+    assert info["Disk Type"] == "gp3"
+    assert info["Disk IOPS"] == "6000"
+    assert info["Disk Throughput"] == "500 MiB/s"
+
+    with pytest.raises(AbortError, match="can only be increased"):
+        actions.modify_disk(ServerDTO("my_server"), 10, None, None, None)
+
+    state = actions.modify_disk(ServerDTO("my_server"), 50, None, 8000, None)
+    info = actions.get_server_info(ServerDTO("my_server"))
+
+    assert state == "optimizing"
+    assert info["Disk Size"] == "50GB"
+    assert info["Disk IOPS"] == "8000"
+    assert info["Disk Throughput"] == "500 MiB/s"
+    assert cloud.calls["ec2:ModifyVolume"] == 1
+
+
+def test_sync_files_removed_before_sending(tmp_path, monkeypatch):
+    cloud = FakeCloud()
+    cloud.add_server("my_server")
+    actions = load_actions(cloud, tmp_path, monkeypatch)
+    server = ServerDTO("my_server")
+    _, key_file_path = actions.key_pair.get_name_and_path(server.id)
+    open(key_file_path, "w").close()
+
+    local_dir = tmp_path / "src"
+    local_dir.mkdir()
+    remote_dir = tmp_path / "remote"
+    (local_dir / "a.txt").write_text("a")
+    (local_dir / "saved.txt").write_text("saved")
+    (local_dir / "old.txt").write_text("old")
+    output = []
+
+    # Run the remote command here instead of over SSH
+    monkeypatch.setenv("SSH_AUTH_SOCK", "")
+    popen = subprocess.Popen
+    monkeypatch.setattr(
+        subprocess,
+        "Popen",
+        lambda cmd, **kwargs: popen(["sh", "-c", cmd[-1]], **kwargs),
+    )
+
+    def sync():
+        actions.sync_to_server(
+            server,
+            str(local_dir),
+            str(remote_dir),
+            None,
+            [],
+            False,
+            False,
+            0,
+            output.append,
+        )
+
+    sync()
+    assert sorted(os.listdir(remote_dir)) == ["a.txt", "old.txt", "saved.txt"]
+
+    # An editor saves over saved.txt through a temporary file that is gone by the time it is sent
+    (local_dir / "old.txt").unlink()
+    (local_dir / "saved.txt").write_text("changed")
+    (local_dir / "saved.txt.tmp").write_text("changed")
+    scan = SyncManifest.scan
+
+    def scan_then_remove(self, *args):
+        result = scan(self, *args)
+        (local_dir / "saved.txt").unlink()
+        (local_dir / "saved.txt.tmp").unlink()
+
+        return result
+
+    monkeypatch.setattr(SyncManifest, "scan", scan_then_remove)
+    sync()
+    monkeypatch.setattr(SyncManifest, "scan", scan)
+
+    assert output[-1].startswith("Synced 0 changed and 1 deleted files")
+    assert sorted(os.listdir(remote_dir)) == ["a.txt", "saved.txt"]
+    assert (remote_dir / "saved.txt").read_text() == "saved"
+
+    # The server still has the old saved.txt, so it is now deleted there too
+    sync()
+    assert output[-1].startswith("Synced 0 changed and 1 deleted files")
+    assert os.listdir(remote_dir) == ["a.txt"]
@@ -0,0 +1,15 @@
+from holy_cli.util import NameCache
+
+
+def test_names_are_kept_per_profile_and_region(tmp_path):
+    path = str(tmp_path / "names.json")
+
+    name_cache = NameCache(path)
+    name_cache.set_names(None, None, ["web", "db"])
+    name_cache.add(None, "eu-west-1", "euro")
+    name_cache.remove(None, None, "db")
+
+    name_cache = NameCache(path)
+    assert name_cache.get_names(None, None) == ["web"]
+    assert name_cache.get_names(None, "eu-west-1") == ["euro"]
+    assert name_cache.get_all_names() == ["euro", "web"]
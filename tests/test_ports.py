@@ -0,0 +1,36 @@
+import pytest
+
+from holy_cli.exceptions import AbortError
+from holy_cli.util import (
+    format_port_range,
+    merge_port_ranges,
+    parse_port_ranges,
+    subtract_port_ranges,
+)
+
+
+def test_parse_port_ranges():
+    assert parse_port_ranges("443, 80,8000-8100,80") == [
+        (80, 80),
+        (443, 443),
+        (8000, 8100),
+    ]
+    assert parse_port_ranges(None) == []
+    assert format_port_range((8000, 8100)) == "8000-8100"
+
+    for value in ("http", "90-80", "70000"):
+        with pytest.raises(AbortError):
+            parse_port_ranges(value)
+
+
+def test_subtract_port_ranges():
+    assert subtract_port_ranges((20, 30), [(22, 22)]) == [(20, 21), (23, 30)]
+    assert subtract_port_ranges((20, 30), [(25, 40), (10, 20)]) == [(21, 24)]
+    assert subtract_port_ranges((20, 30), [(40, 50)]) == [(20, 30)]
+    assert subtract_port_ranges((20, 30), [(0, 100)]) == []
+
+
+def test_merge_port_ranges():
+    assert merge_port_ranges([(85, 95), (80, 90), (96, 100)]) == [(80, 100)]
+    assert merge_port_ranges([(80, 80), (80, 80), (443, 443)]) == [(80, 80), (443, 443)]
+    assert merge_port_ranges([]) == []
@@ -0,0 +1,31 @@
+import os
+
+from holy_cli.cloud.aws.ssh import SSHConfigFile
+from holy_cli.config import GlobalConfig
+
+
+def test_save_and_refresh(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    global_config = GlobalConfig()
+
+    ssh_config = SSHConfigFile(global_config)
+    ssh_config.save("abc", "my_server", "ubuntu", "1.2.3.4", "/keys/holy-kp-abc.pem")
+    ssh_config.save("abc", "my_server", "ubuntu", "1.2.3.4", "/keys/holy-kp-abc.pem")
+
+    with open(os.path.join(tmp_path, ".ssh", "config")) as f:
+        assert f.read().count(f"Include {global_config.ssh_config_file}") == 1
+
+    ssh_config = SSHConfigFile(global_config)
+    ssh_config.refresh({"abc": "5.6.7.8", "unknown": "9.9.9.9"})
+
+    with open(global_config.ssh_config_file) as f:
+        contents = f.read()
+
+    assert contents.count("Host my_server") == 1
+    assert "HostName 5.6.7.8" in contents
+    assert "9.9.9.9" not in contents
+
+    ssh_config.remove("abc")
+
+    with open(global_config.ssh_config_file) as f:
+        assert "Host my_server" not in f.read()
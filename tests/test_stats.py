@@ -0,0 +1,35 @@
+import pytest
+
+from holy_cli.cloud.aws.metrics import get_period
+from holy_cli.exceptions import AbortError
+from holy_cli.util import format_bytes, parse_duration, sparkline
+
+
+def test_parse_duration():
+    assert parse_duration("30m") == 1800
+    assert parse_duration("6h") == 21600
+    assert parse_duration("2D") == 172800
+
+    with pytest.raises(AbortError):
+        parse_duration("6")
+
+    with pytest.raises(AbortError):
+        parse_duration("0h")
+
+
+def test_sparkline_and_format_bytes():
+    assert sparkline([0, 50, 100], 100) == "▁▅█"
+    assert sparkline([0, 0]) == "▁▁"
+    assert format_bytes(512) == "512B"
+    assert format_bytes(1536) == "1.5KB"
+
+
+def test_metric_period():
+    day = 24 * 60 * 60
+
+    assert get_period(3600, 30) == 300
+    assert get_period(2 * day, 30) == 5760
+    # Data older than 15 days is only kept for every 5 minutes, older than 63 days every hour
+    assert get_period(20 * day, 30) == 57600
+    assert get_period(16 * day, 7) == 197700
+    assert get_period(90 * day, 7) == 1112400
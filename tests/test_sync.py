@@ -0,0 +1,46 @@
+import os
+
+from holy_cli.util import SyncManifest
+
+
+def test_manifest_scan(tmp_path):
+    local_dir = tmp_path / "src"
+    (local_dir / "sub").mkdir(parents=True)
+    (local_dir / "a.txt").write_text("a")
+    (local_dir / "sub" / "b.txt").write_text("b")
+    (local_dir / "ignored.pyc").write_text("c")
+
+    manifest = SyncManifest(str(tmp_path / "manifest.json"))
+    files, changed, deleted = manifest.scan(str(local_dir), ["*.pyc"])
+    assert changed == ["a.txt", "sub/b.txt"]
+    assert deleted == []
+
+    manifest.save(files)
+    (local_dir / "a.txt").unlink()
+    (local_dir / "sub" / "b.txt").write_text("changed")
+
+    manifest = SyncManifest(str(tmp_path / "manifest.json"))
+    files, changed, deleted = manifest.scan(str(local_dir), ["*.pyc"])
+    assert changed == ["sub/b.txt"]
+    assert deleted == ["a.txt"]
+
+
+def test_manifest_scan_skips_files_removed_while_scanning(tmp_path, monkeypatch):
+    local_dir = tmp_path / "src"
+    local_dir.mkdir()
+    (local_dir / "a.txt").write_text("a")
+    (local_dir / "gone.txt").write_text("b")
+    lstat = os.lstat
+
+    def removed_after_listing(path):
+        if path.endswith("gone.txt"):
+            raise FileNotFoundError(path)
+
+        return lstat(path)
+
+    monkeypatch.setattr(os, "lstat", removed_after_listing)
+    manifest = SyncManifest(str(tmp_path / "manifest.json"))
+    files, changed, deleted = manifest.scan(str(local_dir))
+
+    assert list(files) == ["a.txt"]
+    assert changed == ["a.txt"]
@@ -0,0 +1,21 @@
+import pytest
+
+from holy_cli.exceptions import AbortError
+from holy_cli.throttle import TokenBucket, parse_rates
+
+
+def test_token_bucket_waits_once_burst_is_used():
+    bucket = TokenBucket(rate=100, burst=2)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() > 0
+
+
+def test_parse_rates():
+    assert parse_rates("ec2=50, iam=5") == {"ec2": 50.0, "iam": 5.0}
+    assert parse_rates(None) == {}
+
+    for value in ("ec2", "ec2=0"):
+        with pytest.raises(AbortError):
+            parse_rates(value)
@@ -0,0 +1,52 @@
+import pytest
+from boto3 import Session
+from botocore.config import Config
+from botocore.exceptions import EndpointConnectionError
+from botocore.stub import Stubber
+
+from holy_cli.trace import ApiTracer
+
+
+def test_api_tracer_counts_calls():
+    api_tracer = ApiTracer()
+    session = Session(region_name="us-east-1")
+    api_tracer.register(session)
+
+    client = session.client("ec2")
+    stubber = Stubber(client)
+    stubber.add_response("describe_instances", {"Reservations": []})
+    stubber.add_response("describe_instances", {"Reservations": []})
+
+    with stubber:
+        client.describe_instances()
+        client.describe_instances()
+
+    summary = api_tracer.summary()
+    assert len(summary) == 1
+    assert summary[0]["Operation"] == "ec2:DescribeInstances"
+    assert summary[0]["Calls"] == 2
+
+
+def test_api_tracer_counts_connection_errors():
+    api_tracer = ApiTracer()
+    session = Session(
+        aws_access_key_id="testing",
+        aws_secret_access_key="testing",
+        region_name="us-east-1",
+    )
+    api_tracer.register(session)
+
+    # Nothing listens on the discard port, so the connection is refused
+    client = session.client(
+        "ec2",
+        endpoint_url="http://127.0.0.1:9",
+        config=Config(retries={"total_max_attempts": 1}),
+    )
+
+    with pytest.raises(EndpointConnectionError):
+        client.describe_instances()
+
+    summary = api_tracer.summary()
+    assert summary[0]["Operation"] == "ec2:DescribeInstances"
+    assert summary[0]["Calls"] == 1
+    assert summary[0]["Errors"] == 1
@@ -0,0 +1,33 @@
+from holy_cli import tunnel
+from holy_cli.tunnel import build_ssh_cmd, load_state, refresh_host, write_state
+
+
+def test_supervisor_uses_own_connection():
+    state = {
+        "ssh_cmd": ["ssh", "-o", "ControlMaster=auto", "ec2-user@1.2.3.4"],
+        "forwards": ["5432:localhost:5432"],
+    }
+    cmd = build_ssh_cmd(state)
+
+    # The first value of an option wins, so these come before the shared options
+    assert cmd.index("ControlMaster=no") < cmd.index("ControlMaster=auto")
+    assert "ControlPath=none" in cmd
+    assert cmd[-1] == "ec2-user@1.2.3.4"
+
+
+def test_refresh_host_after_restart(tmp_path, monkeypatch):
+    path = str(tmp_path / "server.json")
+    state = {
+        "server_id": "server",
+        "ssh_cmd": ["ssh", "ec2-user@1.2.3.4"],
+        "forwards": ["80"],
+    }
+    write_state(path, state)
+
+    monkeypatch.setattr(tunnel, "lookup_host", lambda state: None)
+    refresh_host(path, state)
+    assert load_state(path)["ssh_cmd"][-1] == "ec2-user@1.2.3.4"
+
+    monkeypatch.setattr(tunnel, "lookup_host", lambda state: "5.6.7.8")
+    refresh_host(path, state)
+    assert load_state(path)["ssh_cmd"][-1] == "ec2-user@5.6.7.8"